@@ -1,12 +1,31 @@
 import json
+import time
 import streamlit as st
 from pathlib import Path
 
-from src.pipeline import run_pipeline
+from src.pipeline import warm_models
+from src.jobs import JobManager
+from src.incremental import IncrementalPipeline
 
 
 st.set_page_config(page_title="Physician Notetaker", layout="wide")
 
+
+@st.cache_resource(show_spinner="Loading models (first run only)...")
+def load_models() -> bool:
+    # models live in the shared registry, so this only runs once per server process
+    warm_models()
+    return True
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    return JobManager(max_workers=1)
+
+
+load_models()
+jobs = get_job_manager()
+
 st.title("🩺 Physician Notetaker — Medical NLP Demo")
 st.caption("Paste a transcript → get Structured Summary, SOAP Note, Keywords, Sentiment + Intent")
 
@@ -52,10 +71,33 @@ if run_btn:
         st.error("Transcript is empty. Paste or upload a transcript.")
         st.stop()
 
-    with st.spinner("Running pipeline..."):
-        results = run_pipeline(transcript_text)
+    previous = jobs.get(st.session_state.get("job_id"))
+    if previous is not None:
+        jobs.cancel(previous.job_id)
+
+    # keeps per-turn artifacts between runs, so re-running after an edit
+    # only recomputes the turns that changed
+    if "incremental" not in st.session_state:
+        st.session_state["incremental"] = IncrementalPipeline(sentiment_mode="cascade")
 
-    st.success("Done!")
+    st.session_state["job_id"] = jobs.submit(transcript_text, runner=st.session_state["incremental"].iter_run)
+
+job = jobs.get(st.session_state.get("job_id"))
+
+if job is not None:
+    if not job.finished:
+        if st.button("⏹️ Cancel"):
+            jobs.cancel(job.job_id)
+
+    if job.status == "done":
+        st.success(f"Done! (job {job.job_id}, {sum(job.timings.values()):.2f} s)")
+    elif job.status == "cancelled":
+        st.warning(f"Job {job.job_id} was cancelled. Showing the stages that finished.")
+    elif job.status == "failed":
+        st.error(f"Job {job.job_id} failed.")
+        st.code(job.error)
+    else:
+        st.info(f"Running pipeline (job {job.job_id})... {len(job.timings)} stage(s) finished.")
 
     # -----------------------------
     # Output Tabs
@@ -68,53 +110,52 @@ if run_btn:
         "🧠 Model Summary"
     ])
 
-    with tab1:
-        st.json(results["structured_summary"])
+    def render_stage(stage: str, file_name: str, payload_fn, show_fn=st.json):
+        if stage not in job.results:
+            if job.finished:
+                st.caption("Stage did not run.")
+            else:
+                st.caption("⏳ Waiting for this stage...")
+            return
+
+        st.caption(f"Finished in {job.timings[stage]:.2f} s")
+        show_fn(job.results[stage])
         st.download_button(
-            "Download medical_summary.json",
-            data=json.dumps(results["structured_summary"], indent=2),
-            file_name="medical_summary.json",
-            mime="application/json"
+            f"Download {file_name}",
+            data=json.dumps(payload_fn(job.results[stage]), indent=2),
+            file_name=file_name,
+            mime="application/json",
+            key=f"download-{stage}"
         )
 
+    with tab1:
+        render_stage("structured_summary", "medical_summary.json", lambda r: r)
+
     with tab2:
-        st.json(results["soap_note"])
-        st.download_button(
-            "Download soap_note.json",
-            data=json.dumps(results["soap_note"], indent=2),
-            file_name="soap_note.json",
-            mime="application/json"
-        )
+        render_stage("soap_note", "soap_note.json", lambda r: r)
 
     with tab3:
-        st.json(results["sentiment_intent"])
-        st.download_button(
-            "Download sentiment_intent.json",
-            data=json.dumps(results["sentiment_intent"], indent=2),
-            file_name="sentiment_intent.json",
-            mime="application/json"
-        )
+        render_stage("sentiment_intent", "sentiment_intent.json", lambda r: r)
 
     with tab4:
-        st.write(results["keywords"])
-        st.download_button(
-            "Download keywords.json",
-            data=json.dumps({"keywords": results["keywords"]}, indent=2),
-            file_name="keywords.json",
-            mime="application/json"
-        )
+        render_stage("keywords", "keywords.json", lambda r: {"keywords": r}, show_fn=st.write)
 
     with tab5:
-        st.json(results["model_summary"])
-        st.download_button(
-            "Download model_summary.json",
-            data=json.dumps(results["model_summary"], indent=2),
-            file_name="model_summary.json",
-            mime="application/json"
-        )
+        render_stage("model_summary", "model_summary.json", lambda r: r)
+
+    with st.expander("Stage timings"):
+        st.table([{"Stage": k, "Seconds": v} for k, v in job.timings.items()])
+        if job.status == "done" and "incremental" in st.session_state:
+            st.caption("Incremental re-run")
+            st.json(st.session_state["incremental"].last_report)
 
     # -----------------------------
     # Optional: show full results
     # -----------------------------
     with st.expander("Show full pipeline output (debug)"):
-        st.json(results)
+        st.json(job.results)
+
+    # poll until the background job is finished
+    if not job.finished:
+        time.sleep(0.5)
+        st.rerun()
@@ -0,0 +1,87 @@
+"""
+Cold start and steady-state latency of the NER and sentiment pipelines,
+eager vs compiled (src/compiled.py).
+
+    python compile_models.py                  # build the artifacts once
+    python -m benchmarks.bench_compiled --backend torchscript
+
+Cold start runs in a fresh interpreter per variant: load the pipeline and
+run the first inference. Steady state is the mean latency per call over
+the transcript's NER chunks, after warm-up.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from src.compiled import load_compiled_pipeline
+from src.ner import HF_BIOMED_NER_MODEL, split_text_into_chunks
+from src.preprocess import normalize_text
+from src.sentiment_intent import SENTIMENT_MODEL
+
+
+MODELS = {
+    "ner": ("ner", HF_BIOMED_NER_MODEL, {"aggregation_strategy": "simple"}),
+    "sentiment": ("sentiment-analysis", SENTIMENT_MODEL, {}),
+}
+
+COLD_START = """
+import json, sys, time
+start = time.perf_counter()
+from transformers import pipeline
+from src.compiled import load_compiled_pipeline
+task, model_name, kwargs, backend, text = json.loads(sys.argv[1])
+if backend == "eager":
+    pipe = pipeline(task, model=model_name, **kwargs)
+else:
+    pipe = load_compiled_pipeline(task, model_name, backend=backend, **kwargs)
+loaded = time.perf_counter()
+pipe(text)
+print(json.dumps({"load_s": loaded - start, "first_s": time.perf_counter() - loaded}))
+"""
+
+
+def cold_start(task, model_name, kwargs, backend, text):
+    out = subprocess.run([sys.executable, "-c", COLD_START, json.dumps([task, model_name, kwargs, backend, text])],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def steady_state(pipe, chunks, repeat):
+    for c in chunks:
+        pipe(c)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for c in chunks:
+            pipe(c)
+    return (time.perf_counter() - start) / (repeat * len(chunks)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="torchscript")
+    parser.add_argument("--input", default="data/sample_transcript.txt")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        chunks = split_text_into_chunks(normalize_text(f.read()), chunk_size=450)
+
+    from transformers import pipeline
+
+    for name, (task, model_name, kwargs) in MODELS.items():
+        print(f"\n{name} ({model_name})")
+        for variant in ["eager", args.backend]:
+            cold = cold_start(task, model_name, kwargs, variant, chunks[0])
+            if variant == "eager":
+                pipe = pipeline(task, model=model_name, **kwargs)
+            else:
+                pipe = load_compiled_pipeline(task, model_name, backend=variant, **kwargs)
+            ms = steady_state(pipe, chunks, args.repeat)
+            print(f"  {variant:<12} cold start {cold['load_s']:.2f} s load + {cold['first_s'] * 1000:.0f} ms first call, "
+                  f"steady state {ms:.1f} ms/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Duplicate-aware batch run vs plain run_batch on a synthetic export.
+
+    python -m benchmarks.bench_dedup --items 200 --exact 0.3 --near 0.2
+
+Base transcripts come from data/ (sample + annotated). "Unique" items mix
+the turns of two bases, exact duplicates re-send an earlier item (with
+whitespace changes), near duplicates edit one turn of an earlier item.
+Also times the fingerprint/LSH lookup on its own for --index-items
+transcripts, to show it stays flat as the index grows.
+"""
+import argparse
+import json
+import random
+import time
+
+from src.dedup import DedupBatchRunner, DuplicateIndex
+from src.evaluation import load_annotated
+from src.pipeline import run_batch
+from src.preprocess import split_turns
+
+EDITS = [
+    " Actually, it was a bit worse last week.",
+    " I also had a mild headache on Tuesday.",
+    " The doctor at the hospital gave me ibuprofen.",
+]
+
+
+def render(turns) -> str:
+    return "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+
+
+def synthetic_export(bases, n: int, exact: float, near: float, seed: int = 7):
+    rng = random.Random(seed)
+    base_turns = [[(t.speaker, t.text) for t in split_turns(b)] for b in bases]
+    items = []
+    for i in range(n):
+        roll = rng.random()
+        if items and roll < exact:
+            text = rng.choice(items).replace("\n", "\n\n")
+        elif items and roll < exact + near:
+            turns = [(t.speaker, t.text) for t in split_turns(rng.choice(items))]
+            j = rng.randrange(len(turns))
+            turns[j] = (turns[j][0], turns[j][1] + rng.choice(EDITS))
+            text = render(turns)
+        else:
+            a, b = rng.sample(base_turns, 2) if len(base_turns) > 1 else (base_turns[0], base_turns[0])
+            cut = rng.randint(1, max(1, len(a) - 1))
+            text = render(a[:cut] + b[rng.randint(0, len(b) - 1):] + [("Patient", f"My reference is {i}.")])
+        items.append(text)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--exact", type=float, default=0.3)
+    parser.add_argument("--near", type=float, default=0.2)
+    parser.add_argument("--index-items", type=int, default=20000)
+    parser.add_argument("--skip-baseline", action="store_true", help="don't run plain run_batch for comparison")
+    args = parser.parse_args()
+
+    with open("data/sample_transcript.txt", "r", encoding="utf-8") as f:
+        bases = [f.read()] + [enc["transcript"] for enc in load_annotated("data/annotated/encounters.jsonl")]
+    items = synthetic_export(bases, args.items, args.exact, args.near)
+
+    # warm the models so neither run pays the loads
+    list(run_batch(items[:1]))
+
+    report = {}
+    if not args.skip_baseline:
+        t0 = time.perf_counter()
+        for _ in run_batch(items):
+            pass
+        report["baseline_s"] = round(time.perf_counter() - t0, 3)
+
+    runner = DedupBatchRunner()
+    t0 = time.perf_counter()
+    for _ in runner.run(items):
+        pass
+    report["dedup_s"] = round(time.perf_counter() - t0, 3)
+    report["dedup"] = runner.report()
+
+    # lookup cost alone, on a growing index of distinct transcripts
+    index = DuplicateIndex()
+    rng = random.Random(11)
+    words = " ".join(bases).split()
+    window = max(1, args.index_items // 10)
+    lookup_ms, elapsed = {}, 0.0
+    for i in range(args.index_items):
+        text = "Patient: " + " ".join(rng.choice(words) for _ in range(300))
+        t0 = time.perf_counter()
+        fp = index.fingerprint(split_turns(text))
+        index.match(fp)
+        elapsed += time.perf_counter() - t0
+        index.add(i, fp)
+        if (i + 1) % window == 0:
+            lookup_ms[len(index)] = round(elapsed / window * 1000, 3)
+            elapsed = 0.0
+    report["lookup_ms_by_index_size"] = lookup_ms
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Work saved by sharing one ClinicalDocument across the pipeline stages.
+
+    python -m benchmarks.bench_document --repeat 200
+
+Runs the model-free stages (gazetteer NER, structured summary, lexicon
+sentiment, frequency keywords) on the sample transcript, once with each
+stage segmenting and lowercasing the text itself and once with a shared
+document, then prints the document's cache statistics.
+"""
+import argparse
+import json
+import time
+
+from src.document import ClinicalDocument
+from src.gazetteer import get_gazetteer
+from src.keywords import extract_keywords_frequency
+from src.pipeline import build_structured_medical_json, extract_entities
+from src.preprocess import group_by_speaker, split_turns
+from src.sentiment_intent import analyze_sentiment_and_intent
+
+
+def run_without_document(transcript: str):
+    turns = split_turns(transcript)
+    grouped = group_by_speaker(turns)
+    full_text = " ".join([t.text for t in turns])
+    patient_text = grouped.get("Patient", "")
+
+    ner_out = extract_entities(full_text, patient_text, ner_backend="gazetteer")
+    build_structured_medical_json(grouped, ner_out)
+    analyze_sentiment_and_intent(patient_text, mode="lexicon")
+    extract_keywords_frequency(full_text)
+
+
+def run_with_document(transcript: str) -> ClinicalDocument:
+    doc = ClinicalDocument.from_transcript(transcript)
+    patient_text = doc.grouped.get("Patient", "")
+
+    ner_out = extract_entities(doc.text, patient_text, ner_backend="gazetteer", document=doc)
+    build_structured_medical_json(doc.grouped, ner_out, document=doc)
+    analyze_sentiment_and_intent(patient_text, mode="lexicon", document=doc)
+    extract_keywords_frequency(doc.text, document=doc)
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="data/sample_transcript.txt")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        transcript = f.read()
+    get_gazetteer()
+
+    timings = {}
+    for name, fn in [("per-stage", run_without_document), ("shared document", run_with_document)]:
+        fn(transcript)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fn(transcript)
+        timings[name] = (time.perf_counter() - start) / args.repeat * 1000
+
+    for name, ms in timings.items():
+        print(f"{name + ':':<18}{ms:7.2f} ms per transcript (model-free stages)")
+    print("\ncache statistics for one transcript:")
+    print(json.dumps(run_with_document(transcript).stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
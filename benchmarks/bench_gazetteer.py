@@ -0,0 +1,74 @@
+"""
+Gazetteer load time and match throughput.
+
+    python -m benchmarks.bench_gazetteer --terms 50000
+
+The seed vocabulary is padded with synthetic multi-word terms to reach
+--terms entries, so the numbers reflect a production-sized term list.
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from src.gazetteer import Gazetteer, load_term_files
+from src.preprocess import normalize_text
+
+
+def synthetic_terms(n: int, seed: int = 13):
+    rng = random.Random(seed)
+    categories = ["Symptom", "Diagnosis", "Drug", "Procedure"]
+    for i in range(n):
+        words = [
+            "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+            for _ in range(rng.randint(1, 3))
+        ]
+        term = " ".join(words)
+        yield term, term.title(), categories[i % len(categories)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=50000)
+    parser.add_argument("--input", default="data/sample_transcript.txt")
+    parser.add_argument("--repeat", type=int, default=200, help="transcript copies to match")
+    args = parser.parse_args()
+
+    entries = load_term_files()
+    entries += list(synthetic_terms(max(args.terms - len(entries), 0)))
+
+    t0 = time.perf_counter()
+    gaz = Gazetteer.build(entries)
+    build_s = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.gaz")
+        gaz.save(path)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+
+        t0 = time.perf_counter()
+        loaded = Gazetteer.load(path)
+        load_s = time.perf_counter() - t0
+
+        with open(args.input, "r", encoding="utf-8") as f:
+            text = normalize_text(f.read())
+
+        t0 = time.perf_counter()
+        n_matches = 0
+        for _ in range(args.repeat):
+            n_matches += len(loaded.find(text))
+        match_s = time.perf_counter() - t0
+
+    chars = len(text) * args.repeat
+    print(f"entries:        {len(gaz)}")
+    print(f"build:          {build_s:.2f} s (once, cached on disk)")
+    print(f"index size:     {size_mb:.1f} MB")
+    print(f"load (mmap):    {load_s * 1000:.1f} ms")
+    print(f"match:          {args.repeat / match_s:.1f} transcripts/s, "
+          f"{chars / match_s / 1e6:.2f} M chars/s ({n_matches // args.repeat} matches per transcript)")
+
+
+if __name__ == "__main__":
+    main()
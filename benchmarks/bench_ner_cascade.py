@@ -0,0 +1,40 @@
+"""
+NER cascade vs always-transformer NER.
+
+    python -m benchmarks.bench_ner_cascade data/sample_transcript.txt data/annotated/encounters.jsonl
+
+Takes .txt transcripts and annotated .jsonl files. Reports the sentence
+escalation rate, entity and structured-summary agreement with the full
+transformer path and the latency of both.
+"""
+import argparse
+import json
+
+from src.evaluation import load_annotated
+from src.ner import get_biomed_ner, get_spacy_model, SPACY_MODEL
+from src.ner_cascade import evaluate_ner_cascade
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="*", default=["data/sample_transcript.txt"])
+    parser.add_argument("--spacy-model", default=SPACY_MODEL)
+    args = parser.parse_args()
+
+    transcripts = []
+    for path in args.inputs:
+        if path.endswith(".jsonl"):
+            transcripts += [enc["transcript"] for enc in load_annotated(path)]
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                transcripts.append(f.read())
+
+    # keep the model loads out of the timings
+    get_biomed_ner()
+    get_spacy_model(args.spacy_model)
+
+    print(json.dumps(evaluate_ner_cascade(transcripts, spacy_model=args.spacy_model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
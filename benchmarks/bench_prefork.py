@@ -0,0 +1,99 @@
+"""
+Pre-fork vs spawn: per-worker memory and throughput.
+
+    python -m benchmarks.bench_prefork --workers 4 --transcripts 32
+
+PSS (proportional set size) splits shared pages between the processes that
+map them, so it shows how much memory each worker really costs. Linux only.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from typing import Dict, List
+
+from src.pipeline import run_pipeline, warm_models
+from src.server import PreforkServer
+
+
+def read_memory_kb(pid: int) -> Dict[str, int]:
+    out = {"Rss": 0, "Pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key = line.split(":")[0]
+                if key in out:
+                    out[key] = int(line.split()[1])
+    except OSError:
+        pass
+    return out
+
+
+def _spawn_init() -> None:
+    import torch
+    torch.set_num_threads(1)
+    warm_models()
+
+
+def _spawn_run(transcript: str):
+    return run_pipeline(transcript)
+
+
+def summarize(mode: str, pids: List[int], n: int, seconds: float) -> None:
+    mem = [read_memory_kb(pid) for pid in pids]
+    rss = [m["Rss"] / 1024 for m in mem]
+    pss = [m["Pss"] / 1024 for m in mem]
+    print(f"\n[{mode}] {len(pids)} workers, {n} transcripts in {seconds:.1f} s "
+          f"({n / seconds:.2f} transcripts/s)")
+    print(f"  per-worker RSS MB: mean {sum(rss) / len(rss):.0f}, max {max(rss):.0f}")
+    print(f"  per-worker PSS MB: mean {sum(pss) / len(pss):.0f}, total {sum(pss):.0f}")
+
+
+def bench_prefork(transcripts: List[str], workers: int) -> None:
+    t0 = time.perf_counter()
+    with PreforkServer(workers=workers) as server:
+        startup = time.perf_counter() - t0
+        start = time.perf_counter()
+        for _ in server.map(transcripts):
+            pass
+        seconds = time.perf_counter() - start
+        parent = read_memory_kb(os.getpid())
+        print(f"\n[prefork] startup {startup:.1f} s, parent PSS {parent['Pss'] / 1024:.0f} MB")
+        summarize("prefork", server.worker_pids(), len(transcripts), seconds)
+
+
+def bench_spawn(transcripts: List[str], workers: int) -> None:
+    ctx = multiprocessing.get_context("spawn")
+    t0 = time.perf_counter()
+    with ctx.Pool(workers, initializer=_spawn_init) as pool:
+        # the pool is ready once every worker has loaded its models
+        pool.map(_spawn_run, transcripts[:workers], chunksize=1)
+        startup = time.perf_counter() - t0
+        start = time.perf_counter()
+        for _ in pool.imap(_spawn_run, transcripts):
+            pass
+        seconds = time.perf_counter() - start
+        print(f"\n[spawn] startup {startup:.1f} s")
+        summarize("spawn", [p.pid for p in pool._pool], len(transcripts), seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--transcripts", type=int, default=32)
+    parser.add_argument("--input", default="data/sample_transcript.txt")
+    parser.add_argument("--mode", choices=["both", "prefork", "spawn"], default="both")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        transcripts = [f.read()] * args.transcripts
+
+    # spawn first: the prefork parent keeps its models afterwards
+    if args.mode in ("both", "spawn"):
+        bench_spawn(transcripts, args.workers)
+    if args.mode in ("both", "prefork"):
+        bench_prefork(transcripts, args.workers)
+
+
+if __name__ == "__main__":
+    main()
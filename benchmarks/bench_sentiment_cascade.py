@@ -0,0 +1,45 @@
+"""
+Sentiment cascade vs always-DistilBERT.
+
+    python -m benchmarks.bench_sentiment_cascade data/*.txt
+
+Every patient turn and every full patient text is one sample. Reports the
+transformer call rate, agreement with the full-model baseline and the
+latency of both paths.
+"""
+import argparse
+import json
+import time
+
+from src.preprocess import split_turns, group_by_speaker
+from src.sentiment_intent import analyze_sentiment_and_intent, evaluate_sentiment_cascade, get_sentiment_model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="*", default=["data/sample_transcript.txt"])
+    args = parser.parse_args()
+
+    samples = []
+    for path in args.inputs:
+        with open(path, "r", encoding="utf-8") as f:
+            turns = split_turns(f.read())
+        samples += [t.text for t in turns if t.speaker == "Patient"]
+        samples.append(group_by_speaker(turns).get("Patient", ""))
+
+    get_sentiment_model()  # keep the model load out of the timings
+
+    timings = {}
+    for mode in ("transformer", "cascade"):
+        start = time.perf_counter()
+        for text in samples:
+            analyze_sentiment_and_intent(text, mode=mode)
+        timings[mode] = time.perf_counter() - start
+
+    report = evaluate_sentiment_cascade(samples)
+    report["ms_per_sample"] = {k: round(v / len(samples) * 1000, 2) for k, v in timings.items()}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
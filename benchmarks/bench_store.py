@@ -0,0 +1,90 @@
+"""
+Encounter store ingest rate, query latency and save/load time.
+
+    python -m benchmarks.bench_store --encounters 1000000
+
+Synthetic results reuse the sample structured summary with randomized
+symptoms, diagnosis, treatment counts and dates.
+"""
+import argparse
+import datetime as dt
+import random
+import tempfile
+import time
+
+from src.store import EncounterStore
+
+SYMPTOMS = ["Neck pain", "Back pain", "Headache", "Dizziness", "Nausea", "Shoulder pain",
+            "Knee pain", "Fatigue", "Insomnia", "Anxiety", "Stiffness", "Numbness"]
+DIAGNOSES = ["Whiplash injury", "Lower back strain", "Concussion", "Sprained ankle",
+             "Rotator cuff tear", "Migraine", "Soft tissue injury"]
+KEYWORDS = ["car accident", "physiotherapy", "painkillers", "follow up", "x-ray",
+            "work", "sleep", "recovery", "seatbelt", "mobility"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+
+def synthetic_results(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    start = dt.date(2025, 1, 1).toordinal()
+    for i in range(n):
+        summary = {
+            "Patient_Name": "Unknown",
+            "Symptoms": rng.sample(SYMPTOMS, rng.randint(1, 4)),
+            "Diagnosis": rng.choice(DIAGNOSES),
+            "Treatment": [f"{rng.randint(1, 15)} physiotherapy sessions", "Painkillers"],
+            "Accident_Details": {"Accident_Date": f"{rng.choice(MONTHS)} {rng.randint(1, 28)}"},
+            "History_of_Present_Illness": f"Pain lasted approximately {rng.randint(1, 12)} weeks.",
+            "Functional_Impact": {"Time_Off_Work_Days": rng.randint(0, 30)},
+        }
+        results = {"structured_summary": summary, "keywords": rng.sample(KEYWORDS, 3)}
+        yield f"enc-{i}", results, dt.date.fromordinal(start + rng.randint(0, 600))
+
+
+def timed_query(store: EncounterStore, repeat: int, **kwargs):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        rows = store.query(**kwargs)
+    return (time.perf_counter() - t0) / repeat * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encounters", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--documents", action="store_true", help="also store full results (get())")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EncounterStore(tmp, store_documents=args.documents)
+        t0 = time.perf_counter()
+        for encounter_id, results, date in synthetic_results(args.encounters):
+            store.ingest(results, encounter_id=encounter_id, encounter_date=date)
+        ingest_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        store.save()
+        save_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        loaded = EncounterStore(tmp)
+        load_s = time.perf_counter() - t0
+
+        queries = {
+            "whiplash & physio > 5": dict(diagnosis="Whiplash injury", where={"Physio_Sessions": (">", 5)}),
+            "neck pain in 2026": dict(symptoms="Neck pain", encounter_date=("2026-01-01", "2026-12-31")),
+            "September accidents": dict(where={"Accident_Month": ("=", 9)}),
+            "mentions headache": dict(mentions="headache"),
+        }
+
+        print(f"encounters:     {len(loaded)}")
+        print(f"ingest:         {args.encounters / ingest_s:,.0f} encounters/s")
+        print(f"save:           {save_s:.2f} s")
+        print(f"load (mmap):    {load_s * 1000:.1f} ms")
+        for name, kwargs in queries.items():
+            ms, hits = timed_query(loaded, args.repeat, **kwargs)
+            print(f"{name + ':':<24}{ms:8.2f} ms ({hits} hits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import time
+
+from src.compiled import BACKENDS, SEQ_BUCKETS, clear_compiled_cache, load_compiled_pipeline
+from src.ner import HF_BIOMED_NER_MODEL
+from src.sentiment_intent import SENTIMENT_MODEL
+
+
+MODELS = {
+    "ner": ("ner", HF_BIOMED_NER_MODEL, {"aggregation_strategy": "simple"}),
+    "sentiment": ("sentiment-analysis", SENTIMENT_MODEL, {}),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the compiled model artifacts ahead of time")
+    parser.add_argument("--backend", choices=BACKENDS, default="torchscript")
+    parser.add_argument("--models", nargs="*", choices=sorted(MODELS), default=sorted(MODELS))
+    parser.add_argument("--buckets", type=int, nargs="*", default=list(SEQ_BUCKETS),
+                        help="sequence-length buckets (the model max length is always added)")
+    parser.add_argument("--clear", action="store_true", help="delete all cached artifacts first")
+    args = parser.parse_args()
+
+    if args.clear:
+        clear_compiled_cache()
+
+    for name in args.models:
+        task, model_name, kwargs = MODELS[name]
+        start = time.perf_counter()
+        pipe = load_compiled_pipeline(task, model_name, backend=args.backend, buckets=args.buckets, **kwargs)
+        print(f"{name}: {pipe.compile_status}, "
+              f"buckets {getattr(pipe.model, 'buckets', '-')}, {time.perf_counter() - start:.1f} s")
+
+    print("\nUse them with NOTETAKER_COMPILE=" + args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+
+from src.evaluation import evaluate_configs, load_annotated, load_profiles, pareto_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speed vs accuracy of pipeline configurations")
+    parser.add_argument("--data", default="data/annotated/encounters.jsonl", help="annotated transcripts (JSONL)")
+    parser.add_argument("--profiles", nargs="*", default=[], help="profile names (default: all)")
+    parser.add_argument("--profiles-file", default=None, help="JSON file with extra profiles")
+    parser.add_argument("--no-isolate", action="store_true", help="run all profiles in this process")
+    parser.add_argument("--out", default=None, help="write the table as CSV")
+    args = parser.parse_args()
+
+    encounters = load_annotated(args.data)
+    configs = load_profiles(args.profiles, args.profiles_file)
+
+    reports = evaluate_configs(encounters, configs, isolate=not args.no_isolate)
+    table = pareto_table(reports)
+
+    print(table.to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"\nSaved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
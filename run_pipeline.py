@@ -1,18 +1,130 @@
-from src.pipeline import run_pipeline, save_outputs
+import argparse
+import itertools
+
+from src.corpus import bounded_map, iter_transcripts, prefetch
+from src.dedup import NEAR_DUPLICATE_THRESHOLD, DedupBatchRunner
+from src.pipeline import run_pipeline, run_batch, save_outputs
+from src.planner import apply_plan, autotune, load_plan, plan_execution
+from src.server import PreforkServer
+from src.sinks import make_sink
+
+
+# transcripts benchmarked per candidate layout by --autotune
+AUTOTUNE_SAMPLE = 32
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Physician Notetaker pipeline")
+    parser.add_argument("inputs", nargs="*",
+                        help="transcript .txt files or .jsonl exports (default: data/sample_transcript.txt)")
+    parser.add_argument("--sink", choices=["jsonl", "parquet", "dir", "store"], default=None,
+                        help="batch output sink; without it the single-run JSON files are written to outputs/")
+    parser.add_argument("--out", default=None, help="sink path (file for jsonl, directory otherwise)")
+    parser.add_argument("--compression", default=None, help="gzip for jsonl/dir, snappy/zstd/gzip for parquet")
+    parser.add_argument("--buffer-size", type=int, default=None, help="records buffered per bulk write")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="pre-forked worker processes sharing the loaded models (batch mode)")
+    parser.add_argument("--share-memory", action="store_true",
+                        help="move the model weights into /dev/shm before forking the workers "
+                             "(needs free /dev/shm space for all weights)")
+    parser.add_argument("--plan", default=None,
+                        help="'auto' to plan workers/threads/affinity from the CPU topology, "
+                             "'saved' for the autotuned plan, or a plan JSON path (batch mode)")
+    parser.add_argument("--autotune", action="store_true",
+                        help="benchmark a few worker x thread layouts on the inputs and save the best")
+    parser.add_argument("--concatenated", action="store_true",
+                        help="inputs hold many transcripts separated by form-feed lines")
+    parser.add_argument("--shard", default="0/1",
+                        help="process only shard i of n, e.g. 2/8 (batch mode)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="transcripts read ahead of the model stages (default: 2 x workers)")
+    parser.add_argument("--summary-batch-size", type=int, default=1,
+                        help="transcripts per batched summarizer call (single-process batch mode)")
+    parser.add_argument("--sentiment-mode", choices=["cascade", "transformer", "lexicon"], default="cascade",
+                        help="cascade: lexicon for clear cases, DistilBERT for the rest; "
+                             "transformer: DistilBERT for every transcript")
+    parser.add_argument("--dedup", action="store_true",
+                        help="reuse outputs for exact duplicates and run near duplicates incrementally "
+                             "(their sentiment, keywords and summary can lag behind small edits; "
+                             "single-process batch mode, not combinable with --summary-batch-size)")
+    parser.add_argument("--dedup-threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD,
+                        help="estimated Jaccard similarity above which a transcript is a near duplicate")
+    args = parser.parse_args()
+    if args.dedup and args.summary_batch_size > 1:
+        parser.error("--dedup cannot be combined with --summary-batch-size")
+    return args
 
 
 def main():
-    with open("data/sample_transcript.txt", "r", encoding="utf-8") as f:
-        transcript = f.read()
+    args = parse_args()
+
+    if args.sink is None:
+        path = args.inputs[0] if args.inputs else "data/sample_transcript.txt"
+        with open(path, "r", encoding="utf-8") as f:
+            transcript = f.read()
+
+        results = run_pipeline(transcript, sentiment_mode=args.sentiment_mode)
+        save_outputs(results)
+
+        print("Done. Outputs saved to /outputs")
+        print("\nStructured Summary Preview:\n")
+        print(results["structured_summary"])
+        return
+
+    default_out = {"jsonl": "outputs/encounters.jsonl", "parquet": "outputs/parquet",
+                   "dir": "outputs/encounters", "store": "outputs/store"}
+    sink_kwargs = {}
+    if args.compression is not None:
+        sink_kwargs["compression"] = args.compression
+    if args.buffer_size is not None:
+        sink_kwargs["buffer_size"] = args.buffer_size
+
+    inputs = args.inputs or ["data/sample_transcript.txt"]
+    shard_index, shard_count = (int(x) for x in args.shard.split("/"))
+
+    def transcripts():
+        return iter_transcripts(inputs, shard=(shard_index, shard_count), concatenated=args.concatenated)
+
+    plan = None
+    if args.autotune:
+        plan = autotune([text for _, text in itertools.islice(transcripts(), AUTOTUNE_SAMPLE)])
+    elif args.plan == "auto":
+        plan = plan_execution()
+    elif args.plan == "saved":
+        plan = load_plan()
+    elif args.plan:
+        plan = load_plan(args.plan)
+    if plan is not None:
+        print(f"Execution plan: {plan.workers} worker(s) x {plan.threads_per_worker} thread(s) [{plan.source}]")
+
+    with make_sink(args.sink, args.out or default_out[args.sink], **sink_kwargs) as sink:
+        if args.workers > 1 or (plan is not None and plan.workers > 1):
+            with PreforkServer(workers=args.workers, plan=plan, share_memory=args.share_memory,
+                               sentiment_mode=args.sentiment_mode) as server:
+                # bounded submission: the input is read only as fast as workers finish
+                max_in_flight = args.max_in_flight or 2 * server.workers
+                items = bounded_map(lambda item: server.submit(item[1]), transcripts(), max_in_flight)
+                for (encounter_id, _), results in items:
+                    sink.write(results, encounter_id=encounter_id)
+                    print(f"Processed {encounter_id}")
+        else:
+            if plan is not None:
+                apply_plan(plan)
+            items = prefetch(transcripts(), max_in_flight=args.max_in_flight or max(2, args.summary_batch_size))
+            if args.dedup:
+                dedup = DedupBatchRunner(threshold=args.dedup_threshold, sentiment_mode=args.sentiment_mode)
+                for encounter_id, _ in dedup.run(items, sink=sink):
+                    print(f"Processed {encounter_id}")
+                report = dedup.report()
+                print(f"Dedup: {report['exact_duplicates']} exact + {report['near_duplicates']} near duplicate(s) "
+                      f"of {report['items']} ({report['dedup_ratio']:.1%}), ~{report['saved_s']:.1f} s saved")
+            else:
+                for encounter_id, _ in run_batch(items, sink=sink, summary_batch_size=args.summary_batch_size,
+                                                 sentiment_mode=args.sentiment_mode):
+                    print(f"Processed {encounter_id}")
 
-    results = run_pipeline(transcript)
-    save_outputs(results)
+    print(f"Done. {sink.records_written} encounter(s) written with the {args.sink} sink")
 
-    print("Done. Outputs saved to /outputs")
-    print("\nStructured Summary Preview:\n")
-    print(results["structured_summary"])
-    
 
 if __name__ == "__main__":
-    
     main()
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from src.keywords import extract_keywords
+from src.pipeline import build_structured_medical_json, extract_entities
+from src.document import ClinicalDocument
+from src.sentiment_intent import analyze_sentiment_and_intent
+from src.soap import build_soap_note
+from src.summarizer import medical_summary_structured
+
+
+# One single-thread executor per model stage: a slow summary never queues
+# behind NER, and a model is only ever called from one thread at a time.
+MODEL_STAGES = ["ner", "sentiment_intent", "keywords", "model_summary"]
+
+_EXECUTORS: Dict[str, ThreadPoolExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+class StageTimeout(asyncio.TimeoutError):
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Stage '{stage}' exceeded its {seconds} s timeout")
+        self.stage = stage
+        self.seconds = seconds
+
+
+def stage_executor(stage: str) -> ThreadPoolExecutor:
+    with _EXECUTORS_LOCK:
+        if stage not in _EXECUTORS:
+            _EXECUTORS[stage] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stage-{stage}")
+        return _EXECUTORS[stage]
+
+
+def shutdown_executors() -> None:
+    with _EXECUTORS_LOCK:
+        for executor in _EXECUTORS.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _EXECUTORS.clear()
+
+
+async def _run_stage(stage: str, fn, timeouts: Dict[str, float], cancel_event: threading.Event) -> Any:
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(stage_executor(stage), fn)
+    timeout = timeouts.get(stage)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        # a TimeoutError raised by the stage itself is not a stage timeout
+        if timeout is None or (future.done() and not future.cancelled()):
+            raise
+        # stop any chunk inference still running in the worker thread
+        cancel_event.set()
+        raise StageTimeout(stage, timeout) from None
+
+
+async def arun_pipeline(transcript: str, timeouts: Optional[Dict[str, float]] = None,
+                        ner_backend: str = "transformer", sentiment_mode: str = "transformer") -> Dict[str, Any]:
+    """
+    Async version of run_pipeline; returns the same result dict.
+
+    Model stages run in their own executors and the independent ones
+    (NER, sentiment, keywords, summary) are awaited concurrently.
+    `timeouts` maps stage name -> seconds; a stage that exceeds it raises
+    StageTimeout. On timeout, error or cancellation of the awaiting task,
+    the other stages are cancelled: queued work never starts and NER stops
+    before its next chunk.
+    """
+    timeouts = timeouts or {}
+    cancel_event = threading.Event()
+
+    doc = ClinicalDocument.from_transcript(transcript)
+    grouped = doc.grouped
+    full_text = doc.text
+    patient_text = grouped.get("Patient", "")
+
+    async def structured_path():
+        ner_out = await _run_stage("ner", lambda: extract_entities(
+            full_text, patient_text, ner_backend=ner_backend, cancel_event=cancel_event, document=doc
+        ), timeouts, cancel_event)
+        # rule-based, milliseconds: no need to leave the event loop
+        structured = build_structured_medical_json(grouped, ner_out, document=doc)
+        return structured, build_soap_note(structured)
+
+    tasks = [
+        asyncio.ensure_future(structured_path()),
+        asyncio.ensure_future(_run_stage(
+            "sentiment_intent", lambda: analyze_sentiment_and_intent(patient_text, mode=sentiment_mode, document=doc),
+            timeouts, cancel_event
+        )),
+        asyncio.ensure_future(_run_stage(
+            "keywords", lambda: extract_keywords(full_text), timeouts, cancel_event
+        )),
+        asyncio.ensure_future(_run_stage(
+            "model_summary", lambda: medical_summary_structured(full_text, document=doc), timeouts, cancel_event
+        )),
+    ]
+
+    try:
+        (structured, soap), sentiment_intent, keywords, model_summary = await asyncio.gather(*tasks)
+    except BaseException:
+        cancel_event.set()
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return {
+        "structured_summary": structured,
+        "model_summary": model_summary,
+        "keywords": keywords,
+        "sentiment_intent": sentiment_intent,
+        "soap_note": soap
+    }
@@ -0,0 +1,284 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.cancel import PipelineCancelled
+from src.jobs import JobManager
+from src.keywords import extract_keywords, extract_keywords_frequency
+from src.ner import SPACY_MODEL, SPACY_FAST_MODEL
+from src.pipeline import build_structured_medical_json, extract_entities
+from src.document import ClinicalDocument
+from src.sentiment_intent import analyze_sentiment_and_intent
+from src.soap import build_soap_note
+from src.summarizer import medical_summary_structured, template_summary
+
+
+# -----------------------------
+# Cost model
+# -----------------------------
+# Estimated milliseconds per (stage, backend): base + per 1000 characters.
+# Rough warm-CPU figures; each observed run nudges a correction factor,
+# so the estimates converge to the machine the pipeline actually runs on.
+# The first run of each backend in a process is not recorded (it pays the
+# model load), and the factor is capped so one outlier cannot rule a
+# backend out for good. Since only backends that run get measured, a stage
+# that keeps falling back re-tries its better backends every PROBE_EVERY
+# runs when their uncorrected estimate fits the remaining budget.
+STAGE_COSTS_MS = {
+    ("ner", "transformer"): (30.0, 250.0),
+    ("ner", "transformer_sm"): (20.0, 110.0),
+    ("ner", "cascade"): (15.0, 60.0),
+    ("ner", "gazetteer"): (1.0, 2.0),
+    ("sentiment_intent", "cascade"): (40.0, 0.0),
+    ("sentiment_intent", "lexicon"): (1.0, 0.5),
+    ("keywords", "keybert"): (50.0, 60.0),
+    ("keywords", "frequency"): (1.0, 2.0),
+    ("model_summary", "flan-t5"): (1500.0, 300.0),
+    ("model_summary", "template"): (0.5, 0.0),
+}
+
+# best backend first; the last one of each stage is the cheap fallback
+STAGE_BACKENDS = {
+    "ner": ["transformer", "transformer_sm", "cascade", "gazetteer"],
+    "sentiment_intent": ["cascade", "lexicon"],
+    "keywords": ["keybert", "frequency"],
+    "model_summary": ["flan-t5", "template"],
+}
+
+# stages whose full backend may be finished in the background instead
+ASYNC_STAGES = ["keywords", "model_summary"]
+
+EWMA_ALPHA = 0.3
+# correction factors stay within [1 / MAX_CORRECTION, MAX_CORRECTION]
+MAX_CORRECTION = 4.0
+PROBE_EVERY = 20
+
+_correction: Dict[Tuple[str, str], float] = {}
+_warm: set = set()  # (stage, backend) pairs that ran at least once
+_fallbacks: Dict[str, int] = {}  # stage -> fallbacks chosen since its last probe
+_correction_lock = threading.Lock()
+
+PENDING_JOBS = JobManager(max_workers=1)
+
+
+def base_estimate_ms(stage: str, backend: str, n_chars: int) -> float:
+    base, per_kchar = STAGE_COSTS_MS[(stage, backend)]
+    return base + per_kchar * n_chars / 1000.0
+
+
+def estimate_ms(stage: str, backend: str, n_chars: int) -> float:
+    return base_estimate_ms(stage, backend, n_chars) * _correction.get((stage, backend), 1.0)
+
+
+def record_stage_time(stage: str, backend: str, n_chars: int, seconds: float) -> None:
+    """
+    Folds an observed stage time into the cost model. The first run of a
+    backend is skipped, as it includes loading its model.
+    """
+    raw = base_estimate_ms(stage, backend, n_chars)
+    if raw <= 0:
+        return
+    ratio = min(max(seconds * 1000.0 / raw, 1.0 / MAX_CORRECTION), MAX_CORRECTION)
+    with _correction_lock:
+        if (stage, backend) not in _warm:
+            _warm.add((stage, backend))
+            return
+        old = _correction.get((stage, backend), 1.0)
+        _correction[(stage, backend)] = (1 - EWMA_ALPHA) * old + EWMA_ALPHA * ratio
+
+
+def choose_backend(stage: str, remaining_ms: float, n_chars: int) -> str:
+    """
+    Best backend whose estimated cost fits into the remaining budget,
+    otherwise the cheapest one. Every PROBE_EVERY fallbacks of a stage, a
+    better backend whose uncorrected estimate fits is run instead, so a
+    correction that has gone stale gets measured again.
+    """
+    backends = STAGE_BACKENDS[stage]
+    chosen = next((b for b in backends if estimate_ms(stage, b, n_chars) <= remaining_ms), backends[-1])
+    if chosen == backends[0]:
+        return chosen
+
+    with _correction_lock:
+        _fallbacks[stage] = _fallbacks.get(stage, 0) + 1
+        if _fallbacks[stage] < PROBE_EVERY:
+            return chosen
+        for backend in backends[:backends.index(chosen)]:
+            if base_estimate_ms(stage, backend, n_chars) <= remaining_ms:
+                _fallbacks[stage] = 0
+                return backend
+    return chosen
+
+
+# -----------------------------
+# Budgeted run
+# -----------------------------
+def _ner_backend_args(backend: str) -> Dict[str, Any]:
+    if backend == "gazetteer":
+        return {"ner_backend": "gazetteer"}
+    if backend == "cascade":
+        return {"ner_backend": "cascade", "spacy_model": SPACY_FAST_MODEL}
+    return {"ner_backend": "transformer", "spacy_model": SPACY_MODEL if backend == "transformer" else SPACY_FAST_MODEL}
+
+
+def _run_gazetteer_ner(full_text: str, patient_text: str,
+                       document: Optional[ClinicalDocument]) -> Tuple[Dict[str, Any], str, float]:
+    t0 = time.perf_counter()
+    out = extract_entities(full_text, patient_text, ner_backend="gazetteer", document=document)
+    return out, "gazetteer", time.perf_counter() - t0
+
+
+def _run_ner_with_deadline(full_text: str, patient_text: str, backend: str, deadline: float,
+                           document: Optional[ClinicalDocument] = None) -> Tuple[Dict[str, Any], str, float]:
+    """
+    Runs NER with `backend`, aborting between chunks once the deadline
+    passes and falling back to the gazetteer (whose matches the aborted
+    run already cached on `document`). A spaCy model that is not installed
+    (OSError from spacy.load) falls back the same way.
+
+    Returns (output, backend that produced it, seconds of that backend's
+    run alone), so an aborted attempt is not charged to the fallback.
+    """
+    if backend == "gazetteer":
+        return _run_gazetteer_ner(full_text, patient_text, document)
+
+    cancel_event = threading.Event()
+    timer = threading.Timer(max(deadline - time.perf_counter(), 0.0), cancel_event.set)
+    timer.start()
+    t0 = time.perf_counter()
+    try:
+        out = extract_entities(full_text, patient_text, cancel_event=cancel_event, document=document,
+                               **_ner_backend_args(backend))
+        return out, backend, time.perf_counter() - t0
+    except (PipelineCancelled, OSError):
+        return _run_gazetteer_ner(full_text, patient_text, document)
+    finally:
+        timer.cancel()
+
+
+def _pending_runner(full_text: str, stages: List[str]):
+    def runner(transcript, cancel_event=None):
+        for stage in stages:
+            if cancel_event is not None and cancel_event.is_set():
+                raise PipelineCancelled()
+            start = time.perf_counter()
+            if stage == "keywords":
+                out = extract_keywords(full_text)
+            else:
+                out = medical_summary_structured(full_text)
+            seconds = time.perf_counter() - start
+            record_stage_time(stage, STAGE_BACKENDS[stage][0], len(full_text), seconds)
+            yield stage, out, seconds
+    return runner
+
+
+def run_pipeline_with_budget(transcript: str, latency_budget_ms: float,
+                             finish_pending: bool = True) -> Dict[str, Any]:
+    """
+    run_pipeline under a latency budget.
+
+    The rule-based structured summary, SOAP note and intents always run.
+    Model stages get the best backend whose estimated cost still fits in
+    what is left of the budget, otherwise a cheaper fallback. With
+    `finish_pending`, keywords and the model summary that did not fit are
+    computed in the background instead: their fields are None, marked
+    "pending", and `pending_job_id` can be polled via get_pending_results.
+
+    The result adds `field_status` (complete / degraded / pending per
+    field) and a `budget` report to the usual keys.
+    """
+    start = time.perf_counter()
+    deadline = start + latency_budget_ms / 1000.0
+
+    def remaining_ms() -> float:
+        return (deadline - time.perf_counter()) * 1000.0
+
+    doc = ClinicalDocument.from_transcript(transcript)
+    grouped = doc.grouped
+    full_text = doc.text
+    patient_text = grouped.get("Patient", "")
+    n = len(full_text)
+
+    plan: Dict[str, str] = {}
+    status: Dict[str, str] = {}
+    pending: List[str] = []
+
+    def run(stage: str, backend: str, fn):
+        t0 = time.perf_counter()
+        out = fn()
+        record_stage_time(stage, backend, n, time.perf_counter() - t0)
+        plan[stage] = backend
+        return out
+
+    # NER feeds the structured summary; leave room for the cheap stages after it
+    reserve = sum(estimate_ms(s, STAGE_BACKENDS[s][-1], n) for s in ["sentiment_intent", "keywords", "model_summary"])
+    ner_backend = choose_backend("ner", remaining_ms() - reserve, n)
+    ner_out, ner_backend, ner_seconds = _run_ner_with_deadline(full_text, patient_text, ner_backend,
+                                                               deadline - reserve / 1000.0, document=doc)
+    record_stage_time("ner", ner_backend, n, ner_seconds)
+    plan["ner"] = ner_backend
+
+    structured = build_structured_medical_json(grouped, ner_out, document=doc)
+    soap = build_soap_note(structured)
+    ner_degraded = ner_backend != STAGE_BACKENDS["ner"][0]
+    status["structured_summary"] = "degraded" if ner_degraded else "complete"
+    status["soap_note"] = status["structured_summary"]
+
+    backend = choose_backend("sentiment_intent", remaining_ms(), n)
+    sentiment_intent = run("sentiment_intent", backend,
+                           lambda: analyze_sentiment_and_intent(patient_text, mode=backend, document=doc))
+    status["sentiment_intent"] = "complete" if backend == "cascade" else "degraded"
+
+    outputs: Dict[str, Any] = {}
+    for stage in ["keywords", "model_summary"]:
+        backend = choose_backend(stage, remaining_ms(), n)
+        full_backend = STAGE_BACKENDS[stage][0]
+        if backend != full_backend and finish_pending and stage in ASYNC_STAGES:
+            pending.append(stage)
+            status[stage] = "pending"
+            plan[stage] = f"{full_backend} (background)"
+            outputs[stage] = None
+            continue
+
+        if stage == "keywords":
+            fn = (lambda: extract_keywords(full_text)) if backend == "keybert" else (lambda: extract_keywords_frequency(full_text, document=doc))
+        else:
+            fn = (lambda: medical_summary_structured(full_text, document=doc)) if backend == "flan-t5" else (lambda: template_summary(structured))
+        outputs[stage] = run(stage, backend, fn)
+        status[stage] = "complete" if backend == full_backend else "degraded"
+
+    results = {
+        "structured_summary": structured,
+        "model_summary": outputs["model_summary"],
+        "keywords": outputs["keywords"],
+        "sentiment_intent": sentiment_intent,
+        "soap_note": soap,
+        "field_status": status,
+        "budget": {
+            "latency_budget_ms": latency_budget_ms,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000.0, 1),
+            "plan": plan,
+        },
+    }
+
+    if pending:
+        results["pending_job_id"] = PENDING_JOBS.submit(transcript, runner=_pending_runner(full_text, pending))
+    return results
+
+
+def get_pending_results(job_id: str, wait: bool = False, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Outputs of the background stages of a budgeted run finished so far.
+    With `wait`, blocks until the job is done (or `timeout` seconds).
+
+    Once the job has finished its results are handed out one last time and
+    the job is dropped; later calls with the same id raise KeyError.
+    """
+    job = PENDING_JOBS.get(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if wait and job.future is not None:
+        job.future.result(timeout=timeout)
+    if job.finished:
+        PENDING_JOBS.discard(job_id)
+    return {"status": job.status, "results": dict(job.results), "timings": dict(job.timings)}
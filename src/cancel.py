@@ -0,0 +1,13 @@
+class PipelineCancelled(Exception):
+    """
+    Raised from inside a stage once its run has been cancelled.
+    """
+
+
+def raise_if_cancelled(cancel_event) -> None:
+    """
+    Cooperative cancellation check, called between units of work
+    (stages, NER chunks). `cancel_event` is a threading.Event or None.
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise PipelineCancelled()
@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.models import CACHE_DIR
+
+
+# -----------------------------
+# Compiled model artifacts
+# -----------------------------
+# Optional ahead-of-time compilation of the encoder pipelines (biomedical
+# NER, DistilBERT sentiment). Inputs are right-padded to a few fixed
+# sequence-length buckets, so the compiled graphs only ever see those
+# shapes and are warmed once at load.
+#
+# Backends (NOTETAKER_COMPILE or set_compile_backend):
+#   "torchscript"  traced + frozen TorchScript module, saved under
+#                  CACHE_DIR/compiled/<model>/<key>/. A cached artifact is
+#                  loaded without materializing the eager weights at all.
+#   "inductor"     torch.compile(dynamic=False) per bucket; the compiled
+#                  kernels persist in CACHE_DIR/inductor across restarts.
+#
+# The cache key covers the artifact format, torch/transformers versions,
+# model revision and config, dtype, input names and buckets; anything that
+# changes the graph gets a new directory.
+COMPILE_ENV = "NOTETAKER_COMPILE"
+COMPILED_DIR = CACHE_DIR / "compiled"
+INDUCTOR_DIR = CACHE_DIR / "inductor"
+ARTIFACT_VERSION = 1
+SEQ_BUCKETS = (64, 128, 256, 512)
+BACKENDS = ("torchscript", "inductor")
+
+# max |compiled - eager| logit difference accepted when verifying a bucket
+VERIFY_TOLERANCE = 1e-3
+
+_BACKEND = os.environ.get(COMPILE_ENV, "").lower() or None
+
+
+def set_compile_backend(backend: Optional[str]) -> None:
+    """
+    Applies to models loaded (or reloaded) after the call; None disables it.
+    """
+    global _BACKEND
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f"Unknown compile backend: {backend}. Options: {BACKENDS}")
+    _BACKEND = backend
+
+
+def compile_backend() -> Optional[str]:
+    return _BACKEND
+
+
+def _buckets_for(config, buckets: Sequence[int]) -> Tuple[int, ...]:
+    # the largest bucket is always the model's max length, so every input fits one
+    max_len = getattr(config, "max_position_embeddings", None) or max(buckets)
+    return tuple(sorted({b for b in buckets if b < max_len} | {max_len}))
+
+
+def _config_digest(config) -> str:
+    # load-time fields (dtype, local path) differ between loaders of the same model
+    fields = {k: v for k, v in config.to_dict().items()
+              if k not in ("torch_dtype", "_name_or_path", "transformers_version")}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def artifact_key(model_name: str, config, backend: str, input_names: Sequence[str],
+                 buckets: Sequence[int], dtype: str) -> str:
+    import torch
+    import transformers
+
+    payload = {
+        "artifact_version": ARTIFACT_VERSION,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "model": model_name,
+        "revision": getattr(config, "_commit_hash", None),
+        "config": _config_digest(config),
+        "backend": backend,
+        "inputs": list(input_names),
+        "buckets": list(buckets),
+        "dtype": dtype,
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def artifact_dir(model_name: str, key: str) -> Path:
+    return COMPILED_DIR / model_name.replace("/", "--") / key
+
+
+def clear_compiled_cache() -> None:
+    shutil.rmtree(COMPILED_DIR, ignore_errors=True)
+    shutil.rmtree(INDUCTOR_DIR, ignore_errors=True)
+
+
+def _input_names(model, tokenizer) -> List[str]:
+    import inspect
+
+    params = inspect.signature(model.forward).parameters
+    names = [n for n in tokenizer.model_input_names if n in params]
+    return names or ["input_ids", "attention_mask"]
+
+
+def _example_inputs(input_names: Sequence[str], length: int, vocab_size: int, seed: int = 0):
+    import torch
+
+    g = torch.Generator().manual_seed(seed)
+    tensors = []
+    for name in input_names:
+        if name == "input_ids":
+            tensors.append(torch.randint(5, vocab_size, (1, length), generator=g))
+        elif name == "attention_mask":
+            tensors.append(torch.ones((1, length), dtype=torch.long))
+        else:
+            tensors.append(torch.zeros((1, length), dtype=torch.long))
+    return tensors
+
+
+def _positional(model, input_names: Sequence[str]):
+    import torch
+
+    class PositionalLogits(torch.nn.Module):
+        # tracing needs positional tensor inputs and a tensor output
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *tensors):
+            return self.model(**dict(zip(input_names, tensors)), return_dict=False)[0]
+
+    return PositionalLogits().eval()
+
+
+class BucketedModel:
+    """
+    Stands in for `pipeline.model`: pads each input to the smallest bucket
+    that fits, runs the compiled module and trims the logits back.
+    Exposes config / device / dtype like the HF model it replaces.
+    """
+
+    def __init__(self, runner, config, input_names: Sequence[str], buckets: Sequence[int],
+                 pad_token_id: int, dtype, source: str):
+        self.runner = runner
+        self.config = config
+        self.input_names = list(input_names)
+        self.buckets = tuple(buckets)
+        self.pad_token_id = pad_token_id
+        self.dtype = dtype
+        self.source = source
+        self.calls = {b: 0 for b in self.buckets}
+
+    @property
+    def device(self):
+        import torch
+        return torch.device("cpu")
+
+    def bucket_for(self, length: int) -> int:
+        for b in self.buckets:
+            if length <= b:
+                return b
+        raise ValueError(f"Input of {length} tokens exceeds the largest bucket ({self.buckets[-1]})")
+
+    def _pad(self, name: str, t, bucket: int):
+        import torch.nn.functional as F
+        value = self.pad_token_id if name == "input_ids" else 0
+        return F.pad(t, (0, bucket - t.shape[1]), value=value)
+
+    def __call__(self, **inputs):
+        import torch
+
+        length = inputs["input_ids"].shape[1]
+        bucket = self.bucket_for(length)
+        self.calls[bucket] += 1
+
+        rows = []
+        with torch.inference_mode():
+            # compiled for batch 1; the pipelines call with one sequence anyway
+            for row in range(inputs["input_ids"].shape[0]):
+                tensors = [self._pad(n, inputs[n][row:row + 1], bucket) for n in self.input_names]
+                rows.append(self.runner(*tensors))
+        logits = torch.cat(rows)
+        if logits.dim() == 3:
+            logits = logits[:, :length]
+        return {"logits": logits}
+
+    def forward(self, **inputs):
+        return self(**inputs)
+
+
+def _verify(runner, model, input_names: Sequence[str], buckets: Sequence[int], vocab_size: int) -> float:
+    """
+    Largest logit difference between the compiled and the eager model over
+    all buckets (random inputs, right-padded like real calls).
+    """
+    import torch
+
+    worst = 0.0
+    with torch.inference_mode():
+        for b in buckets:
+            tensors = _example_inputs(input_names, b, vocab_size, seed=b)
+            # half the sequence is padding, as for a short input in a large bucket
+            if "attention_mask" in input_names:
+                tensors[input_names.index("attention_mask")][:, b // 2:] = 0
+            eager = model(**dict(zip(input_names, tensors)), return_dict=False)[0]
+            compiled = runner(*tensors)
+            if eager.dim() == 3:
+                eager, compiled = eager[:, :b // 2], compiled[:, :b // 2]
+            worst = max(worst, float((eager.float() - compiled.float()).abs().max()))
+    return worst
+
+
+def _trace(model, input_names: Sequence[str], buckets: Sequence[int], vocab_size: int):
+    import torch
+
+    wrapped = _positional(model, input_names)
+    # traced at the largest bucket; _verify checks the graph on every bucket
+    example = tuple(_example_inputs(input_names, buckets[-1], vocab_size))
+    with torch.inference_mode(False), torch.no_grad():
+        traced = torch.jit.trace(wrapped, example, strict=False, check_trace=False)
+    return torch.jit.freeze(traced.eval())
+
+
+def _warm(runner, input_names: Sequence[str], buckets: Sequence[int], vocab_size: int) -> float:
+    import torch
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for b in buckets:
+            for _ in range(2):  # the profiling executor specializes on the second run
+                runner(*_example_inputs(input_names, b, vocab_size))
+    return time.perf_counter() - start
+
+
+def _keep_eager(pipe: Any, reason: str) -> Any:
+    warnings.warn(f"{reason}, keeping the eager model", RuntimeWarning, stacklevel=3)
+    pipe.compile_status = f"eager: {reason}"
+    return pipe
+
+
+def compile_pipeline(pipe, model_name: str, backend: Optional[str] = None,
+                     buckets: Sequence[int] = SEQ_BUCKETS) -> Any:
+    """
+    Swaps `pipe.model` for a BucketedModel running the compiled graph,
+    building (and for torchscript, saving) the artifact when it is not in
+    the cache yet. Falls back to the eager model if verification fails.
+
+    `pipe.compile_status` records the outcome: "inductor", "cache",
+    "traced", or "eager: <reason>" after a fallback (also issued as a
+    RuntimeWarning).
+    """
+    import torch
+
+    backend = backend or compile_backend() or "torchscript"
+    model, config = pipe.model, pipe.model.config
+    input_names = _input_names(model, pipe.tokenizer)
+    buckets = _buckets_for(config, buckets)
+    key = artifact_key(model_name, config, backend, input_names, buckets, str(model.dtype))
+    target = artifact_dir(model_name, key)
+    start = time.perf_counter()
+
+    if backend == "inductor":
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(INDUCTOR_DIR))
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+        runner = torch.compile(_positional(model, input_names), dynamic=False)
+        # compiles every bucket; the weights stay shared with the eager model
+        worst = _verify(runner, model, input_names, buckets, config.vocab_size)
+        if worst > VERIFY_TOLERANCE:
+            return _keep_eager(pipe, f"{model_name}: compiled graph differs from eager by {worst:.2e}")
+        source = "inductor"
+    elif (target / "model.pt").exists():
+        runner = torch.jit.load(str(target / "model.pt"), map_location="cpu")
+        source = "cache"
+    else:
+        runner = _trace(model, input_names, buckets, config.vocab_size)
+        worst = _verify(runner, model, input_names, buckets, config.vocab_size)
+        if worst > VERIFY_TOLERANCE:
+            return _keep_eager(pipe, f"{model_name}: traced graph differs from eager by {worst:.2e}")
+        target.mkdir(parents=True, exist_ok=True)
+        tmp = target / "model.pt.tmp"
+        torch.jit.save(runner, str(tmp))
+        os.replace(tmp, target / "model.pt")
+        with open(target / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "backend": backend, "inputs": input_names,
+                       "buckets": list(buckets), "max_abs_diff": worst,
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2)
+        source = "traced"
+
+    warm_s = _warm(runner, input_names, buckets, config.vocab_size)
+    pipe.model = BucketedModel(runner, config, input_names, buckets, pipe.tokenizer.pad_token_id or 0,
+                               model.dtype, source)
+    pipe.model.compile_seconds = round(time.perf_counter() - start - warm_s, 3)
+    pipe.model.warm_seconds = round(warm_s, 3)
+    pipe.compile_status = source
+    return pipe
+
+
+def load_compiled_pipeline(task: str, model_name: str, backend: Optional[str] = None,
+                           buckets: Sequence[int] = SEQ_BUCKETS, model_kwargs: Optional[Dict[str, Any]] = None,
+                           **pipeline_kwargs) -> Any:
+    """
+    transformers.pipeline(task, model_name) with a compiled model.
+
+    When a TorchScript artifact for the current key is cached, the eager
+    model is only instantiated on the meta device (config, no weights), so
+    a cold start reads the compiled weights once instead of twice.
+    """
+    import torch
+    from transformers import AutoConfig, AutoTokenizer, pipeline
+    from transformers.pipelines import SUPPORTED_TASKS, PIPELINE_REGISTRY
+
+    backend = backend or compile_backend() or "torchscript"
+    model_kwargs = dict(model_kwargs or {})
+
+    if backend == "torchscript":
+        task_name = PIPELINE_REGISTRY.check_task(task)[0]
+        auto_model = SUPPORTED_TASKS[task_name]["pt"][0]
+        config = AutoConfig.from_pretrained(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        dtype = model_kwargs.get("torch_dtype", torch.float32)
+
+        with torch.device("meta"):
+            skeleton = auto_model.from_config(config, torch_dtype=dtype)
+        names = _input_names(skeleton, tokenizer)
+        key = artifact_key(model_name, config, backend, names, _buckets_for(config, buckets), str(skeleton.dtype))
+        if (artifact_dir(model_name, key) / "model.pt").exists():
+            # a device map makes the pipeline take "cpu" as its device without
+            # calling .to() on the weightless skeleton
+            skeleton.hf_device_map = {"": "cpu"}
+            pipe = pipeline(task, model=skeleton, tokenizer=tokenizer, **pipeline_kwargs)
+            return compile_pipeline(pipe, model_name, backend, buckets)
+
+    pipe = pipeline(task, model=model_name, model_kwargs=model_kwargs, **pipeline_kwargs)
+    return compile_pipeline(pipe, model_name, backend, buckets)
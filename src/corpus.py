@@ -0,0 +1,246 @@
+import collections
+import json
+import mmap
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+
+# -----------------------------
+# Streaming corpus reader
+# -----------------------------
+# Large transcript exports are memory-mapped, never read whole. A one-time
+# scan records the byte range of every record (a few bytes per transcript,
+# cached next to the file), so shards are just index ranges and any record
+# can be decoded on demand.
+#   - JSONL: one record per line, {"encounter_id": ..., "transcript": ...}
+#     or a bare JSON string
+#   - text: transcripts concatenated with a separator line (form feed)
+TEXT_SEPARATOR = b"\f"
+INDEX_SUFFIX = ".idx.npy"
+SCAN_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def _scan_offsets(buf, delimiter: bytes) -> np.ndarray:
+    """
+    Byte offsets of every occurrence of a one-byte delimiter, scanned in
+    chunks so only SCAN_CHUNK_BYTES of the file are touched at a time.
+    """
+    byte = np.uint8(delimiter[0])
+    found = []
+    for start in range(0, len(buf), SCAN_CHUNK_BYTES):
+        chunk = np.frombuffer(buf, dtype=np.uint8, count=min(SCAN_CHUNK_BYTES, len(buf) - start), offset=start)
+        found.append(np.flatnonzero(chunk == byte) + start)
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+def _record_ranges(buf, delimiter: bytes) -> np.ndarray:
+    """
+    (start, end) pairs of the non-blank records between delimiters.
+    """
+    cuts = _scan_offsets(buf, delimiter)
+    starts = np.concatenate([[0], cuts + 1]).astype(np.int64)
+    ends = np.concatenate([cuts, [len(buf)]]).astype(np.int64)
+    mask = ends > starts
+    # only short records can be whitespace-only (blank lines, trailing "\r\n")
+    for i in np.flatnonzero(mask & (ends - starts < 16)).tolist():
+        mask[i] = bool(buf[starts[i]:ends[i]].strip())
+    return np.stack([starts[mask], ends[mask]], axis=1)
+
+
+class TranscriptCorpus:
+    """
+    Lazily decoded view over a JSONL or concatenated-text transcript file.
+
+    Usage:
+        corpus = TranscriptCorpus("exports/encounters.jsonl")
+        len(corpus)                          # from the offset index, no parsing
+        for encounter_id, text in corpus.shard(0, 4):
+            ...
+
+    The offset index is cached in `<path>.idx.npy` and rebuilt when the
+    file size or mtime changes.
+    """
+
+    def __init__(self, path: str, fmt: Optional[str] = None, text_field: str = "transcript",
+                 id_field: str = "encounter_id", separator: bytes = TEXT_SEPARATOR,
+                 cache_index: bool = True):
+        self.path = str(path)
+        self.fmt = fmt or ("jsonl" if self.path.endswith((".jsonl", ".ndjson")) else "text")
+        if self.fmt not in ("jsonl", "text"):
+            raise ValueError(f"Unknown corpus format: {self.fmt}")
+        self.text_field = text_field
+        self.id_field = id_field
+        self.separator = separator
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap of an empty file is not allowed
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._ranges = self._load_index(cache_index)
+
+    def _load_index(self, cache_index: bool) -> np.ndarray:
+        st = os.stat(self.path)
+        stamp = np.array([[st.st_size, st.st_mtime_ns]], dtype=np.int64)
+        index_path = self.path + INDEX_SUFFIX
+        if cache_index and os.path.exists(index_path):
+            cached = np.load(index_path)
+            if len(cached) and (cached[0] == stamp[0]).all():
+                return cached[1:]
+
+        delimiter = b"\n" if self.fmt == "jsonl" else self.separator
+        ranges = _record_ranges(self._buf, delimiter)
+        if cache_index:
+            try:
+                np.save(index_path, np.concatenate([stamp, ranges]))
+            except OSError:
+                pass  # read-only location: keep the index in memory only
+        return ranges
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def _decode(self, i: int) -> Tuple[str, str]:
+        start, end = self._ranges[i]
+        raw = self._buf[int(start):int(end)]
+        if self.fmt == "text":
+            return f"{Path(self.path).stem}-{i}", raw.decode("utf-8").strip()
+
+        rec: Any = json.loads(raw)
+        if isinstance(rec, str):
+            return f"{Path(self.path).stem}-{i}", rec
+        return str(rec.get(self.id_field) or f"{Path(self.path).stem}-{i}"), rec[self.text_field]
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        if i < 0:
+            i += len(self)
+        return self._decode(i)
+
+    def iter_range(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            yield self._decode(i)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return self.iter_range()
+
+    def shard_bounds(self, index: int, count: int) -> Tuple[int, int]:
+        """
+        Contiguous record range [start, stop) of shard `index` out of `count`.
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} out of range for {count} shards")
+        n = len(self)
+        return index * n // count, (index + 1) * n // count
+
+    def shard(self, index: int, count: int) -> Iterator[Tuple[str, str]]:
+        return self.iter_range(*self.shard_bounds(index, count))
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_transcripts(paths: Iterable[str], shard: Tuple[int, int] = (0, 1),
+                     concatenated: bool = False) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (encounter_id, transcript) from a mix of inputs: .jsonl exports are
+    streamed through TranscriptCorpus, other files are one transcript each
+    (or separator-delimited transcripts with concatenated=True).
+
+    `shard=(index, count)` keeps only that slice: a contiguous range of each
+    corpus, and every count-th single-transcript file.
+    """
+    index, count = shard
+    singles = 0
+    for p in paths:
+        if concatenated or str(p).endswith((".jsonl", ".ndjson")):
+            with TranscriptCorpus(p, fmt=None if not concatenated else "text") as corpus:
+                yield from corpus.shard(index, count)
+        else:
+            if singles % count == index:
+                yield Path(p).stem, Path(p).read_text(encoding="utf-8")
+            singles += 1
+
+
+# -----------------------------
+# Backpressure
+# -----------------------------
+_DONE = object()
+
+
+def prefetch(items: Iterable[Any], max_in_flight: int = 8) -> Iterator[Any]:
+    """
+    Reads `items` on a background thread into a bounded queue. Reading and
+    decoding overlap with the consumer, but the reader blocks once
+    `max_in_flight` items are waiting, so a slow stage caps memory instead
+    of letting the queue grow.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, max_in_flight))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # gives up once the consumer has stopped, so the thread never hangs on a full queue
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as exc:  # re-raised in the consumer
+            put(exc)
+
+    thread = threading.Thread(target=reader, name="corpus-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def bounded_map(submit: Callable[[Any], Any], items: Iterable[Any],
+                max_in_flight: int) -> Iterator[Tuple[Any, Any]]:
+    """
+    Submits items to an async executor (submit(item) -> object with .get()
+    or .result()) with at most `max_in_flight` outstanding, yielding
+    (item, result) in input order. Unlike Pool.imap, which drains the whole
+    input into its task queue, the input is only pulled as results are
+    consumed.
+    """
+    pending: "collections.deque" = collections.deque()
+
+    def wait(handle):
+        return handle.get() if hasattr(handle, "get") else handle.result()
+
+    for item in items:
+        pending.append((item, submit(item)))
+        if len(pending) >= max_in_flight:
+            done_item, handle = pending.popleft()
+            yield done_item, wait(handle)
+    while pending:
+        done_item, handle = pending.popleft()
+        yield done_item, wait(handle)
@@ -0,0 +1,301 @@
+import collections
+import copy
+import hashlib
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.incremental import IncrementalPipeline, state_from_results
+from src.ner import SPACY_MODEL
+from src.pipeline import run_pipeline
+from src.preprocess import Turn, split_turns
+from src.sinks import OutputSink
+
+
+# -----------------------------
+# Fingerprints
+# -----------------------------
+# Exact duplicates: same turns after split_turns (which already normalizes
+# whitespace and quotes), so the pipeline would see identical input.
+# Near duplicates: MinHash over word 3-shingles of the lowercased turns
+# ("speaker word word ..."), bucketed by LSH bands so a lookup only
+# compares against the few transcripts sharing a band.
+#
+# 20 bands x 6 rows: pairs with Jaccard 0.8 become candidates ~99.8% of
+# the time, pairs below 0.5 rarely; candidates are then checked against
+# NEAR_DUPLICATE_THRESHOLD on the estimated similarity.
+NUM_PERM = 120
+BANDS = 20
+SHINGLE_WORDS = 3
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# largest prime below 2**32: (a * h + b) stays below 2**64 for 32-bit a, h, b
+HASH_PRIME = np.uint64(4294967291)
+
+SHINGLE_WORD = re.compile(r"[a-z0-9']+")
+
+
+def exact_key(turns: List[Turn]) -> str:
+    payload = "\n".join(f"{t.speaker}\t{t.text}" for t in turns)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def shingle_hashes(turns: List[Turn], k: int = SHINGLE_WORDS) -> np.ndarray:
+    """
+    crc32 of every k-word shingle; each turn is prefixed with its speaker
+    so the same words said by the other party count as a change.
+    """
+    words = []
+    for t in turns:
+        words.append(t.speaker.lower())
+        words.extend(SHINGLE_WORD.findall(t.text.lower()))
+    if len(words) < k:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        values = (np.outer(self.a, hashes) + self.b[:, None]) % HASH_PRIME
+        return values.min(axis=1).astype(np.uint32)
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the shingle sets.
+    """
+    return float(np.mean(sig_a == sig_b))
+
+
+# -----------------------------
+# Index
+# -----------------------------
+class DuplicateIndex:
+    """
+    Usage:
+        index = DuplicateIndex()
+        fp = index.fingerprint(split_turns(transcript))
+        kind, match, score = index.match(fp)      # "exact" / "near" / "unique"
+        index.add(item_id, fp)
+        index.remove(item_id)
+
+    Lookups touch only the transcripts sharing an LSH band with the query,
+    so they stay fast as the index grows.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, num_perm: int = NUM_PERM,
+                 bands: int = BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, seed=seed)
+
+        self._exact: Dict[str, Any] = {}
+        self._signatures: Dict[Any, np.ndarray] = {}
+        self._keys: Dict[Any, str] = {}
+        self._tables: List[Dict[bytes, List[Any]]] = [collections.defaultdict(list) for _ in range(bands)]
+        self.candidates_checked = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def fingerprint(self, turns: List[Turn]) -> Tuple[str, np.ndarray]:
+        return exact_key(turns), self.hasher.signature(shingle_hashes(turns))
+
+    def match(self, fingerprint: Tuple[str, np.ndarray]) -> Tuple[str, Optional[Any], float]:
+        """
+        ("exact", item_id, 1.0), ("near", item_id, similarity) for the most
+        similar indexed transcript above the threshold, or ("unique", None, 0.0).
+        """
+        key, signature = fingerprint
+        if key in self._exact:
+            return "exact", self._exact[key], 1.0
+
+        candidates = set()
+        for table, band in zip(self._tables, self._band_keys(signature)):
+            candidates.update(table.get(band, ()))
+        self.candidates_checked += len(candidates)
+
+        # ties go to the most recently added transcript
+        best, best_score = None, 0.0
+        for item_id in sorted(candidates, reverse=True):
+            score = similarity(signature, self._signatures[item_id])
+            if score > best_score:
+                best, best_score = item_id, score
+        if best is not None and best_score >= self.threshold:
+            return "near", best, best_score
+        return "unique", None, 0.0
+
+    def add(self, item_id: Any, fingerprint: Tuple[str, np.ndarray]) -> None:
+        key, signature = fingerprint
+        self._exact[key] = item_id
+        self._keys[item_id] = key
+        self._signatures[item_id] = signature
+        for table, band in zip(self._tables, self._band_keys(signature)):
+            table[band].append(item_id)
+
+    def remove(self, item_id: Any) -> None:
+        signature = self._signatures.pop(item_id)
+        key = self._keys.pop(item_id)
+        if self._exact.get(key) == item_id:
+            del self._exact[key]
+        for table, band in zip(self._tables, self._band_keys(signature)):
+            bucket = table[band]
+            bucket.remove(item_id)
+            if not bucket:
+                del table[band]
+
+
+# -----------------------------
+# Deduplicated batch runs
+# -----------------------------
+class DedupBatchRunner:
+    """
+    run_batch with duplicate detection in front of it.
+
+    - transcripts without a match go through run_pipeline, so their
+      outputs are exactly those of run_batch
+    - exact duplicates reuse the outputs of the earlier transcript
+    - near duplicates continue from the IncrementalPipeline state of the
+      most similar earlier transcript: sentiment / keywords / summary are
+      reused while the change stays below the incremental thresholds.
+      Matches only keep run_pipeline outputs, not per-turn NER artifacts,
+      so NER re-runs chunked over the whole near duplicate; per-turn NER
+      would cost more than that without artifacts to reuse
+
+    NER-derived fields (entities, structured summary, SOAP) of a near
+    duplicate are therefore those of run_batch; only the reused fields can
+    lag behind a small edit.
+
+    The outputs and pipeline state of the last `max_entries` processed
+    transcripts are kept; older ones drop out of the index.
+
+    `report()` gives the dedup ratios and the estimated time saved (the
+    processing time of the matched transcript minus the time spent).
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, max_entries: int = 5000,
+                 ner_backend: str = "transformer", spacy_model: Optional[str] = SPACY_MODEL,
+                 sentiment_mode: str = "transformer"):
+        self.index = DuplicateIndex(threshold=threshold)
+        self.max_entries = max_entries
+        self.pipeline_kwargs = {"ner_backend": ner_backend, "spacy_model": spacy_model,
+                                "sentiment_mode": sentiment_mode}
+        self.pipeline = IncrementalPipeline(ner_backend=ner_backend, spacy_model=spacy_model,
+                                            sentiment_mode=sentiment_mode)
+        # item id -> {"results", "state", "seconds"}, least recently used first
+        self._entries: "collections.OrderedDict[int, Dict[str, Any]]" = collections.OrderedDict()
+        self._next_id = 0
+        self._counts = {"unique": 0, "exact": 0, "near": 0}
+        self._seconds = {"fingerprint": 0.0, "processing": 0.0, "saved": 0.0}
+        self._near_summaries_reused = 0
+
+    def _remember(self, fingerprint, results: Dict[str, Any], state: Dict[str, Any], seconds: float) -> None:
+        item_id = self._next_id
+        self._next_id += 1
+        self.index.add(item_id, fingerprint)
+        self._entries[item_id] = {"results": results, "state": state, "seconds": seconds}
+        while len(self._entries) > self.max_entries:
+            old_id, _ = self._entries.popitem(last=False)
+            self.index.remove(old_id)
+
+    def process(self, transcript: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Results for one transcript and how they were obtained
+        ("unique", "exact" or "near").
+        """
+        start = time.perf_counter()
+        turns = split_turns(transcript)
+        fingerprint = self.index.fingerprint(turns)
+        kind, match, _ = self.index.match(fingerprint)
+        self._seconds["fingerprint"] += time.perf_counter() - start
+
+        if kind == "exact":
+            entry = self._entries[match]
+            self._entries.move_to_end(match)
+            results = copy.deepcopy(entry["results"])
+            elapsed = time.perf_counter() - start
+            self._counts["exact"] += 1
+            self._seconds["saved"] += max(entry["seconds"] - elapsed, 0.0)
+            return kind, results
+
+        if kind == "unique":
+            run_start = time.perf_counter()
+            results = run_pipeline(transcript, **self.pipeline_kwargs)
+            seconds = time.perf_counter() - run_start
+            self._seconds["processing"] += seconds
+            self._counts[kind] += 1
+            self._remember(fingerprint, results, state_from_results(turns, results), seconds)
+            return kind, copy.deepcopy(results)
+
+        entry = self._entries[match]
+        self._entries.move_to_end(match)
+        self.pipeline.restore(entry["state"])
+
+        run_start = time.perf_counter()
+        results = self.pipeline.run(transcript)
+        seconds = time.perf_counter() - run_start
+        self._seconds["processing"] += seconds
+        self._counts[kind] += 1
+
+        # a near duplicate is credited with the full cost of its match, so
+        # later duplicates of it count the full run they avoid as well
+        self._seconds["saved"] += max(entry["seconds"] - seconds, 0.0)
+        if "model_summary" in self.pipeline.last_report["reused"]:
+            self._near_summaries_reused += 1
+        self._remember(fingerprint, results, self.pipeline.snapshot(), max(seconds, entry["seconds"]))
+        # the cached entry (and the pipeline state) share these values
+        return kind, copy.deepcopy(results)
+
+    def run(self, transcripts: Iterable[Union[str, Tuple[str, str]]],
+            sink: Optional[OutputSink] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Like run_batch: items are transcripts or (encounter_id, transcript)
+        pairs; yields (encounter_id, results).
+        """
+        for item in transcripts:
+            if isinstance(item, tuple):
+                encounter_id, transcript = item
+            else:
+                encounter_id, transcript = None, item
+            _, results = self.process(transcript)
+            if sink is not None:
+                encounter_id = sink.write(results, encounter_id=encounter_id)
+            yield encounter_id, results
+
+        if sink is not None:
+            sink.flush()
+
+    def report(self) -> Dict[str, Any]:
+        total = sum(self._counts.values())
+        duplicates = self._counts["exact"] + self._counts["near"]
+        return {
+            "items": total,
+            "unique": self._counts["unique"],
+            "exact_duplicates": self._counts["exact"],
+            "near_duplicates": self._counts["near"],
+            "dedup_ratio": round(duplicates / total, 4) if total else 0.0,
+            "exact_ratio": round(self._counts["exact"] / total, 4) if total else 0.0,
+            "near_ratio": round(self._counts["near"] / total, 4) if total else 0.0,
+            "near_summary_reuse_ratio": (round(self._near_summaries_reused / self._counts["near"], 4)
+                                         if self._counts["near"] else None),
+            "candidates_checked": self.index.candidates_checked,
+            "fingerprint_s": round(self._seconds["fingerprint"], 3),
+            "processing_s": round(self._seconds["processing"], 3),
+            "saved_s": round(self._seconds["saved"], 3),
+        }
@@ -0,0 +1,163 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.preprocess import Turn, split_turns, group_by_speaker
+
+
+# -----------------------------
+# Shared annotated document
+# -----------------------------
+# Built once per transcript and handed to every stage, so turns, speaker
+# texts, lowercase views, sentence boundaries, word tokens and model
+# tokenizations are computed once instead of once per stage.
+#
+# Views (all derived from the turns):
+#   "text"      every turn joined, the input of NER / keywords / summary
+#   "patient"   patient turns (sentiment, intents, symptom matching)
+#   "physician" physician + doctor turns
+#   "combined"  patient + physician, used by the rule-based summary
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# a period after these is not a sentence end ("Ms. Jones")
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "approx.", "e.g.", "i.e.", "vs."}
+WORD_PATTERN = re.compile(r"[a-z][a-z'-]+")
+
+
+class ClinicalDocument:
+    """
+    Usage:
+        doc = ClinicalDocument.from_transcript(transcript)
+        doc.text, doc.lower(), doc.view("patient"), doc.sentences
+        doc.tokens("words")                          # cached word tokens
+        doc.encode(tokenizer, "text")                # cached HF tokenization
+        doc.stats()                                  # work saved by the caches
+    """
+
+    def __init__(self, turns: List[Turn]):
+        self.turns = turns
+        self.grouped = group_by_speaker(turns)
+        self._cache: Dict[Tuple[str, str], Any] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+        # turn boundaries as char offsets into the "text" view
+        self.turn_spans: List[Tuple[str, int, int]] = []
+        pos = 0
+        for t in turns:
+            self.turn_spans.append((t.speaker, pos, pos + len(t.text)))
+            pos += len(t.text) + 1
+        self.text = " ".join(t.text for t in turns)
+
+    @classmethod
+    def from_transcript(cls, transcript: str) -> "ClinicalDocument":
+        return cls(split_turns(transcript))
+
+    # -----------------------------
+    # Cache + accounting
+    # -----------------------------
+    def cached(self, kind: str, key: str, build: Callable[[], Any], chars: Optional[int] = None) -> Any:
+        """
+        Returns the cached value for (kind, key), building it on first use.
+        `chars` is the input size, counted as saved work on every reuse
+        (default: the length of a cached string).
+        """
+        counter = self._counters.setdefault(kind, {"built": 0, "reused": 0, "chars_saved": 0})
+        if (kind, key) in self._cache:
+            value = self._cache[(kind, key)]
+            counter["reused"] += 1
+            counter["chars_saved"] += chars if chars is not None else len(value) if isinstance(value, str) else 0
+            return value
+        counter["built"] += 1
+        value = self._cache[(kind, key)] = build()
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per cache kind (view, lower, tokens, encode, ...): how often it was
+        built, how often reused, and how many characters the reuses did not
+        have to copy or tokenize again.
+        """
+        totals = {"built": 0, "reused": 0, "chars_saved": 0}
+        for counter in self._counters.values():
+            for k in totals:
+                totals[k] += counter[k]
+        return {"kinds": {k: dict(v) for k, v in self._counters.items()}, "total": totals}
+
+    # -----------------------------
+    # Text views
+    # -----------------------------
+    def view(self, name: str = "text") -> str:
+        if name == "text":
+            return self.text
+
+        def build():
+            if name == "patient":
+                return self.grouped.get("Patient", "")
+            if name == "physician":
+                return self.grouped.get("Physician", "") + " " + self.grouped.get("Doctor", "")
+            if name == "combined":
+                return (self.view("patient") + " " + self.view("physician")).strip()
+            raise ValueError(f"Unknown document view: {name}")
+
+        return self.cached("view", name, build)
+
+    def lower(self, name: str = "text") -> str:
+        text = self.view(name)
+        return self.cached("lower", name, text.lower, chars=len(text))
+
+    def speaker_spans(self, speaker: str) -> List[Tuple[int, int]]:
+        return [(start, end) for s, start, end in self.turn_spans if s == speaker]
+
+    @property
+    def sentences(self) -> List[Tuple[int, int]]:
+        """
+        (start, end) offsets of the sentences in the "text" view, never
+        crossing a turn boundary.
+        """
+        def build():
+            spans = []
+            for _, start, end in self.turn_spans:
+                pos = start
+                for m in SENTENCE_END.finditer(self.text, start, end):
+                    last_word = self.text[pos:m.start()].rsplit(" ", 1)[-1].lower()
+                    if last_word in ABBREVIATIONS:
+                        continue
+                    spans.append((pos, m.start()))
+                    pos = m.end()
+                if pos < end:
+                    spans.append((pos, end))
+            return spans
+
+        return self.cached("sentences", "text", build, chars=len(self.text))
+
+    # -----------------------------
+    # Tokenizations
+    # -----------------------------
+    def tokens(self, tokenizer: str = "words", view: str = "text") -> List[str]:
+        """
+        Rule-level tokenizations. "words": lowercase word tokens, as used by
+        the frequency keywords and the lexicon tier.
+        """
+        if tokenizer != "words":
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+        text = self.lower(view)
+        return self.cached("tokens", f"{tokenizer}:{view}", lambda: WORD_PATTERN.findall(text), chars=len(text))
+
+    def encode(self, tokenizer, view: str = "text", **kwargs) -> Any:
+        """
+        Cached output of a HuggingFace tokenizer call on a view, keyed by the
+        tokenizer's name_or_path and the call kwargs.
+        """
+        text = self.view(view)
+        name = getattr(tokenizer, "name_or_path", None) or type(tokenizer).__name__
+        key = f"{name}:{view}:{sorted(kwargs.items())}"
+        return self.cached("encode", key, lambda: tokenizer(text, **kwargs), chars=len(text))
+
+    def spacy_doc(self, nlp, model_name: str, view: str = "text") -> Any:
+        text = self.view(view)
+        return self.cached("spacy", f"{model_name}:{view}", lambda: nlp(text), chars=len(text))
+
+    def annotation(self, name: str, build: Callable[[], Any]) -> Any:
+        """
+        Any other per-document result a later stage may want again
+        (e.g. gazetteer matches).
+        """
+        return self.cached("annotation", name, build, chars=len(self.text))
@@ -0,0 +1,208 @@
+import json
+import multiprocessing
+import re
+import resource
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from src.pipeline import summary_counts
+from src.sinks import loads_bytes
+
+
+# -----------------------------
+# Configurations
+# -----------------------------
+# Named run_pipeline keyword sets. Extra profiles can be passed as JSON:
+# {"name": {"ner_backend": "gazetteer", ...}, ...}
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "baseline": {"sentiment_mode": "transformer"},
+    "default": {},
+    "spacy_sm": {"spacy_model": "en_core_web_sm"},
+    "no_spacy": {"spacy_model": None},
+    "gazetteer_ner": {"ner_backend": "gazetteer"},
+    "cascade_ner": {"ner_backend": "cascade"},
+    "fast": {"ner_backend": "gazetteer", "sentiment_mode": "lexicon"},
+    "budget_800ms": {"latency_budget_ms": 800},
+}
+
+LIST_FIELDS = ["Symptoms", "Treatment"]
+ACCIDENT_FIELDS = ["Accident_Date", "Accident_Time", "Accident_Month_Reference", "Mechanism"]
+COUNT_FIELDS = ["Physio_Sessions", "Acute_Pain_Duration_Weeks", "Time_Off_Work_Days"]
+
+
+def load_annotated(path: str) -> List[Dict[str, Any]]:
+    """
+    JSONL, one encounter per line: {"id", "transcript", "expected": {...}}.
+    `expected` uses the structured summary field names, plus a "Counts"
+    object for Physio_Sessions / Acute_Pain_Duration_Weeks / Time_Off_Work_Days.
+    """
+    with open(path, "rb") as f:
+        return [loads_bytes(line) for line in f if line.strip()]
+
+
+# -----------------------------
+# Field extraction + matching
+# -----------------------------
+def normalize_term(term: str) -> str:
+    t = re.sub(r"[^a-z0-9 ]", " ", str(term).lower())
+    words = [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in t.split()]
+    return " ".join(words)
+
+
+def _as_set(value) -> Set[str]:
+    if value is None:
+        return set()
+    if isinstance(value, (list, tuple, set)):
+        return {normalize_term(v) for v in value if v}
+    return {normalize_term(value)}
+
+
+def score_field(expected, predicted) -> Dict[str, int]:
+    exp, pred = _as_set(expected), _as_set(predicted)
+    return {"tp": len(exp & pred), "fp": len(pred - exp), "fn": len(exp - pred)}
+
+
+def prf(counts: Dict[str, int]) -> Dict[str, Optional[float]]:
+    tp, fp, fn = counts["tp"], counts["fp"], counts["fn"]
+    precision = tp / (tp + fp) if tp + fp else None
+    recall = tp / (tp + fn) if tp + fn else None
+    if precision and recall:
+        f1 = 2 * precision * recall / (precision + recall)
+    elif precision is None and recall is None:
+        f1 = None
+    else:
+        f1 = 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def score_encounter(expected: Dict[str, Any], summary: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """
+    tp/fp/fn per field group: Symptoms, Diagnosis, Treatment,
+    Accident_Details (each sub-field is one item) and Counts.
+    """
+    scores = {f: score_field(expected.get(f), summary.get(f)) for f in LIST_FIELDS}
+    scores["Diagnosis"] = score_field(expected.get("Diagnosis"), summary.get("Diagnosis"))
+
+    for group, fields, predicted in [
+        ("Accident_Details", ACCIDENT_FIELDS, summary.get("Accident_Details") or {}),
+        ("Counts", COUNT_FIELDS, summary_counts(summary)),
+    ]:
+        exp_group = expected.get(group) or {}
+        total = {"tp": 0, "fp": 0, "fn": 0}
+        for f in fields:
+            e, p = exp_group.get(f), predicted.get(f)
+            if e is not None and p is not None and normalize_term(e) == normalize_term(p):
+                total["tp"] += 1
+            else:
+                total["fp"] += p is not None
+                total["fn"] += e is not None
+        scores[group] = total
+    return scores
+
+
+# -----------------------------
+# Running a configuration
+# -----------------------------
+def _run_config(config: Dict[str, Any], encounters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # runs in a fresh process so peak memory and cold start belong to this config only
+    from src.pipeline import run_pipeline
+
+    start = time.perf_counter()
+    run_pipeline(encounters[0]["transcript"], **config)  # cold start: model loading
+    cold_s = time.perf_counter() - start
+
+    latencies, totals = [], {}
+    for enc in encounters:
+        t0 = time.perf_counter()
+        results = run_pipeline(enc["transcript"], **config)
+        latencies.append(time.perf_counter() - t0)
+
+        for group, counts in score_encounter(enc["expected"], results["structured_summary"]).items():
+            agg = totals.setdefault(group, {"tp": 0, "fp": 0, "fn": 0})
+            for k in agg:
+                agg[k] += counts[k]
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # KB on Linux
+
+    return {
+        "fields": {g: prf(c) for g, c in totals.items()},
+        "cold_start_s": cold_s,
+        "latency_ms_p50": statistics.median(latencies) * 1000.0,
+        "latency_ms_mean": statistics.mean(latencies) * 1000.0,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def evaluate_configs(encounters: List[Dict[str, Any]], configs: Dict[str, Dict[str, Any]],
+                     isolate: bool = True) -> List[Dict[str, Any]]:
+    """
+    Runs every configuration over the annotated encounters and returns one
+    report per configuration. With `isolate`, each configuration runs in
+    its own spawned process.
+    """
+    reports = []
+    for name, config in configs.items():
+        if isolate:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(1) as pool:
+                report = pool.apply(_run_config, (config, encounters))
+        else:
+            report = _run_config(config, encounters)
+        report["name"] = name
+        report["config"] = config
+        reports.append(report)
+    return reports
+
+
+# -----------------------------
+# Pareto table
+# -----------------------------
+def pareto_table(reports: List[Dict[str, Any]]):
+    """
+    pandas DataFrame with one row per configuration: per-field
+    precision/recall, macro F1, latency, memory and whether the
+    configuration is on the Pareto front (no other configuration is at
+    least as accurate, as fast and as small, and strictly better in one).
+    """
+    import pandas as pd
+
+    rows = []
+    for r in reports:
+        row = {"config": r["name"]}
+        f1s = []
+        for group, m in r["fields"].items():
+            row[f"{group}_P"] = None if m["precision"] is None else round(m["precision"], 3)
+            row[f"{group}_R"] = None if m["recall"] is None else round(m["recall"], 3)
+            if m["f1"] is not None:
+                f1s.append(m["f1"])
+        row["macro_F1"] = round(sum(f1s) / len(f1s), 3) if f1s else 0.0
+        row["latency_ms_p50"] = round(r["latency_ms_p50"], 1)
+        row["peak_rss_mb"] = round(r["peak_rss_mb"], 0)
+        row["cold_start_s"] = round(r["cold_start_s"], 2)
+        rows.append(row)
+
+    def dominates(a, b):
+        no_worse = (a["macro_F1"] >= b["macro_F1"] and a["latency_ms_p50"] <= b["latency_ms_p50"]
+                    and a["peak_rss_mb"] <= b["peak_rss_mb"])
+        better = (a["macro_F1"] > b["macro_F1"] or a["latency_ms_p50"] < b["latency_ms_p50"]
+                  or a["peak_rss_mb"] < b["peak_rss_mb"])
+        return no_worse and better
+
+    for row in rows:
+        row["pareto"] = not any(dominates(other, row) for other in rows if other is not row)
+
+    return pd.DataFrame(rows).sort_values("latency_ms_p50").reset_index(drop=True)
+
+
+def load_profiles(names: List[str], extra_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    profiles = dict(PROFILES)
+    if extra_path:
+        with open(extra_path, "r", encoding="utf-8") as f:
+            profiles.update(json.load(f))
+    if not names:
+        return profiles
+    unknown = [n for n in names if n not in profiles]
+    if unknown:
+        raise ValueError(f"Unknown profiles: {unknown}. Options: {sorted(profiles)}")
+    return {n: profiles[n] for n in names}
@@ -0,0 +1,410 @@
+import json
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.models import CACHE_DIR, get_model
+from src.preprocess import is_negated
+
+
+# -----------------------------
+# Dictionary-based entity matcher
+# -----------------------------
+# Term lists (term, canonical name, category) are compiled into an
+# Aho-Corasick automaton stored as flat int32 arrays. The arrays are written
+# to a single index file and memory-mapped on load, so large vocabularies
+# cost little private memory and are shared between forked workers.
+# Matching is linear in the transcript length. The index is a build
+# artifact and lives in the cache directory, not next to the term files.
+GAZETTEER_DIR = Path(__file__).resolve().parent.parent / "data" / "gazetteer"
+GAZETTEER_INDEX = CACHE_DIR / "gazetteer" / "medical_terms.gaz"
+
+MAGIC = b"GAZ1"
+
+# gazetteer category -> structured summary bucket
+CATEGORY_BUCKETS = {
+    "symptom": "Symptoms",
+    "diagnosis": "Diagnosis",
+    "drug": "Treatment",
+    "procedure": "Treatment",
+}
+
+_ARRAYS = ["edge_start", "edge_char", "edge_target", "fail", "output", "dict_link", "entry_len"]
+
+Entry = Tuple[str, str, str]
+
+
+def _lower_same_length(text: str) -> str:
+    # a few characters lowercase to two code points; keep offsets aligned
+    lower = text.lower()
+    if len(lower) == len(text):
+        return lower
+    return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+
+class Gazetteer:
+    """
+    Aho-Corasick automaton over lowercased terms.
+
+    Node transitions are stored as sorted (edge_char, edge_target) runs
+    indexed by edge_start, and looked up by binary search. `output[node]`
+    is the entry ending at that node (-1 if none) and `dict_link[node]`
+    points to the next node on the failure chain that has an output.
+    """
+
+    def __init__(self, arrays: Dict[str, Any], entries: List[Tuple[str, str]], buffer=None,
+                 sources: Optional[List[List[Any]]] = None):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.entries = entries  # entry id -> (canonical, category)
+        self.sources = sources or []  # [path, size, mtime_ns] of the term files it was built from
+        self._buffer = buffer   # keeps the mmap alive
+        # the root is visited for almost every character, so give it a dict
+        self._root = {
+            self.edge_char[j]: self.edge_target[j]
+            for j in range(self.edge_start[0], self.edge_start[1])
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # -----------------------------
+    # Build
+    # -----------------------------
+    @classmethod
+    def build(cls, entries: Iterable[Entry]) -> "Gazetteer":
+        children: List[Dict[int, int]] = [{}]
+        output = [-1]
+        entry_len = array("i")
+        meta: List[Tuple[str, str]] = []
+
+        for term, canonical, category in entries:
+            term = _lower_same_length(term.strip())
+            if not term:
+                continue
+            node = 0
+            for ch in term:
+                c = ord(ch)
+                nxt = children[node].get(c)
+                if nxt is None:
+                    nxt = len(children)
+                    children[node][c] = nxt
+                    children.append({})
+                    output.append(-1)
+                node = nxt
+            # first definition of a term wins
+            if output[node] == -1:
+                output[node] = len(meta)
+                meta.append((canonical.strip(), category.strip()))
+                entry_len.append(len(term))
+
+        n = len(children)
+        fail = array("i", [0]) * n
+        dict_link = array("i", [-1]) * n
+
+        # BFS for failure + dictionary links
+        queue = deque(children[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in children[node].items():
+                f = fail[node]
+                while f and c not in children[f]:
+                    f = fail[f]
+                target = children[f].get(c, 0)
+                fail[child] = target if target != child else 0
+                dict_link[child] = fail[child] if output[fail[child]] >= 0 else dict_link[fail[child]]
+                queue.append(child)
+
+        edge_start = array("i", [0]) * (n + 1)
+        edge_char = array("i")
+        edge_target = array("i")
+        for node, ch_map in enumerate(children):
+            edge_start[node] = len(edge_char)
+            for c in sorted(ch_map):
+                edge_char.append(c)
+                edge_target.append(ch_map[c])
+        edge_start[n] = len(edge_char)
+
+        arrays = {
+            "edge_start": edge_start, "edge_char": edge_char, "edge_target": edge_target,
+            "fail": fail, "output": array("i", output), "dict_link": dict_link,
+            "entry_len": entry_len,
+        }
+        return cls(arrays, meta)
+
+    # -----------------------------
+    # Serialization
+    # -----------------------------
+    def save(self, path) -> None:
+        """
+        Layout: MAGIC | uint32 header length | JSON header | int32 arrays.
+        Written to a unique temp file and renamed into place, so processes
+        rebuilding the index at the same time never write the same file.
+        """
+        header = {
+            "byteorder": sys.byteorder,
+            "lengths": {name: len(getattr(self, name)) for name in _ARRAYS},
+            "entries": self.entries,
+            "sources": self.sources,
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % 4)
+
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{Path(path).name}.", suffix=".tmp", dir=Path(path).parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(len(header_bytes).to_bytes(4, "little"))
+                f.write(header_bytes)
+                for name in _ARRAYS:
+                    f.write(array("i", getattr(self, name)).tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path) -> "Gazetteer":
+        """
+        Memory-maps an index written by save(); the arrays are zero-copy
+        views into the mapping.
+        """
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if buf[:4] != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+        header_len = int.from_bytes(buf[4:8], "little")
+        header = json.loads(buf[8:8 + header_len])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built on a {header['byteorder']}-endian machine")
+
+        view = memoryview(buf)
+        offset = 8 + header_len
+        arrays = {}
+        for name in _ARRAYS:
+            size = header["lengths"][name] * 4
+            arrays[name] = view[offset:offset + size].cast("i")
+            offset += size
+
+        entries = [tuple(e) for e in header["entries"]]
+        return cls(arrays, entries, buffer=buf, sources=header.get("sources"))
+
+    # -----------------------------
+    # Matching
+    # -----------------------------
+    def _next(self, node: int, c: int) -> int:
+        if node == 0:
+            return self._root.get(c, -1)
+        lo, hi = self.edge_start[node], self.edge_start[node + 1]
+        j = bisect_left(self.edge_char, c, lo, hi)
+        if j < hi and self.edge_char[j] == c:
+            return self.edge_target[j]
+        return -1
+
+    def iter_raw_matches(self, lower: str):
+        """
+        Yields (start, end, entry_id) for every term occurrence in an
+        already lowercased text, overlaps and sub-word hits included.
+        """
+        fail, output, dict_link, entry_len = self.fail, self.output, self.dict_link, self.entry_len
+        node = 0
+        for i, ch in enumerate(lower):
+            c = ord(ch)
+            while True:
+                nxt = self._next(node, c)
+                if nxt >= 0:
+                    node = nxt
+                    break
+                if node == 0:
+                    break
+                node = fail[node]
+
+            hit = node if output[node] >= 0 else dict_link[node]
+            while hit > 0:
+                eid = output[hit]
+                yield i + 1 - entry_len[eid], i + 1, eid
+                hit = dict_link[hit]
+
+    def find(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Whole-word, leftmost-longest, non-overlapping matches.
+        """
+        lower = _lower_same_length(text)
+        n = len(lower)
+
+        candidates = []
+        for start, end, eid in self.iter_raw_matches(lower):
+            if start > 0 and lower[start - 1].isalnum():
+                continue
+            if end < n and lower[end].isalnum():
+                continue
+            candidates.append((start, -(end - start), eid))
+
+        matches = []
+        last_end = -1
+        for start, neg_len, eid in sorted(candidates):
+            if start < last_end:
+                continue
+            end = start - neg_len
+            canonical, category = self.entries[eid]
+            matches.append({
+                "text": text[start:end],
+                "start": start,
+                "end": end,
+                "canonical": canonical,
+                "category": category,
+            })
+            last_end = end
+        return matches
+
+
+# -----------------------------
+# Term files + shared instance
+# -----------------------------
+def load_term_files(directory=GAZETTEER_DIR) -> List[Entry]:
+    """
+    Reads every *.tsv in `directory`: term <TAB> canonical <TAB> category.
+    Lines starting with # are comments; a missing canonical defaults to the term.
+    """
+    entries = []
+    for path in sorted(Path(directory).glob("*.tsv")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                parts = line.rstrip("\n").split("\t")
+                term = parts[0]
+                canonical = parts[1] if len(parts) > 1 and parts[1] else term
+                category = parts[2] if len(parts) > 2 else "Other"
+                entries.append((term, canonical, category))
+    return entries
+
+
+def source_stamp(directory=GAZETTEER_DIR) -> List[List[Any]]:
+    """
+    [path, size, mtime_ns] of every term file, stored in the index so that
+    added, changed or deleted term files all trigger a rebuild.
+    """
+    stamp = []
+    for p in sorted(Path(directory).glob("*.tsv")):
+        st = p.stat()
+        stamp.append([str(p.resolve()), st.st_size, st.st_mtime_ns])
+    return stamp
+
+
+def load_gazetteer(directory=GAZETTEER_DIR, index_path=GAZETTEER_INDEX) -> Gazetteer:
+    """
+    Memory-maps the compiled index, rebuilding it first when the term files
+    differ from the ones it was built from.
+    """
+    index_path = Path(index_path)
+    stamp = source_stamp(directory)
+
+    if index_path.exists():
+        gaz = Gazetteer.load(index_path)
+        if gaz.sources == stamp:
+            return gaz
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    gaz = Gazetteer.build(load_term_files(directory))
+    gaz.sources = stamp
+    gaz.save(index_path)
+    return Gazetteer.load(index_path)
+
+
+def get_gazetteer() -> Gazetteer:
+    return get_model("gazetteer", load_gazetteer)
+
+
+# -----------------------------
+# Entity extraction
+# -----------------------------
+def extract_gazetteer_entities(text: str, symptom_text: Optional[str] = None, document=None) -> Dict[str, Any]:
+    """
+    Transformer-free entity extraction with the same output shape as
+    extract_medical_entities (Places/Organizations stay empty).
+
+    Symptoms are only taken from `symptom_text` when given (usually the
+    patient turns), so symptoms the physician merely asks about are skipped.
+    With a ClinicalDocument the full text is scanned once and the patient
+    symptoms are the matches inside patient turns.
+    """
+    gaz = get_gazetteer()
+
+    if document is not None:
+        all_matches = document.annotation("gazetteer_matches", lambda: gaz.find(document.text))
+        patient_spans = document.speaker_spans("Patient")
+        matches = [
+            m for m in all_matches
+            if m["category"].lower() != "symptom"
+            or any(start <= m["start"] and m["end"] <= end for start, end in patient_spans)
+        ]
+        return entities_from_matches(matches, document.lower())
+
+    matches = [m for m in gaz.find(text) if m["category"].lower() != "symptom" or symptom_text is None]
+    if symptom_text is not None:
+        matches += [m for m in gaz.find(symptom_text) if m["category"].lower() == "symptom"]
+
+    return entities_from_matches(matches, text.lower())
+
+
+def entities_from_matches(matches: List[Dict[str, Any]], lower_text: str) -> Dict[str, Any]:
+    """
+    Buckets gazetteer matches like extract_medical_entities, dropping
+    matches negated in `lower_text`.
+    """
+    buckets = {"Symptoms": [], "Diagnosis": [], "Treatment": []}
+    evidence = {"Symptoms": [], "Diagnosis": [], "Treatment": []}
+    other = []
+
+    for m in matches:
+        if is_negated(m["text"], lower_text):
+            continue
+
+        record = {
+            "text": m["text"],
+            "label": f"Gazetteer:{m['category']}",
+            "score": 1.0,
+            "canonical": m["canonical"],
+        }
+        bucket = CATEGORY_BUCKETS.get(m["category"].lower())
+        if bucket is None:
+            other.append(record)
+            continue
+        buckets[bucket].append(m["canonical"])
+        evidence[bucket].append(record)
+
+    return {
+        "Symptoms": sorted(set(buckets["Symptoms"])),
+        "Diagnosis_Candidates": sorted(set(buckets["Diagnosis"])),
+        "Treatments": sorted(set(buckets["Treatment"])),
+        "Places": [],
+        "Organizations": [],
+        "Evidence": evidence,
+        "Other_Model_Entities": other[:25]
+    }
+
+
+def supplement_with_gazetteer(ner_out: Dict[str, Any], gaz_out: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Adds gazetteer entities the transformer NER missed (case-insensitive),
+    keeping the NER output shape.
+    """
+    for key, ev_key in [("Symptoms", "Symptoms"), ("Diagnosis_Candidates", "Diagnosis"), ("Treatments", "Treatment")]:
+        seen = {x.lower() for x in ner_out.get(key, [])}
+        added = [x for x in gaz_out[key] if x.lower() not in seen]
+        ner_out[key] = sorted(set(ner_out.get(key, []) + added))
+
+        added_lower = {x.lower() for x in added}
+        evidence = ner_out.setdefault("Evidence", {}).setdefault(ev_key, [])
+        evidence.extend(r for r in gaz_out["Evidence"][ev_key] if r["canonical"].lower() in added_lower)
+
+    return ner_out
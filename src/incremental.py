@@ -0,0 +1,270 @@
+import difflib
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.cancel import raise_if_cancelled
+from src.document import ClinicalDocument
+from src.gazetteer import entities_from_matches, get_gazetteer, supplement_with_gazetteer
+from src.keywords import extract_keywords
+from src.ner import SPACY_MODEL, extract_spacy_entities_batch, postprocess_biomed_entities, run_biomed_ner_batch
+from src.ner_cascade import run_cascade_ner_batch
+from src.pipeline import RESULT_KEYS, build_structured_medical_json, extract_entities
+from src.preprocess import Turn, split_turns, group_by_speaker
+from src.sentiment_intent import analyze_sentiment_and_intent
+from src.soap import build_soap_note
+from src.summarizer import medical_summary_structured
+
+
+TurnKey = Tuple[str, str]
+
+# share of changed characters (since the summary/keywords were last
+# computed) above which they are regenerated
+RESUMMARIZE_THRESHOLD = 0.2
+
+
+def turn_key(turn: Turn) -> TurnKey:
+    return (turn.speaker, turn.text)
+
+
+def state_from_results(turns: List[Turn], results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    IncrementalPipeline state (see `snapshot`) for a transcript that went
+    through run_pipeline: no per-turn NER artifacts, so a later run on an
+    edited copy runs chunked NER like run_pipeline, but reuses its
+    sentiment, keywords and summary.
+    """
+    keys = [turn_key(t) for t in turns]
+    return {
+        "turn_cache": {},
+        "per_turn_ner": False,
+        "prev_keys": keys,
+        "sentiment": (group_by_speaker(turns).get("Patient", ""), results["sentiment_intent"]),
+        "summary_basis": keys,
+        "summary": {"keywords": results["keywords"], "model_summary": results["model_summary"]},
+    }
+
+
+def change_ratio(old: List[TurnKey], new: List[TurnKey]) -> float:
+    """
+    Characters in inserted, deleted or replaced turns, relative to the
+    longer of the two transcripts (0.0 = identical, 1.0 = nothing shared).
+    """
+    if not old:
+        return 1.0 if new else 0.0
+
+    matcher = difflib.SequenceMatcher(a=old, b=new, autojunk=False)
+    changed = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            changed += sum(len(t) for _, t in old[i1:i2]) + sum(len(t) for _, t in new[j1:j2])
+    total = sum(len(t) for _, t in old) + sum(len(t) for _, t in new)
+    return changed / total if total else 0.0
+
+
+class IncrementalPipeline:
+    """
+    Re-runs the pipeline after small transcript edits.
+
+    Per-turn artifacts (raw transformer NER spans, spaCy entities,
+    gazetteer hits) are cached by turn content, so after an edit only the
+    new or changed turns go through the models. Aggregation (entity
+    post-processing, structured summary, SOAP) is cheap and always redone.
+    Sentiment is reused while the patient text is unchanged. The summary
+    and keywords are regenerated only once the transcript has drifted by
+    more than `resummarize_threshold` from the version they were made for.
+
+    NER runs per turn here rather than on fixed 450-character chunks, so
+    spans near chunk borders can differ slightly from run_pipeline. The
+    new turns of a run go through the models together (batched biomedical
+    NER calls, one nlp.pipe), so a first run costs about as many model
+    calls as run_pipeline. With ner_backend="cascade" only the escalated
+    sentences of a changed turn go through the models.
+
+    After `restore` of a state without per-turn artifacts (see
+    state_from_results), NER runs on the whole transcript as in
+    run_pipeline and no turn artifacts are built; the other reuse rules
+    still apply.
+    """
+
+    def __init__(self, ner_backend: str = "transformer", spacy_model: Optional[str] = SPACY_MODEL,
+                 sentiment_mode: str = "transformer", resummarize_threshold: float = RESUMMARIZE_THRESHOLD):
+        self.ner_backend = ner_backend
+        self.spacy_model = spacy_model
+        self.sentiment_mode = sentiment_mode
+        self.resummarize_threshold = resummarize_threshold
+
+        self._turn_cache: Dict[TurnKey, Dict[str, Any]] = {}
+        self._per_turn_ner = True
+        self._prev_keys: List[TurnKey] = []
+        self._sentiment: Optional[Tuple[str, Dict[str, Any]]] = None
+        self._summary_basis: List[TurnKey] = []
+        self._summary: Optional[Dict[str, Any]] = None
+        self.last_report: Dict[str, Any] = {}
+
+    def _turn_artifacts(self, turns: List[Turn], cancel_event=None) -> List[Dict[str, Any]]:
+        """
+        Artifacts of each of `turns`, with the model calls batched across them.
+        """
+        gaz = get_gazetteer()
+        texts = [t.text for t in turns]
+        biomed: List[List[Dict[str, Any]]] = [[] for _ in turns]
+        spacy_entities: List[List[Dict[str, str]]] = [[] for _ in turns]
+        if self.ner_backend == "transformer":
+            biomed = run_biomed_ner_batch(texts, cancel_event=cancel_event)
+            raise_if_cancelled(cancel_event)
+            spacy_entities = extract_spacy_entities_batch(texts, self.spacy_model, cancel_event=cancel_event)
+        elif self.ner_backend == "cascade":
+            outputs = run_cascade_ner_batch([ClinicalDocument([t]) for t in turns], cancel_event=cancel_event,
+                                            spacy_model=self.spacy_model)
+            biomed = [raw for raw, _, _ in outputs]
+            spacy_entities = [ents for _, ents, _ in outputs]
+        return [{"gazetteer": gaz.find(text), "biomed": b, "spacy": s}
+                for text, b, s in zip(texts, biomed, spacy_entities)]
+
+    def _assemble_entities(self, turns: List[Turn], full_text: str) -> Dict[str, Any]:
+        lower = full_text.lower()
+        matches = []
+        for t in turns:
+            hits = self._turn_cache[turn_key(t)]["gazetteer"]
+            # symptoms only from what the patient says, as in extract_gazetteer_entities
+            matches += [m for m in hits if t.speaker == "Patient" or m["category"].lower() != "symptom"]
+        gaz_out = entities_from_matches(matches, lower)
+        if self.ner_backend == "gazetteer":
+            return gaz_out
+
+        raw = [ent for t in turns for ent in self._turn_cache[turn_key(t)]["biomed"]]
+        spacy_entities = [ent for t in turns for ent in self._turn_cache[turn_key(t)]["spacy"]]
+        medical = postprocess_biomed_entities(raw, full_text)
+
+        ner_out = {
+            "Symptoms": medical["Symptoms"],
+            "Diagnosis_Candidates": medical["Diagnosis_Candidates"],
+            "Treatments": medical["Treatments"],
+            "Places": sorted(set(e["text"] for e in spacy_entities if e["label"] in ["GPE", "LOC"])),
+            "Organizations": sorted(set(e["text"] for e in spacy_entities if e["label"] in ["ORG"])),
+            "Evidence": medical["Evidence"],
+            "Other_Model_Entities": medical["Other_Model_Entities"],
+        }
+        return supplement_with_gazetteer(ner_out, gaz_out)
+
+    def iter_run(self, transcript: str, cancel_event=None) -> Iterator[Tuple[str, Any, float]]:
+        """
+        Same contract as iter_pipeline (usable as a JobManager runner).
+        """
+        turns = split_turns(transcript)
+        grouped = group_by_speaker(turns)
+        full_text = " ".join([t.text for t in turns])
+        patient_text = grouped.get("Patient", "")
+        keys = [turn_key(t) for t in turns]
+
+        report = {
+            "turns": len(turns),
+            "change_ratio": round(change_ratio(self._prev_keys, keys), 4),
+            "recomputed_turns": 0,
+            "recomputed": [],
+            "reused": [],
+        }
+
+        start = time.perf_counter()
+        if not self._per_turn_ner:
+            # --- no turn artifacts: chunked NER over the whole transcript ---
+            raise_if_cancelled(cancel_event)
+            doc = ClinicalDocument.from_transcript(transcript)
+            ner_out = extract_entities(doc.text, doc.grouped.get("Patient", ""), ner_backend=self.ner_backend,
+                                       cancel_event=cancel_event, spacy_model=self.spacy_model, document=doc)
+            report["recomputed_turns"] = len(turns)
+        else:
+            # --- per-turn NER artifacts ---
+            new_turns = {}
+            for t, key in zip(turns, keys):
+                if key not in self._turn_cache:
+                    new_turns.setdefault(key, t)
+            if new_turns:
+                raise_if_cancelled(cancel_event)
+                artifacts = self._turn_artifacts(list(new_turns.values()), cancel_event=cancel_event)
+                self._turn_cache.update(zip(new_turns, artifacts))
+            report["recomputed_turns"] = len(new_turns)
+            ner_out = self._assemble_entities(turns, full_text)
+        yield "ner", ner_out, time.perf_counter() - start
+
+        # --- cheap aggregation, always redone ---
+        start = time.perf_counter()
+        structured = build_structured_medical_json(grouped, ner_out)
+        yield "structured_summary", structured, time.perf_counter() - start
+
+        start = time.perf_counter()
+        yield "soap_note", build_soap_note(structured), time.perf_counter() - start
+
+        # --- sentiment: reused while the patient text is unchanged ---
+        start = time.perf_counter()
+        if self._sentiment is None or self._sentiment[0] != patient_text:
+            raise_if_cancelled(cancel_event)
+            self._sentiment = (patient_text, analyze_sentiment_and_intent(patient_text, mode=self.sentiment_mode))
+            report["recomputed"].append("sentiment_intent")
+        else:
+            report["reused"].append("sentiment_intent")
+        yield "sentiment_intent", self._sentiment[1], time.perf_counter() - start
+
+        # --- keywords + summary: only after a large enough drift ---
+        drift = change_ratio(self._summary_basis, keys)
+        report["drift_since_summary"] = round(drift, 4)
+        if self._summary is None or drift >= self.resummarize_threshold:
+            raise_if_cancelled(cancel_event)
+            start = time.perf_counter()
+            keywords = extract_keywords(full_text)
+            yield "keywords", keywords, time.perf_counter() - start
+
+            raise_if_cancelled(cancel_event)
+            start = time.perf_counter()
+            summary = medical_summary_structured(full_text)
+            yield "model_summary", summary, time.perf_counter() - start
+
+            self._summary = {"keywords": keywords, "model_summary": summary}
+            self._summary_basis = keys
+            report["recomputed"] += ["keywords", "model_summary"]
+        else:
+            yield "keywords", self._summary["keywords"], 0.0
+            yield "model_summary", self._summary["model_summary"], 0.0
+            report["reused"] += ["keywords", "model_summary"]
+
+        # forget turns that are no longer in the transcript
+        current = set(keys)
+        self._turn_cache = {k: v for k, v in self._turn_cache.items() if k in current}
+        self._prev_keys = keys
+        self.last_report = report
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        State after the last run (cached turns, sentiment, summary and the
+        transcript it was made for). `restore` it to continue from that
+        transcript later, e.g. for a near-duplicate of it.
+        """
+        return {
+            "turn_cache": dict(self._turn_cache),
+            "per_turn_ner": self._per_turn_ner,
+            "prev_keys": list(self._prev_keys),
+            "sentiment": self._sentiment,
+            "summary_basis": list(self._summary_basis),
+            "summary": self._summary,
+        }
+
+    def restore(self, state: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Continues from a `snapshot`; with None the next run starts from scratch.
+        """
+        state = state or {}
+        self._turn_cache = dict(state.get("turn_cache", {}))
+        self._per_turn_ner = state.get("per_turn_ner", True)
+        self._prev_keys = list(state.get("prev_keys", []))
+        self._sentiment = state.get("sentiment")
+        self._summary_basis = list(state.get("summary_basis", []))
+        self._summary = state.get("summary")
+
+    def run(self, transcript: str) -> Dict[str, Any]:
+        """
+        Same result dict as run_pipeline; see `last_report` for what was reused.
+        """
+        results = {}
+        for stage, out, _ in self.iter_run(transcript):
+            results[stage] = out
+        return {k: results[k] for k in RESULT_KEYS}
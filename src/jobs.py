@@ -0,0 +1,95 @@
+import threading
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from src.cancel import PipelineCancelled
+from src.pipeline import iter_pipeline
+
+
+StageRunner = Callable[..., Iterator[Tuple[str, Any, float]]]
+
+
+@dataclass
+class PipelineJob:
+    job_id: str
+    status: str = "queued"  # queued | running | done | cancelled | failed
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "cancelled", "failed")
+
+
+class JobManager:
+    """
+    Runs pipelines in background threads and exposes per-stage progress.
+
+    Each submitted transcript gets a job id; stage outputs land in
+    `job.results` as soon as they finish, so a UI can poll and render
+    them progressively.
+
+    Only the `max_finished` most recent finished jobs are kept (older ones
+    are dropped on the next submit); `discard` drops one as soon as its
+    results have been collected.
+    """
+
+    def __init__(self, max_workers: int = 1, max_finished: int = 64):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline-job")
+        self._jobs: Dict[str, PipelineJob] = {}
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    def submit(self, transcript: str, runner: StageRunner = iter_pipeline) -> str:
+        job = PipelineJob(job_id=uuid.uuid4().hex[:12])
+        with self._lock:
+            finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+            for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+                del self._jobs[job_id]
+            self._jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job, transcript, runner)
+        return job.job_id
+
+    def get(self, job_id: Optional[str]) -> Optional[PipelineJob]:
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+
+        job.cancel_event.set()
+        # not started yet -> it will never run
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+        return True
+
+    def _run(self, job: PipelineJob, transcript: str, runner: StageRunner) -> None:
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            return
+
+        job.status = "running"
+        try:
+            for stage, out, seconds in runner(transcript, cancel_event=job.cancel_event):
+                job.results[stage] = out
+                job.timings[stage] = round(seconds, 3)
+            job.status = "done"
+        except PipelineCancelled:
+            job.status = "cancelled"
+        except Exception:
+            job.error = traceback.format_exc()
+            job.status = "failed"
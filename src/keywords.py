@@ -1,9 +1,31 @@
+import re
+from collections import Counter
 from typing import List
 from keybert import KeyBERT
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from src.models import get_model, hf_model_kwargs
+
+
+KEYWORD_MODEL = "all-MiniLM-L6-v2"
+
+
+def load_keyword_model(model_name: str = KEYWORD_MODEL) -> KeyBERT:
+    model_kwargs = hf_model_kwargs(half_precision=True)
+    if not model_kwargs:
+        return KeyBERT(model_name)
+
+    # keyword ranking only compares cosine similarities, bfloat16 embeddings are fine
+    from sentence_transformers import SentenceTransformer
+    return KeyBERT(SentenceTransformer(model_name, model_kwargs=model_kwargs))
+
+
+def get_keyword_model(model_name: str = KEYWORD_MODEL) -> KeyBERT:
+    return get_model(f"keybert:{model_name}", lambda: load_keyword_model(model_name))
 
 
 def extract_keywords(text: str, top_n: int = 12) -> List[str]:
-    kw_model = KeyBERT("all-MiniLM-L6-v2")
+    kw_model = get_keyword_model()
     keywords = kw_model.extract_keywords(
         text,
         keyphrase_ngram_range=(1, 3),
@@ -11,3 +33,25 @@ def extract_keywords(text: str, top_n: int = 12) -> List[str]:
         top_n=top_n
     )
     return [k for k, score in keywords]
+
+
+def extract_keywords_frequency(text: str, top_n: int = 12, document=None) -> List[str]:
+    """
+    Model-free fallback: most frequent 1-3 word phrases that do not start
+    or end with a stop word, longer phrases weighted up. Used when the
+    latency budget has no room for KeyBERT. `document` supplies cached
+    word tokens of `text`.
+    """
+    if document is not None:
+        words = document.tokens("words")
+    else:
+        words = re.findall(r"[a-z][a-z'-]+", text.lower())
+    counts = Counter()
+    for n in (1, 2, 3):
+        for i in range(len(words) - n + 1):
+            gram = words[i:i + n]
+            if gram[0] in ENGLISH_STOP_WORDS or gram[-1] in ENGLISH_STOP_WORDS:
+                continue
+            counts[" ".join(gram)] += n
+
+    return [k for k, _ in counts.most_common(top_n)]
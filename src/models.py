@@ -0,0 +1,282 @@
+import ctypes
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+
+# -----------------------------
+# Process-wide model registry
+# -----------------------------
+# Every stage used to call its loader on each request, paying the full
+# cold start every time. Loaders are now resolved through here once per process.
+#
+# With a memory budget the registry doubles as a residency manager: models
+# are kept in LRU order and the least recently used ones are evicted when
+# the resident total exceeds the budget. They are reloaded on next use.
+MEMORY_BUDGET_ENV = "NOTETAKER_MODEL_MEMORY_MB"
+LOW_MEMORY_ENV = "NOTETAKER_LOW_MEMORY"
+
+# on-disk cache for derived artifacts (execution plans, compiled models, ...)
+CACHE_DIR = Path(os.environ.get("NOTETAKER_CACHE_DIR", Path.home() / ".cache" / "physician-notetaker"))
+
+MB = 1024 * 1024
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of this process (Linux /proc, 0 if unavailable).
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def torch_modules(obj: Any):
+    """
+    Finds torch modules inside the objects the loaders return:
+    HF pipelines (.model), KeyBERT (.model.embedding_model), compiled
+    pipelines (.model.runner, see src/compiled.py) or bare modules.
+    """
+    try:
+        import torch
+    except ImportError:
+        return []
+
+    found, seen, todo = [], set(), [obj]
+    while todo:
+        o = todo.pop()
+        if o is None or id(o) in seen:
+            continue
+        seen.add(id(o))
+        if isinstance(o, torch.nn.Module):
+            found.append(o)
+            continue
+        for attr in ("model", "embedding_model", "runner"):
+            todo.append(getattr(o, attr, None))
+    return found
+
+
+def estimate_model_bytes(obj: Any) -> int:
+    """
+    Parameter + buffer bytes of the torch modules behind `obj`.
+    Returns 0 when nothing can be measured (e.g. spaCy pipelines),
+    in which case the registry falls back to the RSS delta of the load.
+    """
+    total = 0
+    for module in torch_modules(obj):
+        for t in list(module.parameters()) + list(module.buffers()):
+            total += t.nelement() * t.element_size()
+    return total
+
+
+def release_memory() -> None:
+    gc.collect()
+    # hand freed arenas back to the OS so eviction actually lowers RSS (glibc only)
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class ModelRegistry:
+    """
+    Shared, thread-safe model cache with optional LRU eviction under a
+    memory budget (in MB). Without a budget nothing is ever evicted.
+    """
+
+    def __init__(self, memory_budget_mb: Optional[float] = None):
+        self.memory_budget_mb = memory_budget_mb
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the instance registered under `name`, loading it with
+        `loader` on first use (or after eviction). Loading is serialized
+        per model, so different models can still load in parallel.
+        """
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                self._stats[name]["hits"] += 1
+                self._stats[name]["last_used"] = time.time()
+                return model
+
+        with self._lock_for(name):
+            with self._lock:
+                if name in self._models:
+                    self._models.move_to_end(name)
+                    return self._models[name]
+
+            rss_before = current_rss_bytes()
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            rss_delta = max(current_rss_bytes() - rss_before, 0)
+
+            resident = estimate_model_bytes(model) or rss_delta
+            with self._lock:
+                stats = self._stats.setdefault(name, {
+                    "loads": 0, "hits": 0, "evictions": 0,
+                    "resident_mb": 0.0, "peak_mb": 0.0,
+                    "load_seconds": 0.0, "last_used": None
+                })
+                stats["loads"] += 1
+                stats["resident_mb"] = round(resident / MB, 1)
+                # loading transiently needs more than the final weights
+                stats["peak_mb"] = round(max(stats["peak_mb"], resident / MB, rss_delta / MB), 1)
+                stats["load_seconds"] = round(load_seconds, 3)
+                stats["last_used"] = time.time()
+
+                self._models[name] = model
+                self._models.move_to_end(name)
+                evicted = self._evict_over_budget(keep=name)
+
+            if evicted:
+                release_memory()
+            return model
+
+    def _evict_over_budget(self, keep: str) -> list:
+        # caller holds self._lock
+        if self.memory_budget_mb is None:
+            return []
+
+        evicted = []
+        for name in list(self._models):
+            if self.resident_mb() <= self.memory_budget_mb:
+                break
+            if name == keep:
+                continue
+            self._drop(name)
+            evicted.append(name)
+        return evicted
+
+    def _drop(self, name: str) -> None:
+        self._models.pop(name, None)
+        if name in self._stats:
+            self._stats[name]["resident_mb"] = 0.0
+            self._stats[name]["evictions"] += 1
+
+    def resident_mb(self) -> float:
+        return sum(self._stats[n]["resident_mb"] for n in self._models)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def loaded(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._models)
+
+    def unload(self, name: str) -> bool:
+        with self._lock_for(name):
+            with self._lock:
+                if name not in self._models:
+                    return False
+                self._drop(name)
+        release_memory()
+        return True
+
+    def set_memory_budget(self, memory_budget_mb: Optional[float]) -> None:
+        with self._lock:
+            self.memory_budget_mb = memory_budget_mb
+            keep = next(reversed(self._models), None)
+            evicted = self._evict_over_budget(keep=keep)
+        if evicted:
+            release_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-model residency report: resident/peak MB, loads, hits,
+        evictions, plus process RSS and the configured budget.
+        """
+        with self._lock:
+            return {
+                "budget_mb": self.memory_budget_mb,
+                "resident_mb": round(self.resident_mb(), 1),
+                "process_rss_mb": round(current_rss_bytes() / MB, 1),
+                "lru_order": list(self._models),
+                "models": {n: dict(s, resident=n in self._models) for n, s in self._stats.items()},
+            }
+
+
+def _budget_from_env() -> Optional[float]:
+    value = os.environ.get(MEMORY_BUDGET_ENV)
+    return float(value) if value else None
+
+
+REGISTRY = ModelRegistry(memory_budget_mb=_budget_from_env())
+
+
+def get_model(name: str, loader: Callable[[], Any]) -> Any:
+    return REGISTRY.get(name, loader)
+
+
+def is_loaded(name: str) -> bool:
+    return REGISTRY.is_loaded(name)
+
+
+def loaded_models() -> Dict[str, Any]:
+    return REGISTRY.loaded()
+
+
+def unload_model(name: str) -> bool:
+    return REGISTRY.unload(name)
+
+
+def set_memory_budget(memory_budget_mb: Optional[float]) -> None:
+    REGISTRY.set_memory_budget(memory_budget_mb)
+
+
+def model_memory_report() -> Dict[str, Any]:
+    return REGISTRY.stats()
+
+
+# -----------------------------
+# Low-memory loading
+# -----------------------------
+_LOW_MEMORY = os.environ.get(LOW_MEMORY_ENV, "").lower() in ("1", "true", "yes")
+
+
+def set_low_memory(enabled: bool) -> None:
+    """
+    Applies to models loaded (or reloaded) after the call.
+    """
+    global _LOW_MEMORY
+    _LOW_MEMORY = enabled
+
+
+def low_memory_enabled() -> bool:
+    return _LOW_MEMORY
+
+
+def hf_model_kwargs(half_precision: bool = False) -> Dict[str, Any]:
+    """
+    Extra `model_kwargs` for transformers.pipeline in low-memory mode.
+
+    low_cpu_mem_usage avoids materializing a random-init copy of the weights,
+    and safetensors checkpoints are memory-mapped instead of read into memory.
+    `half_precision` additionally stores weights as bfloat16 on CPU; only
+    pass it for models whose outputs are not thresholded on raw scores.
+    """
+    if not _LOW_MEMORY:
+        return {}
+
+    kwargs: Dict[str, Any] = {"low_cpu_mem_usage": True}
+    if half_precision:
+        import torch
+        kwargs["torch_dtype"] = torch.bfloat16
+    return kwargs
@@ -186,10 +186,15 @@
 
 
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import spacy
 from transformers import pipeline
 
+from src.cancel import raise_if_cancelled
+from src.preprocess import is_negated
+from src.models import get_model, hf_model_kwargs
+from src.compiled import compile_backend, load_compiled_pipeline
+
 
 # -----------------------------
 # Transformer Biomedical NER
@@ -197,24 +202,43 @@ from transformers import pipeline
 # This model outputs medical entities across categories.
 # It is not perfect, but it's real NER and satisfies the requirement.
 HF_BIOMED_NER_MODEL = "d4data/biomedical-ner-all"
+SPACY_MODEL = "en_core_web_trf"
+SPACY_FAST_MODEL = "en_core_web_sm"
+
+# chunks per biomedical NER call when many short texts are batched
+NER_BATCH_SIZE = 16
 
 
-def load_spacy_model(model_name: str = "en_core_web_trf"):
+def load_spacy_model(model_name: str = SPACY_MODEL):
     return spacy.load(model_name)
 
 
+def get_spacy_model(model_name: str = SPACY_MODEL):
+    return get_model(f"spacy:{model_name}", lambda: load_spacy_model(model_name))
+
+
 def load_biomed_ner():
     """
     HuggingFace NER pipeline.
     aggregation_strategy merges sub-tokens into full entity spans.
+    Weights stay fp32 even in low-memory mode: scores are thresholded at 0.75.
+    With a compile backend set (src/compiled.py) the model runs compiled.
     """
+    if compile_backend() is not None:
+        return load_compiled_pipeline("ner", HF_BIOMED_NER_MODEL, aggregation_strategy="simple",
+                                      model_kwargs=hf_model_kwargs())
     return pipeline(
         "ner",
         model=HF_BIOMED_NER_MODEL,
-        aggregation_strategy="simple"
+        aggregation_strategy="simple",
+        model_kwargs=hf_model_kwargs()
     )
 
 
+def get_biomed_ner():
+    return get_model(HF_BIOMED_NER_MODEL, load_biomed_ner)
+
+
 def extract_dates_and_times(text: str) -> Dict[str, Any]:
     lower = text.lower()
 
@@ -327,21 +351,54 @@ def map_biomed_label_to_bucket(label: str) -> str:
 
 
 
-def extract_medical_entities(text: str) -> Dict[str, Any]:
+def run_biomed_ner(text: str, cancel_event=None) -> List[Dict[str, Any]]:
     """
-    TRUE NER:
-    - HuggingFace biomedical NER for medical concepts
-    - spaCy NER for places, orgs, dates
+    Raw transformer NER spans over `text`, chunked to stay under the
+    model's max length. Checks `cancel_event` before every chunk.
     """
-    # --- Transformer medical NER ---
-    ner_pipe = load_biomed_ner()
+    ner_pipe = get_biomed_ner()
     chunks = split_text_into_chunks(text, chunk_size=450)
     ner_results = []
     for ch in chunks:
+        raise_if_cancelled(cancel_event)
         ner_results.extend(ner_pipe(ch))
+    return ner_results
 
-    
+
+def run_biomed_ner_batch(texts: List[str], cancel_event=None, batch_size: int = NER_BATCH_SIZE,
+                         chunk_size: Optional[int] = 450) -> List[List[Dict[str, Any]]]:
+    """
+    run_biomed_ner for many short texts: the chunks of all texts go through
+    the pipeline `batch_size` at a time instead of one call per chunk.
+    With chunk_size=None the texts are already chunks and are not split.
+    Checks `cancel_event` before every batch.
+    """
+    chunks, owners = [], []
+    for i, text in enumerate(texts):
+        for ch in ([text] if chunk_size is None else split_text_into_chunks(text, chunk_size=chunk_size)):
+            chunks.append(ch)
+            owners.append(i)
+
+    results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+    if not chunks:
+        return results
+    ner_pipe = get_biomed_ner()
+    for start in range(0, len(chunks), batch_size):
+        raise_if_cancelled(cancel_event)
+        batch = chunks[start:start + batch_size]
+        for owner, spans in zip(owners[start:start + batch_size], ner_pipe(batch, batch_size=len(batch))):
+            results[owner].extend(spans)
+    return results
+
+
+def postprocess_biomed_entities(ner_results: List[Dict[str, Any]], text: str,
+                                lower_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Filters raw NER spans (subwords, low confidence, junk, negation against
+    the whole `text`) and maps them to the schema buckets.
+    """
     print(set([x["entity_group"] for x in ner_results]))
+    lower_text = text.lower() if lower_text is None else lower_text
 
     symptoms = []
     diagnosis = []
@@ -396,8 +453,7 @@ def extract_medical_entities(text: str) -> Dict[str, Any]:
         # If text contains "... no anxiety ..." or "... haven't had issues ..."
         # We drop that entity.
         # (crude but works for this assignment)
-        window_pattern = r"(no|not|never|without|haven't|hasn't|didn't)\s+(?:\w+\s+){0,3}" + re.escape(ent_text_clean.lower())
-        if re.search(window_pattern, text.lower()):
+        if is_negated(ent_text_clean, lower_text):
             continue
 
         # -----------------------
@@ -428,21 +484,74 @@ def extract_medical_entities(text: str) -> Dict[str, Any]:
     diagnosis = sorted(list(set(diagnosis)))
     treatments = sorted(list(set(treatments)))
 
+    return {
+        "Symptoms": symptoms,
+        "Diagnosis_Candidates": diagnosis,
+        "Treatments": treatments,
+        "Evidence": evidence,
+        "Other_Model_Entities": other[:25]  # just to show model richness
+    }
+
+
+def extract_spacy_entities(text: str, spacy_model: Optional[str] = SPACY_MODEL,
+                           document=None) -> List[Dict[str, str]]:
+    """
+    spaCy entities ({"text", "label"}); empty when spacy_model is None.
+    The parsed Doc is cached on `document` when given.
+    """
+    if spacy_model is None:
+        return []
+    nlp = get_spacy_model(spacy_model)
+    doc = document.spacy_doc(nlp, spacy_model) if document is not None else nlp(text)
+    return [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+
+
+def extract_spacy_entities_batch(texts: List[str], spacy_model: Optional[str] = SPACY_MODEL,
+                                 cancel_event=None) -> List[List[Dict[str, str]]]:
+    """
+    extract_spacy_entities for many texts through one nlp.pipe call;
+    empty texts are skipped.
+    """
+    results: List[List[Dict[str, str]]] = [[] for _ in texts]
+    todo = [i for i, text in enumerate(texts) if text]
+    if spacy_model is None or not todo:
+        return results
+    nlp = get_spacy_model(spacy_model)
+    for i, doc in zip(todo, nlp.pipe(texts[i] for i in todo)):
+        raise_if_cancelled(cancel_event)
+        results[i] = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+    return results
+
+
+def extract_medical_entities(text: str, cancel_event=None, spacy_model: Optional[str] = SPACY_MODEL,
+                             document=None) -> Dict[str, Any]:
+    """
+    TRUE NER:
+    - HuggingFace biomedical NER for medical concepts
+    - spaCy NER for places, orgs, dates (skipped when spacy_model is None)
+
+    If `cancel_event` is set while running, the remaining chunks are skipped
+    and PipelineCancelled is raised. `document` (a ClinicalDocument of `text`)
+    supplies the lowercase view and caches the spaCy Doc.
+    """
+    # --- Transformer medical NER ---
+    ner_results = run_biomed_ner(text, cancel_event=cancel_event)
+    lower_text = document.lower() if document is not None else None
+    medical = postprocess_biomed_entities(ner_results, text, lower_text=lower_text)
+
     # --- spaCy for non-medical entities ---
-    nlp = load_spacy_model()
-    doc = nlp(text)
+    raise_if_cancelled(cancel_event)
+    spacy_entities = extract_spacy_entities(text, spacy_model, document=document)
 
-    spacy_entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
     places = [e["text"] for e in spacy_entities if e["label"] in ["GPE", "LOC"]]
     orgs = [e["text"] for e in spacy_entities if e["label"] in ["ORG"]]
 
     return {
-        "Symptoms": symptoms,
-        "Diagnosis_Candidates": diagnosis,
-        "Treatments": treatments,
+        "Symptoms": medical["Symptoms"],
+        "Diagnosis_Candidates": medical["Diagnosis_Candidates"],
+        "Treatments": medical["Treatments"],
         "Places": sorted(list(set(places))),
         "Organizations": sorted(list(set(orgs))),
-        "Evidence": evidence,
-        "Other_Model_Entities": other[:25]  # just to show model richness
+        "Evidence": medical["Evidence"],
+        "Other_Model_Entities": medical["Other_Model_Entities"]
     }
-
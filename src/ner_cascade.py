@@ -0,0 +1,243 @@
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.cancel import raise_if_cancelled
+from src.document import ClinicalDocument
+from src.gazetteer import get_gazetteer
+from src.ner import (
+    SPACY_MODEL, get_biomed_ner, postprocess_biomed_entities, extract_spacy_entities,
+    extract_spacy_entities_batch, run_biomed_ner_batch
+)
+
+
+# -----------------------------
+# NER cascade
+# -----------------------------
+# The gazetteer/rule layer tags every sentence. The biomedical transformer
+# only re-reads the sentences the dictionary cannot vouch for:
+#   - "uncovered": clinical-looking words that no gazetteer term covers
+#     (the dictionary has no entry, so it may be missing an entity)
+#   - "context": a matched term under negation or hedging, where the
+#     dictionary cannot tell whether the mention counts
+# Everything else keeps the gazetteer result, the same one the transformer
+# path adds on top of the model output anyway.
+#
+# spaCy (places, organizations) reads the escalated sentences plus any
+# sentence with a capitalised word past its first word, i.e. a likely name.
+CLINICAL_CUES = re.compile(
+    r"\b(\w+(?:itis|algia|osis|pathy|ectomy|otomy|plasty|emia)"
+    r"|pain\w*|ache\w*|aching|hurt\w*|sore\w*|swell\w*|swollen|numb\w*|tingl\w*|dizz\w*|nause\w*"
+    r"|vomit\w*|fever\w*|injur\w*|fractur\w*|sprain\w*|strain\w*|bruis\w*|stiff\w*|tender\w*"
+    r"|inflam\w*|infect\w*|cramp\w*|spasm\w*|discomfort|symptom\w*"
+    r"|therap\w*|medicat\w*|prescri\w*|tablets?|pills?|\d+\s?mg|surger\w*|operat\w*|inject\w*"
+    r"|diagnos\w*|scans?|x-?rays?|mri)\b"
+)
+NAME_CUES = re.compile(r"(?<!^)(?<![.!?]\s)\b(?!I\b|I'[a-z]+\b)[A-Z][\w'&-]*")
+CONTEXT_CUES = re.compile(
+    r"\b(no|not|never|without|haven't|hasn't|didn't|don't|maybe|might|possibly|probably|not sure|i think)\b"
+)
+
+# escalated sentences are packed into chunks of at most this many characters
+CHUNK_CHARS = 450
+
+
+def sentence_uncertainty(lower_sentence: str, covered: List[Tuple[int, int]]) -> Optional[str]:
+    """
+    Why a sentence needs the transformer, or None when the gazetteer result
+    stands. `covered` are the gazetteer match spans, relative to the sentence.
+    """
+    for m in CLINICAL_CUES.finditer(lower_sentence):
+        if not any(start <= m.start() and m.end() <= end for start, end in covered):
+            return "uncovered"
+    if covered and CONTEXT_CUES.search(lower_sentence):
+        return "context"
+    return None
+
+
+def _pack(spans: List[Tuple[int, int]], text: str) -> List[str]:
+    chunks, current = [], ""
+    for start, end in spans:
+        sentence = text[start:end]
+        if current and len(current) + 1 + len(sentence) > CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def escalate_sentences(document: ClinicalDocument) -> Tuple[List[Tuple[int, int]], Counter]:
+    """
+    The sentences of `document` the gazetteer cannot vouch for, as (start,
+    end) offsets into document.text, and a count of the reasons.
+    """
+    gaz = get_gazetteer()
+    lower = document.lower()
+    matches = document.annotation("gazetteer_matches", lambda: gaz.find(document.text))
+
+    escalated, reasons = [], Counter()
+    for start, end in document.sentences:
+        covered = [(m["start"] - start, m["end"] - start) for m in matches if start <= m["start"] and m["end"] <= end]
+        reason = sentence_uncertainty(lower[start:end], covered)
+        if reason is not None:
+            escalated.append((start, end))
+            reasons[reason] += 1
+    return escalated, reasons
+
+
+def run_cascade_ner(document: ClinicalDocument, cancel_event=None,
+                    spacy_model: Optional[str] = SPACY_MODEL) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]], Dict[str, Any]]:
+    """
+    Raw biomedical NER spans over the escalated sentences, spaCy entities
+    over those plus the sentences with likely names, and the "Cascade"
+    report. Checks `cancel_event` before every chunk.
+    """
+    escalated, reasons = escalate_sentences(document)
+    chunks = _pack(escalated, document.text)
+    escalated_set = set(escalated)
+    spacy_spans = [(start, end) for start, end in document.sentences
+                   if (start, end) in escalated_set or NAME_CUES.search(document.text[start:end])]
+
+    raw = []
+    if chunks:
+        ner_pipe = get_biomed_ner()
+        for chunk in chunks:
+            raise_if_cancelled(cancel_event)
+            raw.extend(ner_pipe(chunk))
+
+    raise_if_cancelled(cancel_event)
+    spacy_text = " ".join(_pack(spacy_spans, document.text))
+    spacy_entities = extract_spacy_entities(spacy_text, spacy_model) if spacy_text else []
+    return raw, spacy_entities, _cascade_report(document, escalated, reasons, len(chunks), len(spacy_spans))
+
+
+def run_cascade_ner_batch(documents: List[ClinicalDocument], cancel_event=None,
+                          spacy_model: Optional[str] = SPACY_MODEL) -> List[Tuple[List[Dict[str, Any]], List[Dict[str, str]], Dict[str, Any]]]:
+    """
+    run_cascade_ner for many small documents (e.g. single turns): sentences
+    are escalated per document, but the biomedical NER and spaCy see the
+    escalated text of all documents in batched calls.
+    """
+    plans = []
+    for document in documents:
+        escalated, reasons = escalate_sentences(document)
+        escalated_set = set(escalated)
+        spacy_spans = [(start, end) for start, end in document.sentences
+                       if (start, end) in escalated_set or NAME_CUES.search(document.text[start:end])]
+        plans.append((escalated, reasons, _pack(escalated, document.text), spacy_spans))
+
+    owners = [i for i, (_, _, chunks, _) in enumerate(plans) for _ in chunks]
+    chunk_raw = run_biomed_ner_batch([c for _, _, chunks, _ in plans for c in chunks],
+                                     cancel_event=cancel_event, chunk_size=None)
+    raw: List[List[Dict[str, Any]]] = [[] for _ in documents]
+    for owner, spans in zip(owners, chunk_raw):
+        raw[owner].extend(spans)
+
+    raise_if_cancelled(cancel_event)
+    spacy_texts = [" ".join(_pack(spans, doc.text)) for doc, (_, _, _, spans) in zip(documents, plans)]
+    spacy_entities = extract_spacy_entities_batch(spacy_texts, spacy_model, cancel_event=cancel_event)
+
+    return [
+        (raw[i], spacy_entities[i], _cascade_report(doc, escalated, reasons, len(chunks), len(spans)))
+        for i, (doc, (escalated, reasons, chunks, spans)) in enumerate(zip(documents, plans))
+    ]
+
+
+def _cascade_report(document: ClinicalDocument, escalated: List[Tuple[int, int]], reasons: Counter,
+                    transformer_calls: int, spacy_sentences: int) -> Dict[str, Any]:
+    n_sentences = len(document.sentences)
+    escalated_chars = sum(end - start for start, end in escalated)
+    report = {
+        "sentences": n_sentences,
+        "escalated": len(escalated),
+        "escalation_rate": round(len(escalated) / n_sentences, 4) if n_sentences else 0.0,
+        "escalated_char_rate": round(escalated_chars / len(document.text), 4) if document.text else 0.0,
+        "transformer_calls": transformer_calls,
+        "spacy_sentences": spacy_sentences,
+        "reasons": dict(reasons),
+    }
+    return report
+
+
+def cascade_entities(document: ClinicalDocument, cancel_event=None,
+                     spacy_model: Optional[str] = SPACY_MODEL) -> Dict[str, Any]:
+    """
+    extract_medical_entities with the transformer limited to the escalated
+    sentences. The caller supplements the result with the gazetteer output,
+    as for the full transformer path. Adds a "Cascade" report.
+    """
+    raw, spacy_entities, report = run_cascade_ner(document, cancel_event=cancel_event, spacy_model=spacy_model)
+    medical = postprocess_biomed_entities(raw, document.text, lower_text=document.lower())
+    return {
+        "Symptoms": medical["Symptoms"],
+        "Diagnosis_Candidates": medical["Diagnosis_Candidates"],
+        "Treatments": medical["Treatments"],
+        "Places": sorted(set(e["text"] for e in spacy_entities if e["label"] in ["GPE", "LOC"])),
+        "Organizations": sorted(set(e["text"] for e in spacy_entities if e["label"] in ["ORG"])),
+        "Evidence": medical["Evidence"],
+        "Other_Model_Entities": medical["Other_Model_Entities"],
+        "Cascade": report,
+    }
+
+
+def _jaccard(a: List[str], b: List[str]) -> float:
+    a, b = {x.lower() for x in a}, {x.lower() for x in b}
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def _same_field(a: Any, b: Any) -> bool:
+    # entity casing depends on whether the model or the gazetteer found it
+    if isinstance(a, list) and isinstance(b, list):
+        return {str(x).lower() for x in a} == {str(x).lower() for x in b}
+    return a == b
+
+
+def evaluate_ner_cascade(transcripts: List[str], spacy_model: Optional[str] = SPACY_MODEL) -> Dict[str, Any]:
+    """
+    Runs full transformer NER and the cascade on every transcript: escalation
+    rate, entity agreement (mean Jaccard per bucket), how often the
+    structured summary fields come out identical, and latency of both.
+    """
+    from src.pipeline import build_structured_medical_json, extract_entities
+
+    buckets = ["Symptoms", "Diagnosis_Candidates", "Treatments", "Places", "Organizations"]
+    fields = ["Symptoms", "Diagnosis", "Treatment"]
+    jaccard = {b: [] for b in buckets}
+    same_field = {f: 0 for f in fields}
+    timings = {"transformer": 0.0, "cascade": 0.0}
+    sentences, escalated, chars, escalated_chars = 0, 0, 0, 0
+
+    for transcript in transcripts:
+        outputs = {}
+        for backend in ("transformer", "cascade"):
+            doc = ClinicalDocument.from_transcript(transcript)
+            patient = doc.grouped.get("Patient", "")
+            start = time.perf_counter()
+            ner_out = extract_entities(doc.text, patient, ner_backend=backend, spacy_model=spacy_model, document=doc)
+            timings[backend] += time.perf_counter() - start
+            outputs[backend] = (ner_out, build_structured_medical_json(doc.grouped, dict(ner_out), document=doc))
+
+        (full, full_summary), (cascade, cascade_summary) = outputs["transformer"], outputs["cascade"]
+        for b in buckets:
+            jaccard[b].append(_jaccard(full.get(b, []), cascade.get(b, [])))
+        for f in fields:
+            same_field[f] += int(_same_field(full_summary.get(f), cascade_summary.get(f)))
+
+        report = cascade["Cascade"]
+        sentences += report["sentences"]
+        escalated += report["escalated"]
+        chars += len(transcript)
+        escalated_chars += report["escalated_char_rate"] * len(transcript)
+
+    n = len(transcripts)
+    return {
+        "n": n,
+        "escalation_rate": round(escalated / sentences, 4) if sentences else 0.0,
+        "escalated_char_rate": round(escalated_chars / chars, 4) if chars else 0.0,
+        "entity_agreement": {b: round(sum(v) / len(v), 4) if v else None for b, v in jaccard.items()},
+        "structured_field_agreement": {f: round(v / n, 4) if n else None for f, v in same_field.items()},
+        "ms_per_transcript": {k: round(v / n * 1000, 1) if n else None for k, v in timings.items()},
+    }
@@ -1,13 +1,27 @@
 import json
 import re
-from typing import Dict, Any, Optional
-
-from src.summarizer import medical_summary_structured
-from src.preprocess import split_turns, group_by_speaker
-from src.ner import extract_medical_entities, extract_dates_and_times, extract_counts_and_durations
-from src.keywords import extract_keywords
-from src.sentiment_intent import analyze_sentiment_and_intent
+import time
+from typing import Dict, Any, List, Optional, Iterator, Iterable, Tuple, Union
+
+from src.summarizer import medical_summary_structured, get_summarizer, get_summarizer_engine
+from src.document import ClinicalDocument
+from src.ner import (
+    extract_medical_entities, extract_dates_and_times, extract_counts_and_durations,
+    get_biomed_ner, get_spacy_model, SPACY_MODEL
+)
+from src.keywords import extract_keywords, get_keyword_model
+from src.sentiment_intent import analyze_sentiment_and_intent, get_sentiment_model
 from src.soap import build_soap_note
+from src.gazetteer import extract_gazetteer_entities, supplement_with_gazetteer, get_gazetteer
+from src.ner_cascade import cascade_entities
+from src.preprocess import Turn
+from src.cancel import raise_if_cancelled
+from src.planner import stage_threads
+from src.sinks import OutputSink, OUTPUT_FILES, file_payload
+
+
+# Keys of the dict returned by run_pipeline, in the order iter_pipeline produces them.
+RESULT_KEYS = ["structured_summary", "soap_note", "sentiment_intent", "keywords", "model_summary"]
 
 
 ACCIDENT_KEYWORDS = [
@@ -48,18 +62,32 @@ def extract_patient_name(text: str) -> Optional[str]:
     return None
 
 
-def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[str, Any]) -> Dict[str, Any]:
+def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[str, Any],
+                                  document: Optional[ClinicalDocument] = None) -> Dict[str, Any]:
     """
     Creates the final structured medical JSON output based on:
     - transformer medical NER
     - rule-based extraction for dates/durations/counts
     - post-processing (negation cleanup, priority diagnosis selection)
+
+    With a ClinicalDocument the speaker texts and their lowercase views
+    come from the document instead of being rebuilt here.
     """
 
-    patient_text = grouped_text.get("Patient", "")
-    doctor_text = grouped_text.get("Physician", "") + " " + grouped_text.get("Doctor", "")
-    combined_text = (patient_text + " " + doctor_text).strip()
-    txt = combined_text.lower()
+    if document is not None:
+        patient_text = document.view("patient")
+        doctor_text = document.view("physician")
+        combined_text = document.view("combined")
+        txt = document.lower("combined")
+        patient_lower = document.lower("patient")
+        doctor_lower = document.lower("physician")
+    else:
+        patient_text = grouped_text.get("Patient", "")
+        doctor_text = grouped_text.get("Physician", "") + " " + grouped_text.get("Doctor", "")
+        combined_text = (patient_text + " " + doctor_text).strip()
+        txt = combined_text.lower()
+        patient_lower = patient_text.lower()
+        doctor_lower = doctor_text.lower()
 
     patient_name = extract_patient_name(combined_text)
     accident_case = is_accident_case(combined_text)
@@ -124,24 +152,23 @@ def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[st
     if counts.get("Physio_Sessions"):
         treatments.append(f"{counts['Physio_Sessions']} physiotherapy sessions")
 
-    # Add painkillers if mentioned (model may miss it)
-    if "painkillers" in txt:
-        treatments.append("Painkillers")
-
-    # Add common meds if mentioned
-    if "paracetamol" in txt:
-        treatments.append("Paracetamol")
-    if "ibuprofen" in txt:
-        treatments.append("Ibuprofen")
-    if "nsaids" in txt:
-        treatments.append("NSAIDs")
+    # Medications (painkillers, paracetamol, ibuprofen, ...) come from the
+    # gazetteer matches merged into ner_out, see src/gazetteer.py
 
     treatments = sorted(list(set([t.strip() for t in treatments if t and len(t.strip()) > 0])))
 
+    # drop entries already covered by a longer one ("Physiotherapy" vs "10 physiotherapy sessions"),
+    # matching whole words only ("Pain" is not covered by "Painkillers")
+    treatments = [
+        t for t in treatments
+        if not any(t.lower() != o.lower() and re.search(rf"\b{re.escape(t.lower())}\b", o.lower())
+                   for o in treatments)
+    ]
+
     # ----------------------------
     # Current status
     # ----------------------------
-    if "occasional" in patient_text.lower() and ("backache" in patient_text.lower() or "back pain" in patient_text.lower()):
+    if "occasional" in patient_lower and ("backache" in patient_lower or "back pain" in patient_lower):
         current_status = "Occasional backache"
     else:
         current_status = "Improving, intermittent discomfort"
@@ -152,7 +179,7 @@ def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[st
     prognosis = None
 
     # accident transcript prognosis pattern
-    if "full recovery" in doctor_text.lower() and "six months" in doctor_text.lower():
+    if "full recovery" in doctor_lower and "six months" in doctor_lower:
         prognosis = "Full recovery expected within six months of the accident"
 
     # generic pattern like "5 to 7 days", "6 to 8 weeks"
@@ -177,11 +204,11 @@ def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[st
     # Physical exam
     # ----------------------------
     physical_exam = None
-    if "full range of movement" in doctor_text.lower() or "full range of motion" in doctor_text.lower():
+    if "full range of movement" in doctor_lower or "full range of motion" in doctor_lower:
         physical_exam = "Full range of movement in neck and back; no tenderness; no signs of lasting damage."
-    elif "tenderness" in doctor_text.lower():
+    elif "tenderness" in doctor_lower:
         physical_exam = "Tenderness noted on exam."
-    elif "lungs sound clear" in doctor_text.lower():
+    elif "lungs sound clear" in doctor_lower:
         physical_exam = "Lungs clear on auscultation."
 
     # ----------------------------
@@ -235,45 +262,218 @@ def build_structured_medical_json(grouped_text: Dict[str, str], ner_out: Dict[st
     }
 
 
-def run_pipeline(transcript: str) -> Dict[str, Any]:
-    turns = split_turns(transcript)
-    grouped = group_by_speaker(turns)
+def summary_counts(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Recovers the rule-based counts from a structured summary
+    ("10 physiotherapy sessions", "approximately 4 weeks").
+    """
+    sessions = None
+    for t in summary.get("Treatment") or []:
+        m = re.match(r"(\d+) physiotherapy sessions", t)
+        if m:
+            sessions = int(m.group(1))
+
+    weeks = None
+    m = re.search(r"approximately (\d+) weeks", summary.get("HPI") or "")
+    if m:
+        weeks = int(m.group(1))
 
-    full_text = " ".join([t.text for t in turns])
+    return {
+        "Physio_Sessions": sessions,
+        "Acute_Pain_Duration_Weeks": weeks,
+        "Time_Off_Work_Days": (summary.get("Functional_Impact") or {}).get("Time_Off_Work_Days"),
+    }
 
-    ner_out = extract_medical_entities(full_text)
-    keywords = extract_keywords(full_text)
 
-    model_summary = medical_summary_structured(full_text)
-    sentiment_intent = analyze_sentiment_and_intent(grouped.get("Patient", ""))
+def warm_models() -> None:
+    """
+    Loads every model used by the pipeline into the shared registry,
+    so the first transcript does not pay the cold start.
+    """
+    get_biomed_ner()
+    get_spacy_model()
+    get_gazetteer()
+    get_keyword_model()
+    get_summarizer()
+    get_sentiment_model()
 
-    structured_summary = build_structured_medical_json(grouped, ner_out)
-    soap = build_soap_note(structured_summary)
 
-    return {
-        "structured_summary": structured_summary,
-        "model_summary": model_summary,
-        "keywords": keywords,
-        "sentiment_intent": sentiment_intent,
-        "soap_note": soap
-    }
+def extract_entities(full_text: str, patient_text: str, ner_backend: str = "transformer",
+                     cancel_event=None, spacy_model: Optional[str] = SPACY_MODEL,
+                     document: Optional[ClinicalDocument] = None) -> Dict[str, Any]:
+    """
+    ner_backend:
+    - "transformer": biomedical NER + spaCy, supplemented by gazetteer matches
+    - "cascade": gazetteer first, biomedical NER + spaCy only on the
+      sentences the gazetteer is unsure about (see src/ner_cascade.py)
+    - "gazetteer": dictionary matching only (fast path, no transformer)
 
+    `document` is the ClinicalDocument of the transcript, if the caller has one.
+    """
+    gaz_out = extract_gazetteer_entities(full_text, symptom_text=patient_text, document=document)
+    if ner_backend == "gazetteer":
+        return gaz_out
+    if ner_backend == "cascade":
+        doc = document or ClinicalDocument([Turn("Text", full_text)])
+        ner_out = cascade_entities(doc, cancel_event=cancel_event, spacy_model=spacy_model)
+        return supplement_with_gazetteer(ner_out, gaz_out)
+    if ner_backend != "transformer":
+        raise ValueError(f"Unknown ner_backend: {ner_backend}")
+
+    ner_out = extract_medical_entities(full_text, cancel_event=cancel_event, spacy_model=spacy_model,
+                                       document=document)
+    return supplement_with_gazetteer(ner_out, gaz_out)
+
+
+def iter_pipeline(transcript: str, cancel_event=None, ner_backend: str = "transformer",
+                  sentiment_mode: str = "transformer",
+                  spacy_model: Optional[str] = SPACY_MODEL,
+                  document: Optional[ClinicalDocument] = None) -> Iterator[Tuple[str, Any, float]]:
+    """
+    Runs the pipeline stage by stage, yielding (stage, output, seconds)
+    as soon as each stage finishes.
 
-def save_outputs(results: Dict[str, Any], out_dir: str = "outputs") -> None:
-    import os
-    os.makedirs(out_dir, exist_ok=True)
+    Stages are ordered so the cheap structured outputs come out right after
+    NER and the slow generative summary comes last. Besides the RESULT_KEYS
+    stages, an internal "ner" stage is yielded first.
 
-    with open(f"{out_dir}/medical_summary.json", "w", encoding="utf-8") as f:
-        json.dump(results["structured_summary"], f, indent=2)
+    All stages share one ClinicalDocument (segmentation, lowercase views,
+    cached tokenizations). Pass `document` to inspect document.stats()
+    afterwards; it must have been built from `transcript`.
+    """
+    doc = document or ClinicalDocument.from_transcript(transcript)
+    grouped = doc.grouped
+    full_text = doc.text
+
+    def timed(stage, fn):
+        raise_if_cancelled(cancel_event)
+        start = time.perf_counter()
+        with stage_threads(stage):
+            out = fn()
+        return stage, out, time.perf_counter() - start
+
+    ner_stage = timed("ner", lambda: extract_entities(
+        full_text, grouped.get("Patient", ""), ner_backend=ner_backend,
+        cancel_event=cancel_event, spacy_model=spacy_model, document=doc
+    ))
+    yield ner_stage
+    ner_out = ner_stage[1]
+
+    structured_stage = timed("structured_summary", lambda: build_structured_medical_json(grouped, ner_out, document=doc))
+    yield structured_stage
+    structured_summary = structured_stage[1]
+
+    yield timed("soap_note", lambda: build_soap_note(structured_summary))
+    yield timed("sentiment_intent", lambda: analyze_sentiment_and_intent(
+        grouped.get("Patient", ""), mode=sentiment_mode, document=doc
+    ))
+    yield timed("keywords", lambda: extract_keywords(full_text))
+    yield timed("model_summary", lambda: medical_summary_structured(full_text, document=doc))
+
+
+def run_pipeline(transcript: str, ner_backend: str = "transformer",
+                 sentiment_mode: str = "transformer",
+                 spacy_model: Optional[str] = SPACY_MODEL,
+                 latency_budget_ms: Optional[float] = None) -> Dict[str, Any]:
+    """
+    With `latency_budget_ms`, stages are planned around the budget and the
+    result also reports which fields are complete, degraded or pending
+    (see src/budget.py); backend choices are then made by the planner, so
+    ner_backend, sentiment_mode and spacy_model must be left at their defaults.
+    """
+    if latency_budget_ms is not None:
+        overridden = [name for name, value, default in [("ner_backend", ner_backend, "transformer"),
+                                                        ("sentiment_mode", sentiment_mode, "transformer"),
+                                                        ("spacy_model", spacy_model, SPACY_MODEL)]
+                      if value != default]
+        if overridden:
+            raise ValueError(f"{', '.join(overridden)} cannot be combined with latency_budget_ms: "
+                             f"the budget planner picks the backends")
+        from src.budget import run_pipeline_with_budget
+        return run_pipeline_with_budget(transcript, latency_budget_ms)
+
+    results = {}
+    for stage, out, _ in iter_pipeline(transcript, ner_backend=ner_backend,
+                                       sentiment_mode=sentiment_mode, spacy_model=spacy_model):
+        results[stage] = out
+
+    return {k: results[k] for k in RESULT_KEYS}
+
+
+def _run_group(group: List[Tuple[Optional[str], str]], sentiment_mode: str = "transformer") -> List[Dict[str, Any]]:
+    """
+    Every stage but the model summary per transcript, then one batched
+    summarizer call for the whole group.
+    """
+    results, documents = [], []
+    for _, transcript in group:
+        doc = ClinicalDocument.from_transcript(transcript)
+        out = {}
+        # model_summary is the last stage: stopping before it skips the call
+        for stage, value, _ in iter_pipeline(transcript, sentiment_mode=sentiment_mode, document=doc):
+            out[stage] = value
+            if stage == "keywords":
+                break
+        results.append(out)
+        documents.append(doc)
+
+    summaries = get_summarizer_engine().summarize_batch([d.text for d in documents], documents)
+    for out, summary in zip(results, summaries):
+        out["model_summary"] = summary
+    return [{k: out[k] for k in RESULT_KEYS} for out in results]
+
+
+def run_batch(transcripts: Iterable[Union[str, Tuple[str, str]]],
+              sink: Optional[OutputSink] = None,
+              summary_batch_size: int = 1,
+              sentiment_mode: str = "transformer") -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Runs the pipeline over many transcripts, streaming each result into
+    `sink` as soon as it is ready. Items are transcripts or
+    (encounter_id, transcript) pairs. Yields (encounter_id, results).
+
+    With summary_batch_size > 1, transcripts are processed in groups of that
+    size and their model summaries generated in length-bucketed batches
+    (src/summarizer.py); results then arrive one group at a time.
+    """
+    group: List[Tuple[Optional[str], str]] = []
 
-    with open(f"{out_dir}/model_summary.json", "w", encoding="utf-8") as f:
-        json.dump(results["model_summary"], f, indent=2)
+    def emit(items, outputs):
+        for (encounter_id, _), results in zip(items, outputs):
+            if sink is not None:
+                encounter_id = sink.write(results, encounter_id=encounter_id)
+            yield encounter_id, results
+
+    for item in transcripts:
+        if isinstance(item, tuple):
+            encounter_id, transcript = item
+        else:
+            encounter_id, transcript = None, item
+
+        if summary_batch_size <= 1:
+            yield from emit([(encounter_id, transcript)], [run_pipeline(transcript, sentiment_mode=sentiment_mode)])
+            continue
+
+        group.append((encounter_id, transcript))
+        if len(group) >= summary_batch_size:
+            yield from emit(group, _run_group(group, sentiment_mode))
+            group = []
+
+    if group:
+        yield from emit(group, _run_group(group, sentiment_mode))
+
+    if sink is not None:
+        sink.flush()
 
-    with open(f"{out_dir}/sentiment_intent.json", "w", encoding="utf-8") as f:
-        json.dump(results["sentiment_intent"], f, indent=2)
 
-    with open(f"{out_dir}/soap_note.json", "w", encoding="utf-8") as f:
-        json.dump(results["soap_note"], f, indent=2)
+def save_outputs(results: Dict[str, Any], out_dir: str = "outputs") -> None:
+    """
+    Writes the five pretty-printed JSON files of a single run into `out_dir`.
+    For batch jobs use an OutputSink from src/sinks.py instead.
+    """
+    import os
+    os.makedirs(out_dir, exist_ok=True)
 
-    with open(f"{out_dir}/keywords.json", "w", encoding="utf-8") as f:
-        json.dump({"keywords": results["keywords"]}, f, indent=2)
+    for key, file_name in OUTPUT_FILES.items():
+        with open(f"{out_dir}/{file_name}", "w", encoding="utf-8") as f:
+            json.dump(file_payload(key, results[key]), f, indent=2)
@@ -0,0 +1,305 @@
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from src.models import CACHE_DIR
+
+
+# -----------------------------
+# CPU-topology-aware execution planner
+# -----------------------------
+# Several worker processes that each run torch with its default thread pool
+# (one thread per logical CPU) oversubscribe the machine badly. The planner
+# looks at the CPUs this process may actually use (affinity mask, cgroup
+# quota, NUMA nodes) and splits them into workers x threads, pinning each
+# worker to its own cores on one NUMA node.
+PLAN_PATH = CACHE_DIR / "execution_plan.json"
+
+# share of a transcript's CPU time and the thread count beyond which the
+# stage stops scaling (autoregressive decoding and short sentiment inputs
+# are dominated by small matmuls)
+STAGE_PROFILE = {
+    "ner": {"cost": 0.35, "max_threads": 8},
+    "sentiment_intent": {"cost": 0.05, "max_threads": 2},
+    "keywords": {"cost": 0.10, "max_threads": 4},
+    "model_summary": {"cost": 0.50, "max_threads": 4},
+}
+
+
+def _parse_cpulist(text: str) -> List[int]:
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """
+    CPU limit of the container in cores (cgroup v2 cpu.max or v1 cfs quota),
+    None when unlimited.
+    """
+    v2 = _read("/sys/fs/cgroup/cpu.max")
+    if v2:
+        quota, period = v2.split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def detect_cpu_topology() -> Dict[str, Any]:
+    """
+    Logical CPUs usable by this process, grouped by NUMA node, with their
+    physical core ids (to tell SMT siblings apart) and the cgroup quota.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+
+    numa_nodes: Dict[int, List[int]] = {}
+    for node_dir in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        cpulist = _read(os.path.join(node_dir, "cpulist"))
+        if cpulist:
+            node_cpus = [c for c in _parse_cpulist(cpulist) if c in available]
+            if node_cpus:
+                numa_nodes[int(node_dir.rsplit("node", 1)[1])] = node_cpus
+    if not numa_nodes:
+        numa_nodes = {0: available}
+
+    core_of = {}
+    for cpu in available:
+        package = _read(f"/sys/devices/system/cpu/cpu{cpu}/topology/physical_package_id") or "0"
+        core = _read(f"/sys/devices/system/cpu/cpu{cpu}/topology/core_id") or str(cpu)
+        core_of[cpu] = f"{package}:{core}"
+
+    quota = cgroup_cpu_quota()
+    usable = len(available)
+    if quota is not None:
+        usable = max(1, min(usable, math.floor(quota)))
+
+    return {
+        "available_cpus": available,
+        "numa_nodes": numa_nodes,
+        "physical_cores": len(set(core_of.values())),
+        "core_of": core_of,
+        "cgroup_quota_cpus": quota,
+        "usable_cpus": usable,
+    }
+
+
+@dataclass
+class ExecutionPlan:
+    workers: int
+    threads_per_worker: int
+    interop_threads: int = 1
+    stage_threads: Dict[str, int] = field(default_factory=dict)
+    affinity: List[List[int]] = field(default_factory=list)  # per worker; empty = no pinning
+    source: str = "heuristic"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "ExecutionPlan":
+        return cls(**d)
+
+
+def _assign_affinity(topology: Dict[str, Any], workers: int, threads: int) -> List[List[int]]:
+    """
+    Gives each worker `threads` CPUs from a single NUMA node, taking one
+    logical CPU per physical core before using SMT siblings.
+    """
+    core_of = topology["core_of"]
+    node_slots = []
+    for node_cpus in topology["numa_nodes"].values():
+        first, siblings, seen = [], [], set()
+        for cpu in node_cpus:
+            (siblings if core_of[cpu] in seen else first).append(cpu)
+            seen.add(core_of[cpu])
+        ordered = first + siblings
+        node_slots.append([ordered[i:i + threads] for i in range(0, len(ordered) - threads + 1, threads)])
+
+    # round-robin over nodes so workers spread evenly
+    slots = []
+    for i in range(max((len(s) for s in node_slots), default=0)):
+        slots.extend(s[i] for s in node_slots if i < len(s))
+
+    if len(slots) < workers:
+        return []  # cannot pin cleanly (e.g. cgroup quota below the affinity mask)
+    return slots[:workers]
+
+
+def plan_execution(topology: Optional[Dict[str, Any]] = None, mode: str = "throughput",
+                   threads_per_worker: Optional[int] = None) -> ExecutionPlan:
+    """
+    mode "throughput": many small workers (batch jobs, the pre-fork server);
+    mode "latency": one worker using all usable cores (interactive use).
+    """
+    topology = topology or detect_cpu_topology()
+    usable = topology["usable_cpus"]
+    physical = min(topology["physical_cores"], usable)
+
+    if mode == "latency":
+        threads = threads_per_worker or max(1, physical)
+        workers = 1
+    elif mode == "throughput":
+        # 2 threads per worker keeps NER matmuls efficient without starving parallelism
+        threads = threads_per_worker or (2 if physical >= 8 else 1)
+        workers = max(1, physical // threads)
+    else:
+        raise ValueError(f"Unknown planning mode: {mode}")
+
+    stage_threads = {
+        stage: max(1, min(threads, profile["max_threads"]))
+        for stage, profile in STAGE_PROFILE.items()
+    }
+
+    return ExecutionPlan(
+        workers=workers,
+        threads_per_worker=threads,
+        interop_threads=1,
+        stage_threads=stage_threads,
+        affinity=_assign_affinity(topology, workers, threads),
+    )
+
+
+# -----------------------------
+# Applying a plan
+# -----------------------------
+_ACTIVE_PLAN: Optional[ExecutionPlan] = None
+_THREADS_LOCK = threading.Lock()
+
+
+def apply_plan(plan: ExecutionPlan, worker_index: int = 0) -> None:
+    """
+    Configures the calling process as worker `worker_index` of the plan:
+    CPU affinity, torch intra/inter-op threads and the OpenMP/MKL env of
+    any children. Call it early, before torch runs anything.
+    """
+    global _ACTIVE_PLAN
+    _ACTIVE_PLAN = plan
+
+    if plan.affinity and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, plan.affinity[worker_index % len(plan.affinity)])
+
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(plan.threads_per_worker)
+
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(plan.threads_per_worker)
+    try:
+        torch.set_num_interop_threads(plan.interop_threads)
+    except RuntimeError:
+        pass  # already set, or parallel work has started in this process
+
+
+@contextmanager
+def stage_threads(stage: str):
+    """
+    Runs a pipeline stage with the plan's torch thread count for it.
+    torch threads are process-wide, so only use this around stages that
+    run one at a time (iter_pipeline), not concurrent ones.
+    """
+    plan = _ACTIVE_PLAN
+    n = plan.stage_threads.get(stage) if plan is not None else None
+    if n is None:
+        yield
+        return
+
+    try:
+        import torch
+    except ImportError:
+        yield
+        return
+
+    with _THREADS_LOCK:
+        previous = torch.get_num_threads()
+        torch.set_num_threads(n)
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous)
+
+
+def active_plan() -> Optional[ExecutionPlan]:
+    return _ACTIVE_PLAN
+
+
+def save_plan(plan: ExecutionPlan, path=PLAN_PATH) -> None:
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan.to_dict(), f, indent=2)
+
+
+def load_plan(path=PLAN_PATH) -> Optional[ExecutionPlan]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return ExecutionPlan.from_dict(json.load(f))
+
+
+# -----------------------------
+# Auto-tune
+# -----------------------------
+def candidate_plans(topology: Dict[str, Any]) -> List[ExecutionPlan]:
+    usable = min(topology["physical_cores"], topology["usable_cpus"])
+    threads_options = sorted({t for t in (1, 2, 4, 8, usable) if 1 <= t <= usable})
+    return [plan_execution(topology, threads_per_worker=t) for t in threads_options]
+
+
+def autotune(transcripts: List[str], topology: Optional[Dict[str, Any]] = None,
+             save: bool = True, path=PLAN_PATH) -> ExecutionPlan:
+    """
+    Benchmarks a few workers x threads layouts on `transcripts` with the
+    pre-fork server and keeps the one with the best throughput.
+    """
+    from src.server import PreforkServer
+
+    topology = topology or detect_cpu_topology()
+    best, best_rate = None, -1.0
+    for plan in candidate_plans(topology):
+        with PreforkServer(plan=plan) as server:
+            # one task per worker first so lazy initialization stays out of the timing
+            list(server.map(transcripts[:plan.workers]))
+            start = time.perf_counter()
+            for _ in server.map(transcripts):
+                pass
+            rate = len(transcripts) / (time.perf_counter() - start)
+
+        print(f"[autotune] {plan.workers} workers x {plan.threads_per_worker} threads: {rate:.2f} transcripts/s")
+        if rate > best_rate:
+            best, best_rate = plan, rate
+
+    best.source = f"autotune ({best_rate:.2f} transcripts/s)"
+    if save:
+        save_plan(best, path)
+    return best
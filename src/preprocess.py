@@ -45,6 +45,15 @@ def split_turns(transcript: str) -> List[Turn]:
     return turns
 
 
+def is_negated(term: str, lower_text: str) -> bool:
+    """
+    Crude negation check: the term appears within three words after
+    a negation cue, e.g. "no anxiety" or "haven't had any issues".
+    """
+    window_pattern = r"(no|not|never|without|haven't|hasn't|didn't)\s+(?:\w+\s+){0,3}" + re.escape(term.lower())
+    return re.search(window_pattern, lower_text) is not None
+
+
 def group_by_speaker(turns: List[Turn]) -> Dict[str, str]:
     grouped = {}
     for t in turns:
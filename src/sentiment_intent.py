@@ -1,10 +1,23 @@
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from transformers import pipeline
 
+from src.models import get_model, hf_model_kwargs
+from src.compiled import compile_backend, load_compiled_pipeline
+
+
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+
 
 def load_sentiment_model():
-    return pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+    # fp32 even in low-memory mode: map_sentiment thresholds the raw score
+    if compile_backend() is not None:
+        return load_compiled_pipeline("sentiment-analysis", SENTIMENT_MODEL, model_kwargs=hf_model_kwargs())
+    return pipeline("sentiment-analysis", model=SENTIMENT_MODEL, model_kwargs=hf_model_kwargs())
+
+
+def get_sentiment_model():
+    return get_model(SENTIMENT_MODEL, load_sentiment_model)
 
 
 def map_sentiment(label: str, score: float) -> str:
@@ -22,8 +35,8 @@ def map_sentiment(label: str, score: float) -> str:
     return "Reassured"
 
 
-def detect_intents(patient_text: str) -> List[str]:
-    t = patient_text.lower()
+def detect_intents(patient_text: str, lower_text: Optional[str] = None) -> List[str]:
+    t = patient_text.lower() if lower_text is None else lower_text
     intents = []
 
     if re.search(r"\b(worried|concerned|need to worry|affect me)\b", t):
@@ -44,15 +57,140 @@ def detect_intents(patient_text: str) -> List[str]:
     return sorted(list(set(intents)))
 
 
-def analyze_sentiment_and_intent(patient_text: str) -> Dict[str, Any]:
-    model = load_sentiment_model()
-    pred = model(patient_text[:1200])[0]  # keep it short for speed
+# -----------------------------
+# Lexicon tier
+# -----------------------------
+# (pattern, weight). Clear cues only; anything subtle is left to DistilBERT.
+ANXIETY_CUES = [
+    (r"\b(worried|worrying|worries)\b", 1.0),
+    (r"\b(scared|afraid|frightened|terrified)\b", 1.0),
+    (r"\b(anxious|nervous|panicking|panic)\b", 1.0),
+    (r"\b(concerned|concerning)\b", 0.8),
+    (r"\b(getting worse|worse than before|unbearable|terrible|awful)\b", 1.0),
+    (r"\b(can't sleep|cannot sleep|really bad)\b", 0.7),
+    (r"\bwhat if\b", 0.6),
+]
+
+REASSURANCE_CUES = [
+    (r"\b((?<!pain )relief|relieved|reassuring|reassured)\b", 1.0),  # not "pain relief" (a treatment)
+    (r"\b(good to hear|great to hear|glad to hear|that's great|that's good)\b", 1.0),
+    (r"\b(thank you|thanks|appreciate)\b", 0.6),
+    (r"\b(doing better|feeling better|much better|improving|improved)\b", 0.8),
+    (r"\b(back to (my )?(usual|normal)( routine)?)\b", 0.8),
+]
+
+NEGATION_BEFORE = r"(?:\b(?:not|no|don't|do not|didn't|never|nothing to|isn't|wasn't)\s+(?:\w+\s+){0,2})$"
+
+# the lexicon decides only with at least this many cues and this polarity
+LEXICON_MIN_CUES = 2
+LEXICON_MIN_CONFIDENCE = 0.6
+
+
+def lexicon_sentiment(patient_text: str, lower_text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Weighted cue scorer. A negated anxiety cue ("don't feel nervous",
+    "not worried") counts half towards reassurance.
+
+    Returns label (POSITIVE / NEGATIVE / None when undecided), confidence
+    in [0, 1] and the matched cues.
+    """
+    t = patient_text.lower() if lower_text is None else lower_text
+    pos, neg, cues = 0.0, 0.0, []
+
+    for pattern, weight in ANXIETY_CUES:
+        for m in re.finditer(pattern, t):
+            if re.search(NEGATION_BEFORE, t[max(0, m.start() - 40):m.start()]):
+                pos += weight * 0.5
+                cues.append(f"not {m.group(0)}")
+            else:
+                neg += weight
+                cues.append(m.group(0))
+
+    for pattern, weight in REASSURANCE_CUES:
+        for m in re.finditer(pattern, t):
+            if re.search(NEGATION_BEFORE, t[max(0, m.start() - 40):m.start()]):
+                continue
+            pos += weight
+            cues.append(m.group(0))
+
+    total = pos + neg
+    # +1 smooths away decisions on a single weak cue
+    confidence = abs(pos - neg) / (total + 1.0)
+    label = None
+    if len(cues) >= LEXICON_MIN_CUES and confidence >= LEXICON_MIN_CONFIDENCE:
+        label = "POSITIVE" if pos > neg else "NEGATIVE"
+
+    return {"label": label, "score": round(confidence, 4), "cues": cues}
+
+
+def transformer_sentiment(patient_text: str) -> Dict[str, Any]:
+    model = get_sentiment_model()
+    return model(patient_text[:1200])[0]  # keep it short for speed
 
-    sentiment = map_sentiment(pred["label"], pred["score"])
-    intents = detect_intents(patient_text)
+
+def analyze_sentiment_and_intent(patient_text: str, mode: str = "transformer", document=None) -> Dict[str, Any]:
+    """
+    mode:
+    - "transformer": always DistilBERT (default)
+    - "cascade": lexicon decides clear cases, DistilBERT only for the rest
+    - "lexicon": never DistilBERT; undecided inputs are Neutral
+
+    With a ClinicalDocument, the lowercase patient view is shared with the
+    other stages instead of recomputed.
+    """
+    if mode not in ("cascade", "transformer", "lexicon"):
+        raise ValueError(f"Unknown sentiment mode: {mode}")
+    lower_text = document.lower("patient") if document is not None else patient_text.lower()
+
+    pred, tier = None, "transformer"
+    if mode != "transformer":
+        lex = lexicon_sentiment(patient_text, lower_text=lower_text)
+        if lex["label"] is not None or mode == "lexicon":
+            pred, tier = lex, "lexicon"
+
+    if pred is None:
+        pred = transformer_sentiment(patient_text)
+
+    if pred["label"] is None:
+        sentiment = "Neutral"
+    else:
+        sentiment = map_sentiment(pred["label"], 1.0 if tier == "lexicon" else pred["score"])
+    intents = detect_intents(patient_text, lower_text=lower_text)
 
     return {
         "Sentiment": sentiment,
         "Sentiment_Model": pred,
+        "Sentiment_Tier": tier,
         "Intent": intents
     }
+
+
+def evaluate_sentiment_cascade(texts: List[str]) -> Dict[str, Any]:
+    """
+    Compares the cascade against the full-model baseline on `texts`:
+    how often the transformer still runs, and how often both agree.
+    """
+    model = get_sentiment_model()
+    baseline = [map_sentiment(p["label"], p["score"]) for p in model([t[:1200] for t in texts])]
+
+    lexicon_decided, agree, lexicon_agree = 0, 0, 0
+    for text, base in zip(texts, baseline):
+        lex = lexicon_sentiment(text)
+        if lex["label"] is None:
+            # uncertain band -> the cascade would have run the same transformer call
+            agree += 1
+            continue
+        lexicon_decided += 1
+        cascade = map_sentiment(lex["label"], 1.0)
+        if cascade == base:
+            agree += 1
+            lexicon_agree += 1
+
+    n = len(texts)
+    return {
+        "n": n,
+        "transformer_calls": n - lexicon_decided,
+        "transformer_call_rate": round((n - lexicon_decided) / n, 4) if n else 0.0,
+        "agreement_with_full_model": round(agree / n, 4) if n else 0.0,
+        "lexicon_tier_agreement": round(lexicon_agree / lexicon_decided, 4) if lexicon_decided else None,
+    }
@@ -0,0 +1,163 @@
+import functools
+import gc
+import multiprocessing
+import os
+import shutil
+import warnings
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from src.models import estimate_model_bytes, loaded_models, release_memory, torch_modules
+from src.planner import ExecutionPlan, apply_plan
+from src.pipeline import run_pipeline, warm_models
+
+
+# -----------------------------
+# Pre-fork worker server
+# -----------------------------
+# The parent loads and warms every model once, then forks the workers.
+# Forked children share the parent's pages copy-on-write, so model weights
+# that are only read are stored once instead of once per worker.
+# Moving the weights into /dev/shm (share_memory=True) is opt-in: it copies
+# every tensor there, and container /dev/shm is often small (64 MB in Docker).
+SHM_PATH = "/dev/shm"
+# free /dev/shm must exceed the weights by this factor before they are moved
+SHM_HEADROOM = 1.2
+WARMUP_TRANSCRIPT = (
+    "Physician: Good morning, how are you feeling today? "
+    "Patient: I still have some neck pain and took painkillers after the accident."
+)
+
+
+def share_model_weights(shm_path: str = SHM_PATH) -> int:
+    """
+    Moves the tensors of every loaded torch model into shared memory.
+
+    Copy-on-write alone already shares untouched weight pages, but anything
+    that writes near them (allocator metadata, lazily initialized buffers)
+    would copy the page into the worker. Shared-memory storages are mapped
+    MAP_SHARED and are never copied. Returns the number of modules moved;
+    0 (with a warning) when `shm_path` has too little free space, since
+    torch would fail with a bus error halfway through the copy.
+    """
+    models = loaded_models()
+    needed = sum(estimate_model_bytes(model) for model in models.values())
+    try:
+        free = shutil.disk_usage(shm_path).free
+    except OSError:
+        free = 0
+    if needed * SHM_HEADROOM > free:
+        warnings.warn(f"{shm_path} has {free / 2 ** 20:.0f} MB free, model weights need "
+                      f"{needed / 2 ** 20:.0f} MB: keeping copy-on-write sharing only",
+                      RuntimeWarning, stacklevel=2)
+        return 0
+
+    n = 0
+    for model in models.values():
+        for module in torch_modules(model):
+            module.share_memory()
+            n += 1
+    return n
+
+
+def _init_worker(torch_threads: int, plan: Optional[Dict[str, Any]], counter) -> None:
+    if plan is not None:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        apply_plan(ExecutionPlan.from_dict(plan), worker_index=index)
+        return
+
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+
+def _run_in_worker(transcript: str, sentiment_mode: str = "transformer") -> Dict[str, Any]:
+    return run_pipeline(transcript, sentiment_mode=sentiment_mode)
+
+
+class PreforkServer:
+    """
+    Process pool whose workers inherit already-loaded models from the parent.
+
+    Usage:
+        with PreforkServer(workers=4) as server:
+            for results in server.map(transcripts):
+                ...
+
+    Needs the "fork" start method (Linux). torch_threads is the intra-op
+    thread count per worker; 1 avoids oversubscribing the cores. With an
+    ExecutionPlan (src/planner.py), worker count, threads and CPU
+    affinity come from the plan instead.
+
+    Workers share the weights copy-on-write (with gc.freeze so the collector
+    does not touch the parent's objects). share_memory=True additionally
+    moves them into /dev/shm first, if it has room for them.
+    """
+
+    def __init__(self, workers: Optional[int] = None, torch_threads: int = 1, share_memory: bool = False,
+                 plan: Optional[ExecutionPlan] = None, sentiment_mode: str = "transformer"):
+        self.plan = plan
+        self.sentiment_mode = sentiment_mode
+        self.workers = plan.workers if plan is not None else (workers or os.cpu_count() or 1)
+        self.torch_threads = plan.threads_per_worker if plan is not None else torch_threads
+        self.share_memory = share_memory
+        self._pool = None
+
+    def start(self) -> "PreforkServer":
+        if self._pool is not None:
+            return self
+
+        # 1) load + warm once in the parent (first call initializes lazy buffers)
+        warm_models()
+        run_pipeline(WARMUP_TRANSCRIPT)
+
+        # 2) free what we can before the address space is duplicated
+        if self.share_memory:
+            share_model_weights()
+        release_memory()
+        # objects that exist now are never collected in the children, so the GC
+        # does not write to their headers and un-share the pages they live on
+        gc.freeze()
+
+        # 3) fork workers
+        ctx = multiprocessing.get_context("fork")
+        plan = self.plan.to_dict() if self.plan is not None else None
+        self._pool = ctx.Pool(self.workers, initializer=_init_worker,
+                              initargs=(self.torch_threads, plan, ctx.Value("i", 0)))
+        return self
+
+    def worker_pids(self) -> List[int]:
+        if self._pool is None:
+            return []
+        return [p.pid for p in self._pool._pool]
+
+    def submit(self, transcript: str):
+        """
+        Returns a multiprocessing AsyncResult; call .get() for the results dict.
+        """
+        self.start()
+        return self._pool.apply_async(_run_in_worker, (transcript, self.sentiment_mode))
+
+    def map(self, transcripts: Iterable[str], chunksize: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        Results are yielded in input order.
+        """
+        self.start()
+        run = functools.partial(_run_in_worker, sentiment_mode=self.sentiment_mode)
+        return self._pool.imap(run, transcripts, chunksize=chunksize)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        gc.unfreeze()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
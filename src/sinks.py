@@ -0,0 +1,331 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # optional fast serializer
+    orjson = None
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+# result key -> file name, shared by save_outputs and the directory sink
+OUTPUT_FILES = {
+    "structured_summary": "medical_summary.json",
+    "model_summary": "model_summary.json",
+    "sentiment_intent": "sentiment_intent.json",
+    "soap_note": "soap_note.json",
+    "keywords": "keywords.json",
+}
+
+
+def file_payload(key: str, value: Any) -> Any:
+    # keywords.json has always wrapped the list in an object
+    if key == "keywords":
+        return {"keywords": value}
+    return value
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    Compact JSON serialization; uses orjson when installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads_bytes(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _fsync_dir(path: str) -> None:
+    # make renames durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class OutputSink:
+    """
+    Base class for pipeline output sinks.
+
+    Records are buffered in memory and committed in bulk on flush(), either
+    when `buffer_size` records are pending or when the sink is closed. The
+    Parquet and directory sinks commit atomically (rename into place); a
+    crash during a JSONL append can leave a truncated last line, which
+    read_jsonl skips.
+    """
+
+    def __init__(self, buffer_size: int = 256):
+        self.buffer_size = buffer_size
+        self._buffer: List[Tuple[str, Dict[str, Any]]] = []
+        self.records_written = 0
+
+    def write(self, results: Dict[str, Any], encounter_id: Optional[str] = None) -> str:
+        encounter_id = encounter_id or uuid.uuid4().hex
+        self._buffer.append((encounter_id, results))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        return encounter_id
+
+    def write_many(self, items: Iterable[Union[Dict[str, Any], Tuple[str, Dict[str, Any]]]]) -> int:
+        """
+        Streams results into the sink. Items are either result dicts or
+        (encounter_id, results) pairs.
+        """
+        n = 0
+        for item in items:
+            if isinstance(item, tuple):
+                self.write(item[1], encounter_id=item[0])
+            else:
+                self.write(item)
+            n += 1
+        return n
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        self._commit(batch)
+        self.records_written += len(batch)
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JsonlSink(OutputSink):
+    """
+    Append-only JSON Lines file, one encounter per line:
+    {"encounter_id": ..., "results": {...}}
+
+    A batch is serialized up front and appended with a single write + fsync.
+    With compression="gzip" every batch is its own gzip member; concatenated
+    members are still a valid .gz file. read_jsonl recognizes gzip by its
+    magic bytes, so the file name need not end in .gz.
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None, buffer_size: int = 256):
+        super().__init__(buffer_size=buffer_size)
+        if compression not in (None, "gzip"):
+            raise ValueError(f"Unsupported compression for JSONL: {compression}")
+        self.path = path
+        self.compression = compression
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        data = b"".join(
+            dumps_bytes({"encounter_id": eid, "results": res}) + b"\n" for eid, res in batch
+        )
+        if self.compression == "gzip":
+            data = gzip.compress(data, compresslevel=6)
+
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_jsonl(path: str) -> Iterable[Tuple[str, Dict[str, Any]]]:
+    """
+    Reads back a JsonlSink file (plain or gzip), yielding (encounter_id, results).
+    A last record cut off by a crash mid-append is skipped.
+    """
+    with open(path, "rb") as f:
+        opener = gzip.open if f.read(2) == GZIP_MAGIC else open
+    with opener(path, "rb") as f:
+        lines = iter(f)
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            except EOFError:  # gzip member cut off mid-write
+                return
+            if not line.endswith(b"\n"):  # partial last line
+                return
+            if line.strip():
+                rec = loads_bytes(line)
+                yield rec["encounter_id"], rec["results"]
+
+
+def flatten_structured_summary(encounter_id: str, results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One flat row per encounter with the structured summary fields.
+    List fields stay lists (Parquet list columns); Evidence is left out.
+    """
+    s = results.get("structured_summary", {})
+    accident = s.get("Accident_Details") or {}
+    impact = s.get("Functional_Impact") or {}
+    sentiment = results.get("sentiment_intent") or {}
+
+    return {
+        "encounter_id": encounter_id,
+        "Patient_Name": s.get("Patient_Name"),
+        "Accident_Date": accident.get("Accident_Date"),
+        "Accident_Time": accident.get("Accident_Time"),
+        "Accident_Month_Reference": accident.get("Accident_Month_Reference"),
+        "Mechanism": accident.get("Mechanism"),
+        "Symptoms": list(s.get("Symptoms") or []),
+        "Diagnosis": s.get("Diagnosis"),
+        "Treatment": list(s.get("Treatment") or []),
+        "Current_Status": s.get("Current_Status"),
+        "Prognosis": s.get("Prognosis"),
+        "Time_Off_Work_Days": impact.get("Time_Off_Work_Days"),
+        "Daily_Life_Impact": impact.get("Daily_Life_Impact"),
+        "HPI": s.get("HPI"),
+        "Physical_Exam": s.get("Physical_Exam"),
+        "Sentiment": sentiment.get("Sentiment"),
+        "Intent": list(sentiment.get("Intent") or []),
+        "Keywords": list(results.get("keywords") or []),
+    }
+
+
+class ParquetSink(OutputSink):
+    """
+    Columnar sink for the structured summary fields.
+
+    Every flush writes one part file (part-00000.parquet, part-00001.parquet, ...)
+    into `directory`; the whole directory can be read back with
+    pandas.read_parquet(directory). Needs pyarrow.
+    """
+
+    def __init__(self, directory: str, compression: Optional[str] = "zstd", buffer_size: int = 5000):
+        super().__init__(buffer_size=buffer_size)
+        self.directory = directory
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+        self._part = len([f for f in os.listdir(directory) if f.endswith(".parquet")])
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        import pandas as pd
+
+        df = pd.DataFrame([flatten_structured_summary(eid, res) for eid, res in batch])
+        final_path = os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+        tmp_path = os.path.join(self.directory, f".part-{self._part:05d}.parquet.tmp")
+
+        df.to_parquet(tmp_path, engine="pyarrow", compression=self.compression, index=False)
+        os.replace(tmp_path, final_path)
+        _fsync_dir(self.directory)
+        self._part += 1
+
+
+def encounter_dirname(encounter_id: str) -> str:
+    """
+    Directory name for an encounter id: the id itself when it is a plain
+    name, otherwise the id with unsafe characters replaced plus a short
+    hash of the original (so "a/b" and "a_b" don't collide and ".." can't
+    escape the sink root).
+    """
+    cleaned = UNSAFE_NAME_CHARS.sub("_", encounter_id).lstrip(".")
+    if cleaned == encounter_id and cleaned:
+        return cleaned
+    digest = hashlib.blake2b(encounter_id.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{cleaned[:64]}-{digest}" if cleaned else digest
+
+
+class DirectorySink(OutputSink):
+    """
+    One directory per encounter, holding the same five files as save_outputs:
+    <root>/<encounter_dirname(encounter_id)>/medical_summary.json, ...
+
+    Files are written into a temporary directory that is renamed into place,
+    so an encounter directory is either complete or absent. A previous
+    version is renamed aside first and removed after the swap.
+    """
+
+    def __init__(self, root: str, compression: Optional[str] = None, indent: Optional[int] = None,
+                 buffer_size: int = 1):
+        super().__init__(buffer_size=buffer_size)
+        if compression not in (None, "gzip"):
+            raise ValueError(f"Unsupported compression for directory sink: {compression}")
+        self.root = root
+        self.compression = compression
+        self.indent = indent
+        os.makedirs(root, exist_ok=True)
+
+    def _commit(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        for eid, res in batch:
+            name = encounter_dirname(eid)
+            tmp_dir = tempfile.mkdtemp(prefix=f".{name}.", dir=self.root)
+            try:
+                for key, file_name in OUTPUT_FILES.items():
+                    if key not in res:
+                        continue
+                    payload = file_payload(key, res[key])
+                    if self.indent is None:
+                        data = dumps_bytes(payload)
+                    else:
+                        data = json.dumps(payload, indent=self.indent).encode("utf-8")
+
+                    if self.compression == "gzip":
+                        with gzip.open(os.path.join(tmp_dir, file_name + ".gz"), "wb") as f:
+                            f.write(data)
+                    else:
+                        with open(os.path.join(tmp_dir, file_name), "wb") as f:
+                            f.write(data)
+
+                final_dir = os.path.join(self.root, name)
+                old_dir = None
+                if os.path.isdir(final_dir):
+                    old_dir = f"{tmp_dir}.old"
+                    os.replace(final_dir, old_dir)
+                try:
+                    os.replace(tmp_dir, final_dir)
+                except Exception:
+                    if old_dir is not None:
+                        os.replace(old_dir, final_dir)
+                    raise
+                if old_dir is not None:
+                    shutil.rmtree(old_dir, ignore_errors=True)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+        _fsync_dir(self.root)
+
+
+SINKS = {
+    "jsonl": JsonlSink,
+    "parquet": ParquetSink,
+    "dir": DirectorySink,
+}
+
+
+def make_sink(kind: str, path: str, **kwargs) -> OutputSink:
+    """
+    Factory used by the CLI: kind is one of "jsonl", "parquet", "dir", "store".
+    """
+    if kind == "store":
+        # imported lazily: the store depends on numpy and on this module
+        from src.store import StoreSink
+        return StoreSink(path, **kwargs)
+    if kind not in SINKS:
+        raise ValueError(f"Unknown sink '{kind}'. Options: {sorted(SINKS)}")
+    return SINKS[kind](path, **kwargs)
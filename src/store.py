@@ -0,0 +1,343 @@
+import datetime as dt
+import os
+import re
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.pipeline import summary_counts
+from src.sinks import OutputSink, dumps_bytes, loads_bytes
+
+
+# -----------------------------
+# Indexed encounter store
+# -----------------------------
+# Ingests run_pipeline results and answers structured queries without
+# re-parsing JSON:
+# - inverted indexes (term -> sorted encounter ids) over Symptoms,
+#   Diagnosis, Treatment and keywords
+# - columnar numeric fields (counts, encounter date, accident month/day)
+# Full results are kept in an append-only JSONL file with an offset column,
+# so get() is a single seek.
+INDEXED_FIELDS = ["symptoms", "diagnosis", "treatment", "keywords"]
+NUMERIC_FIELDS = [
+    "Physio_Sessions", "Acute_Pain_Duration_Weeks", "Time_Off_Work_Days",
+    "Encounter_Date", "Accident_Month", "Accident_Day",
+]
+
+MONTHS = {m: i for i, m in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july",
+     "august", "september", "october", "november", "december"], start=1)}
+MONTHS["sept"] = 9
+
+OPS = {
+    "=": np.equal, "==": np.equal, "!=": np.not_equal,
+    ">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+}
+
+DateLike = Union[str, dt.date, dt.datetime]
+
+
+def normalize_term(term: str) -> str:
+    return re.sub(r"\s+", " ", str(term).strip().lower())
+
+
+def to_ordinal(value: Optional[DateLike]) -> float:
+    if value is None:
+        return float("nan")
+    if isinstance(value, str):
+        value = dt.date.fromisoformat(value[:10])
+    if isinstance(value, dt.datetime):
+        value = value.date()
+    return float(value.toordinal())
+
+
+def _save_npy(path: str, arr: np.ndarray) -> None:
+    # write + rename: a loaded store may still hold an mmap of the old file
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def _accident_month_day(accident: Dict[str, Any]) -> Tuple[float, float]:
+    m = re.match(r"([A-Za-z]+)\s+(\d{1,2})", accident.get("Accident_Date") or "")
+    if not m or m.group(1).lower() not in MONTHS:
+        return float("nan"), float("nan")
+    return float(MONTHS[m.group(1).lower()]), float(m.group(2))
+
+
+def encounter_terms(results: Dict[str, Any]) -> Dict[str, List[str]]:
+    s = results.get("structured_summary") or {}
+    return {
+        "symptoms": list(s.get("Symptoms") or []),
+        "diagnosis": [s["Diagnosis"]] if s.get("Diagnosis") else [],
+        "treatment": list(s.get("Treatment") or []),
+        "keywords": list(results.get("keywords") or []),
+    }
+
+
+def encounter_numbers(results: Dict[str, Any], encounter_date: Optional[DateLike]) -> Dict[str, float]:
+    s = results.get("structured_summary") or {}
+    counts = summary_counts(s)
+    month, day = _accident_month_day(s.get("Accident_Details") or {})
+    row = {k: float("nan") if counts[k] is None else float(counts[k]) for k in counts}
+    row.update({"Encounter_Date": to_ordinal(encounter_date), "Accident_Month": month, "Accident_Day": day})
+    return row
+
+
+class EncounterStore:
+    """
+    Usage:
+        store = EncounterStore("outputs/store")
+        store.ingest(results, encounter_id="enc-1", encounter_date="2026-09-14")
+        ids = store.query(diagnosis="Whiplash injury", where={"Physio_Sessions": (">", 5)})
+        store.save()
+
+    `directory=None` keeps everything in memory (no get()).
+    """
+
+    def __init__(self, directory: Optional[str] = None, store_documents: bool = True):
+        self.directory = directory
+        self.store_documents = store_documents and directory is not None
+        self.encounter_ids: List[str] = []
+        self._postings: Dict[str, Dict[str, Any]] = {f: {} for f in INDEXED_FIELDS}
+        self._columns: Dict[str, Any] = {f: array("d") for f in NUMERIC_FIELDS}
+        self._doc_offsets = array("q")
+        self._docs_file = None
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(os.path.join(directory, "manifest.json")):
+                self._load()
+
+    def __len__(self) -> int:
+        return len(self.encounter_ids)
+
+    # -----------------------------
+    # Ingest
+    # -----------------------------
+    def _docs(self):
+        if self._docs_file is None:
+            self._docs_file = open(os.path.join(self.directory, "documents.jsonl"), "ab")
+        return self._docs_file
+
+    def _add_posting(self, field: str, term: str, doc: int) -> None:
+        postings = self._postings[field]
+        ids = postings.get(term)
+        if ids is None:
+            ids = postings[term] = array("I")
+        elif not isinstance(ids, array):
+            # loaded from disk as a read-only view; copy on first append
+            ids = postings[term] = array("I", ids.tolist())
+        if not ids or ids[-1] != doc:
+            ids.append(doc)
+
+    def ingest(self, results: Dict[str, Any], encounter_id: Optional[str] = None,
+               encounter_date: Optional[DateLike] = None) -> int:
+        """
+        Adds one run_pipeline result. `encounter_date` defaults to today.
+        Returns the internal row id.
+        """
+        doc = len(self.encounter_ids)
+        self.encounter_ids.append(encounter_id or str(doc))
+
+        for field, terms in encounter_terms(results).items():
+            for term in terms:
+                self._add_posting(field, normalize_term(term), doc)
+
+        for field, value in encounter_numbers(results, encounter_date or dt.date.today()).items():
+            self._columns[field].append(value)
+
+        if self.store_documents:
+            f = self._docs()
+            self._doc_offsets.append(f.tell())
+            f.write(dumps_bytes(results) + b"\n")
+        return doc
+
+    def ingest_many(self, items: Iterable[Tuple[str, Dict[str, Any]]],
+                    encounter_date: Optional[DateLike] = None) -> int:
+        n = 0
+        for encounter_id, results in items:
+            self.ingest(results, encounter_id=encounter_id, encounter_date=encounter_date)
+            n += 1
+        return n
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def _posting(self, field: str, term: str) -> np.ndarray:
+        ids = self._postings[field].get(normalize_term(term))
+        if ids is None:
+            return np.empty(0, dtype=np.uint32)
+        return np.frombuffer(ids, dtype=np.uint32) if isinstance(ids, array) else ids
+
+    def column(self, field: str) -> np.ndarray:
+        col = self._columns[field]
+        return np.frombuffer(col, dtype=np.float64) if isinstance(col, array) else col
+
+    def query(self, symptoms: Union[str, List[str], None] = None,
+              diagnosis: Union[str, List[str], None] = None,
+              treatment: Union[str, List[str], None] = None,
+              keywords: Union[str, List[str], None] = None,
+              mentions: Union[str, List[str], None] = None,
+              where: Optional[Dict[str, Tuple[str, float]]] = None,
+              encounter_date: Optional[Tuple[Optional[DateLike], Optional[DateLike]]] = None,
+              limit: Optional[int] = None) -> np.ndarray:
+        """
+        Row ids matching every filter (AND). List values require all terms.
+
+        - symptoms / diagnosis / treatment / keywords: exact (case-insensitive) terms
+        - mentions: term found in any of the indexed fields
+        - where: {"Physio_Sessions": (">", 5), ...} on the numeric columns
+        - encounter_date: (start, end) inclusive; either side may be None
+        """
+        postings: List[np.ndarray] = []
+        for field, value in [("symptoms", symptoms), ("diagnosis", diagnosis),
+                             ("treatment", treatment), ("keywords", keywords)]:
+            for term in [value] if isinstance(value, str) else (value or []):
+                postings.append(self._posting(field, term))
+
+        for term in [mentions] if isinstance(mentions, str) else (mentions or []):
+            any_field = [self._posting(f, term) for f in INDEXED_FIELDS]
+            postings.append(np.unique(np.concatenate(any_field)))
+
+        if postings:
+            # intersect smallest first
+            postings.sort(key=len)
+            ids = postings[0]
+            for p in postings[1:]:
+                if not len(ids):
+                    break
+                ids = np.intersect1d(ids, p, assume_unique=True)
+            mask_ids = ids.astype(np.int64)
+        else:
+            mask_ids = None
+
+        conditions = list((where or {}).items())
+        if encounter_date is not None:
+            start, end = encounter_date
+            if start is not None:
+                conditions.append(("Encounter_Date", (">=", to_ordinal(start))))
+            if end is not None:
+                conditions.append(("Encounter_Date", ("<=", to_ordinal(end))))
+
+        for field, (op, value) in conditions:
+            if op not in OPS:
+                raise ValueError(f"Unsupported operator: {op}")
+            col = self.column(field)
+            if mask_ids is None:
+                # full column scan (vectorized); NaN never matches
+                mask_ids = np.flatnonzero(OPS[op](col, value))
+            else:
+                mask_ids = mask_ids[OPS[op](col[mask_ids], value)]
+
+        if mask_ids is None:
+            mask_ids = np.arange(len(self.encounter_ids))
+        return mask_ids[:limit] if limit is not None else mask_ids
+
+    def ids(self, rows: np.ndarray) -> List[str]:
+        return [self.encounter_ids[i] for i in rows]
+
+    def get(self, row: int) -> Dict[str, Any]:
+        if not self.store_documents:
+            raise RuntimeError("This store does not keep documents")
+        if self._docs_file is not None:
+            self._docs_file.flush()
+        with open(os.path.join(self.directory, "documents.jsonl"), "rb") as f:
+            f.seek(int(self._doc_offsets[row]))
+            return loads_bytes(f.readline())
+
+    def terms(self, field: str) -> Dict[str, int]:
+        """
+        Term -> document frequency for an indexed field.
+        """
+        return {t: len(ids) for t, ids in self._postings[field].items()}
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def save(self) -> None:
+        """
+        Writes ids, columns and postings as .npy files (postings concatenated
+        per field, with a term -> (start, end) map) plus a manifest.
+        """
+        if self.directory is None:
+            raise RuntimeError("In-memory store; pass a directory to save")
+        if self._docs_file is not None:
+            self._docs_file.flush()
+
+        d = self.directory
+        _save_npy(os.path.join(d, "doc_offsets.npy"), np.asarray(self._doc_offsets, dtype=np.int64))
+        for field in NUMERIC_FIELDS:
+            _save_npy(os.path.join(d, f"col_{field}.npy"), np.asarray(self.column(field)))
+
+        term_ranges = {}
+        for field in INDEXED_FIELDS:
+            ranges, parts, pos = {}, [], 0
+            for term, ids in self._postings[field].items():
+                ids = np.asarray(ids, dtype=np.uint32)
+                ranges[term] = [pos, pos + len(ids)]
+                parts.append(ids)
+                pos += len(ids)
+            flat = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+            _save_npy(os.path.join(d, f"postings_{field}.npy"), flat)
+            term_ranges[field] = ranges
+
+        manifest = {
+            "version": 1,
+            "count": len(self.encounter_ids),
+            "encounter_ids": self.encounter_ids,
+            "term_ranges": term_ranges,
+            "store_documents": self.store_documents,
+        }
+        tmp = os.path.join(d, "manifest.json.tmp")
+        with open(tmp, "wb") as f:
+            f.write(dumps_bytes(manifest))
+        os.replace(tmp, os.path.join(d, "manifest.json"))
+
+    def _load(self) -> None:
+        d = self.directory
+        with open(os.path.join(d, "manifest.json"), "rb") as f:
+            manifest = loads_bytes(f.read())
+
+        self.encounter_ids = list(manifest["encounter_ids"])
+        self.store_documents = manifest.get("store_documents", True)
+        self._doc_offsets = array("q", np.load(os.path.join(d, "doc_offsets.npy")).tolist())
+        for field in NUMERIC_FIELDS:
+            self._columns[field] = array("d", np.load(os.path.join(d, f"col_{field}.npy")).tobytes())
+
+        for field in INDEXED_FIELDS:
+            flat = np.load(os.path.join(d, f"postings_{field}.npy"), mmap_mode="r")
+            self._postings[field] = {
+                term: flat[start:end] for term, (start, end) in manifest["term_ranges"][field].items()
+            }
+
+    def close(self) -> None:
+        if self._docs_file is not None:
+            self._docs_file.close()
+            self._docs_file = None
+
+
+class StoreSink(OutputSink):
+    """
+    Streams batch results into an EncounterStore. Indexes are rewritten once
+    on close(), not per batch.
+    """
+
+    def __init__(self, directory: str, buffer_size: int = 1000, compression: Optional[str] = None,
+                 encounter_date: Optional[DateLike] = None):
+        super().__init__(buffer_size=buffer_size)
+        if compression is not None:
+            raise ValueError("The encounter store does not support compression")
+        self.store = EncounterStore(directory)
+        self.encounter_date = encounter_date
+
+    def _commit(self, batch) -> None:
+        self.store.ingest_many(batch, encounter_date=self.encounter_date)
+
+    def close(self) -> None:
+        super().close()
+        self.store.save()
+        self.store.close()
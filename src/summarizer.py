@@ -1,15 +1,32 @@
-from typing import Dict, Any
-from transformers import pipeline
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from transformers import pipeline, StoppingCriteria, StoppingCriteriaList
 
+from src.models import get_model, hf_model_kwargs
 
-def load_summarizer(model_name: str = "google/flan-t5-base"):
-    return pipeline("text2text-generation", model=model_name)
 
+SUMMARIZER_MODEL = "google/flan-t5-base"
 
-def medical_summary_structured(transcript: str) -> Dict[str, Any]:
-    summarizer = load_summarizer()
 
-    prompt = f"""
+def load_summarizer(model_name: str = SUMMARIZER_MODEL):
+    # generation is robust to bfloat16 storage, so low-memory mode halves the weights
+    return pipeline("text2text-generation", model=model_name, model_kwargs=hf_model_kwargs(half_precision=True))
+
+
+def get_summarizer(model_name: str = SUMMARIZER_MODEL):
+    return get_model(model_name, lambda: load_summarizer(model_name))
+
+
+# -----------------------------
+# Generation engine
+# -----------------------------
+# The prompt is split around the transcript once and its token ids cached,
+# so a call only tokenizes the transcript itself (or takes it from a
+# ClinicalDocument). Batches are formed from transcripts of similar token
+# length so padding stays small, max_new_tokens follows the input size,
+# and a sequence stops as soon as every required section is in its output.
+SUMMARY_PROMPT = """
 Write a short clinical summary (5-7 lines) of this physician-patient transcript.
 Include:
 - Accident details
@@ -23,6 +40,252 @@ Transcript:
 {transcript}
 """
 
-    out = summarizer(prompt, max_new_tokens=220, do_sample=False)[0]["generated_text"]
+# section -> cue that shows the summary already covers it
+SECTION_CUES = {
+    "Accident details": r"\b(accident|collision|crash|injur)",
+    "Symptoms": r"\b(pain|symptom|ache|stiff|discomfort)",
+    "Diagnosis": r"\b(diagnos|whiplash|strain|sprain|injury)",
+    "Treatment": r"\b(treat|physiotherap|session|painkiller|medication)",
+    "Current status": r"\b(current|now|occasional|improv|better)",
+    "Prognosis": r"\b(prognos|recover|expected|outlook)",
+}
+# accident details are not in every transcript
+REQUIRED_SECTIONS = ["Symptoms", "Diagnosis", "Treatment", "Current status", "Prognosis"]
+
+MAX_NEW_TOKENS = 220
+MIN_NEW_TOKENS = 64
+# extra summary tokens allowed per input token, on top of MIN_NEW_TOKENS
+NEW_TOKENS_PER_INPUT_TOKEN = 0.25
+
+
+def adaptive_max_new_tokens(input_tokens: int, min_new_tokens: int = MIN_NEW_TOKENS,
+                            max_new_tokens: int = MAX_NEW_TOKENS,
+                            per_input_token: float = NEW_TOKENS_PER_INPUT_TOKEN) -> int:
+    return int(min(max_new_tokens, min_new_tokens + per_input_token * input_tokens))
+
+
+class SectionStopper(StoppingCriteria):
+    """
+    Per-sequence stopping criterion: a sequence is done once its decoded
+    text matches every required section cue and ends with a full sentence,
+    or once it reaches its own entry in `max_new_tokens` (a batch shares one
+    generate() limit, rows keep their adaptive one). Also timestamps the
+    first generated token (TTFT).
+    """
+
+    def __init__(self, tokenizer, required_sections: List[str], check_every: int = 8, enabled: bool = True,
+                 max_new_tokens: Optional[List[int]] = None):
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.patterns = [re.compile(SECTION_CUES[s], re.IGNORECASE) for s in required_sections]
+        self.check_every = check_every
+        self.enabled = enabled and bool(self.patterns)
+        self.first_token_time: Optional[float] = None
+        self.stopped = None
+        self.section_stops = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        if self.stopped is None:
+            self.stopped = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+        # decoder ids start with the decoder start token
+        step = input_ids.shape[1] - 1
+        if self.max_new_tokens is not None:
+            for row, limit in enumerate(self.max_new_tokens):
+                if step >= limit:
+                    self.stopped[row] = True
+        if self.enabled and step % self.check_every == 0:
+            for row in range(input_ids.shape[0]):
+                if self.stopped[row]:
+                    continue
+                text = self.tokenizer.decode(input_ids[row], skip_special_tokens=True).rstrip()
+                if text.endswith((".", "!", "?")) and all(p.search(text) for p in self.patterns):
+                    self.stopped[row] = True
+                    self.section_stops += 1
+        return self.stopped.clone()
+
+
+class SummarizerEngine:
+    """
+    Batched flan-t5 summaries.
+
+    Usage:
+        engine = get_summarizer_engine()
+        summaries = engine.summarize_batch(transcripts)   # [{"Model_Summary_Text": ...}, ...]
+        engine.last_stats                                  # tokens/s, TTFT, padding, ...
+
+    batch_size caps sequences per generate() call, max_batch_tokens caps
+    batch_size x longest input so long transcripts get smaller batches.
+    """
+
+    def __init__(self, model_name: str = SUMMARIZER_MODEL, batch_size: int = 8, max_batch_tokens: int = 8192,
+                 required_sections: Optional[List[str]] = None, early_stopping: bool = True,
+                 max_new_tokens: int = MAX_NEW_TOKENS, min_new_tokens: int = MIN_NEW_TOKENS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.required_sections = REQUIRED_SECTIONS if required_sections is None else required_sections
+        self.early_stopping = early_stopping
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        self._template_ids: Optional[Tuple[List[int], List[int]]] = None
+        self.last_stats: Dict[str, Any] = {}
+
+    def template_ids(self, tokenizer) -> Tuple[List[int], List[int]]:
+        """
+        Token ids of the prompt before and after the transcript, tokenized once.
+        """
+        if self._template_ids is None:
+            prefix, suffix = SUMMARY_PROMPT.split("{transcript}")
+            self._template_ids = (
+                tokenizer(prefix, add_special_tokens=False)["input_ids"],
+                tokenizer(suffix, add_special_tokens=False)["input_ids"],
+            )
+        return self._template_ids
+
+    def encode_prompt(self, tokenizer, transcript: str, document=None) -> List[int]:
+        prefix, suffix = self.template_ids(tokenizer)
+        if document is not None:
+            body = document.encode(tokenizer, "text", add_special_tokens=False)["input_ids"]
+        else:
+            body = tokenizer(transcript, add_special_tokens=False)["input_ids"]
+        return tokenizer.build_inputs_with_special_tokens(prefix + body + suffix)
+
+    def buckets(self, lengths: List[int]) -> List[List[int]]:
+        """
+        Groups item indices of similar length: sorted by length, cut when
+        the batch is full or would exceed max_batch_tokens once padded.
+        """
+        batches, current = [], []
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            longest = lengths[i]  # sorted ascending: the newcomer is the longest
+            if current and (len(current) >= self.batch_size or (len(current) + 1) * longest > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _generate(self, summarizer, prompts: List[List[int]]) -> Tuple[List[str], Dict[str, Any]]:
+        import torch
+
+        model, tokenizer = summarizer.model, summarizer.tokenizer
+        longest = max(len(p) for p in prompts)
+        pad = tokenizer.pad_token_id
+        input_ids = torch.full((len(prompts), longest), pad, dtype=torch.long)
+        attention_mask = torch.zeros((len(prompts), longest), dtype=torch.long)
+        for row, ids in enumerate(prompts):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+
+        row_limits = [adaptive_max_new_tokens(len(p), self.min_new_tokens, self.max_new_tokens) for p in prompts]
+        max_new_tokens = max(row_limits)
+        stopper = SectionStopper(tokenizer, self.required_sections, enabled=self.early_stopping,
+                                 max_new_tokens=row_limits)
+
+        start = time.perf_counter()
+        out = model.generate(
+            input_ids=input_ids.to(model.device),
+            attention_mask=attention_mask.to(model.device),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            stopping_criteria=StoppingCriteriaList([stopper]),
+        )
+        seconds = time.perf_counter() - start
+
+        # drop the decoder start token; padding after EOS does not count
+        generated = int(((out[:, 1:] != pad)).sum())
+        texts = tokenizer.batch_decode(out, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+        stats = {
+            "batch_size": len(prompts),
+            "input_tokens": sum(len(p) for p in prompts),
+            "padding_tokens": len(prompts) * longest - sum(len(p) for p in prompts),
+            "max_new_tokens": max_new_tokens,
+            "generated_tokens": generated,
+            "early_stopped": stopper.section_stops,
+            "seconds": seconds,
+            "ttft_ms": (stopper.first_token_time - start) * 1000.0 if stopper.first_token_time else None,
+        }
+        return texts, stats
+
+    def summarize_batch(self, transcripts: List[str], documents: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Summaries in input order. `documents` are the matching
+        ClinicalDocuments, whose cached tokenizations are reused.
+        """
+        if not transcripts:
+            return []
+        summarizer = get_summarizer(self.model_name)
+        tokenizer = summarizer.tokenizer
+        documents = documents or [None] * len(transcripts)
+        prompts = [self.encode_prompt(tokenizer, t, d) for t, d in zip(transcripts, documents)]
+
+        texts: List[Optional[str]] = [None] * len(prompts)
+        batches = []
+        for bucket in self.buckets([len(p) for p in prompts]):
+            out, stats = self._generate(summarizer, [prompts[i] for i in bucket])
+            for i, text in zip(bucket, out):
+                texts[i] = text
+            batches.append(stats)
+
+        seconds = sum(b["seconds"] for b in batches)
+        generated = sum(b["generated_tokens"] for b in batches)
+        self.last_stats = {
+            "transcripts": len(prompts),
+            "batches": len(batches),
+            "input_tokens": sum(b["input_tokens"] for b in batches),
+            "padding_tokens": sum(b["padding_tokens"] for b in batches),
+            "generated_tokens": generated,
+            "early_stopped": sum(b["early_stopped"] for b in batches),
+            "seconds": round(seconds, 3),
+            "tokens_per_s": round(generated / seconds, 1) if seconds > 0 else None,
+            "ttft_ms": round(batches[0]["ttft_ms"], 1) if batches[0]["ttft_ms"] is not None else None,
+            "per_batch": batches,
+        }
+        return [{"Model_Summary_Text": t} for t in texts]
+
+    def summarize(self, transcript: str, document=None) -> Dict[str, Any]:
+        return self.summarize_batch([transcript], [document])[0]
+
+
+_ENGINES: Dict[str, SummarizerEngine] = {}
+
+
+def get_summarizer_engine(model_name: str = SUMMARIZER_MODEL) -> SummarizerEngine:
+    # holds only the cached prompt ids; the model itself stays in the registry
+    if model_name not in _ENGINES:
+        _ENGINES[model_name] = SummarizerEngine(model_name)
+    return _ENGINES[model_name]
+
+
+def medical_summary_structured(transcript: str, document=None) -> Dict[str, Any]:
+    return get_summarizer_engine().summarize(transcript, document=document)
+
+
+def template_summary(structured: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Deterministic summary assembled from the structured summary fields,
+    the degraded fallback when flan-t5 does not fit the latency budget.
+    """
+    lines = []
+    accident = structured.get("Accident_Details") or {}
+    if accident.get("Mechanism"):
+        when = " ".join(x for x in [accident.get("Accident_Date"), accident.get("Accident_Time")] if x)
+        lines.append(f"Accident: {accident['Mechanism']}" + (f" ({when})." if when else "."))
+    if structured.get("Symptoms"):
+        lines.append(f"Symptoms: {', '.join(structured['Symptoms'])}.")
+    if structured.get("Diagnosis"):
+        lines.append(f"Diagnosis: {structured['Diagnosis']}.")
+    if structured.get("Treatment"):
+        lines.append(f"Treatment: {', '.join(structured['Treatment'])}.")
+    if structured.get("Current_Status"):
+        lines.append(f"Current status: {structured['Current_Status']}.")
+    if structured.get("Prognosis"):
+        lines.append(f"Prognosis: {structured['Prognosis']}.")
 
-    return {"Model_Summary_Text": out}
+    return {"Model_Summary_Text": "\n".join(lines)}